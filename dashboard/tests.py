@@ -1,3 +1,184 @@
-from django.test import TestCase
+import hashlib
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from home.models import Album, Artist, CatalogImport, CustomUser, FriendEdge, Playlist, PlaylistTrack, Track
+from home.feed import get_home_feed
+from home.search_index import search_index
+from home.tests import create_unmanaged_tables, create_user
+
+CATALOG = b'title,file_url,artist\nOne Dance,/media/1.mp3,Drake\nHotline Bling,/media/2.mp3,Drake\n'
+CATALOG_KEY = f'sha256:{hashlib.sha256(CATALOG).hexdigest()}'
+
+
+def setUpModule():
+    create_unmanaged_tables()
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.import_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.import_dir.cleanup)
+        settings_override = override_settings(CATALOG_IMPORT_DIR=self.import_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', userid='admin12abc')
+        self.client.force_login(admin)
+
+    def upload(self, filename, content=CATALOG):
+        with mock.patch('dashboard.views.start_import', return_value=True) as start_import:
+            response = self.client.post('/dashboard/tracks/import/', {'catalog_file': SimpleUploadedFile(filename, content)})
+        self.assertEqual(response.status_code, 302)
+        return start_import, [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_import_is_named_after_the_content(self):
+        start_import, messages = self.upload('catalog.csv')
+        path, file_format, name = start_import.call_args.args
+        self.assertEqual(name, f'catalog.csv {CATALOG_KEY}')
+        self.assertEqual(file_format, 'csv')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), CATALOG)
+        self.assertIn('Importing catalog.csv', messages[0])
+
+    def test_renamed_copy_resumes_the_unfinished_import(self):
+        CatalogImport.objects.create(name=f'catalog.csv {CATALOG_KEY}', records_done=1)
+        start_import, _ = self.upload('copy of catalog.csv')
+        self.assertEqual(start_import.call_args.args[2], f'catalog.csv {CATALOG_KEY}')
+
+    def test_changed_file_of_the_same_size_starts_over(self):
+        CatalogImport.objects.create(name=f'catalog.csv {CATALOG_KEY}', records_done=1)
+        start_import, _ = self.upload('catalog.csv', CATALOG.replace(b'Drake', b'Drak3'))
+        self.assertNotEqual(start_import.call_args.args[2], f'catalog.csv {CATALOG_KEY}')
+
+    def test_finished_import_is_reported_instead_of_started(self):
+        CatalogImport.objects.create(name=f'catalog.csv {CATALOG_KEY}', records_done=2, finished_at=timezone.now())
+        start_import, messages = self.upload('renamed.csv')
+        start_import.assert_not_called()
+        self.assertIn('renamed.csv was already imported', messages[0])
+        self.assertEqual(os.listdir(self.import_dir.name), []) # The spooled copy is removed
+
+    def test_unknown_format_is_refused(self):
+        start_import, messages = self.upload('catalog.xml')
+        start_import.assert_not_called()
+        self.assertEqual(messages, ['Catalog files must be .csv, .json or .ndjson.'])
+
+
+class DeleteUserTests(TestCase):
+    def setUp(self):
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', userid='admin12abc')
+        self.client.force_login(admin)
+
+    def test_user_with_friends_is_deleted_with_its_edges(self):
+        alice, bob, carol = create_user('alice'), create_user('bob'), create_user('carol')
+        FriendEdge.objects.bulk_create([
+            FriendEdge(user=alice, friend=bob), FriendEdge(user=bob, friend=alice),
+            FriendEdge(user=bob, friend=carol), FriendEdge(user=carol, friend=bob),
+        ])
+        response = self.client.post(f'/dashboard/users/{alice.pk}/delete/')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(CustomUser.objects.filter(pk=alice.pk).exists())
+        self.assertEqual(
+            set(FriendEdge.objects.values_list('user_id', 'friend_id')), {(bob.pk, carol.pk), (carol.pk, bob.pk)}
+        )
+
+
+@mock.patch('dashboard.views.track_artists_table_exists', return_value=False)
+class MissingTrackArtistsTests(TestCase):
+    """Until backfill_track_artists has run, the dashboard renders and refuses writes instead of failing."""
+
+    def setUp(self):
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', userid='admin12abc')
+        self.client.force_login(admin)
+        self.drake = Artist.objects.create(name='Drake')
+        self.track = Track.objects.create(title='One Dance', file_url='/media/1.mp3', artist_name='Drake')
+
+    def test_dashboard_renders(self, table_exists):
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['used_artist_ids'], set())
+
+    def test_track_and_artist_writes_are_refused(self, table_exists):
+        self.client.post('/dashboard/tracks/add/', {'title': 'Hotline Bling', 'file_url': '/media/2.mp3', 'primary_artist': self.drake.pk})
+        self.client.post(f'/dashboard/tracks/edit/{self.track.pk}/', {'title': 'Renamed', 'primary_artist': self.drake.pk})
+        self.client.post(f'/dashboard/tracks/delete/{self.track.pk}/')
+        response = self.client.post(f'/dashboard/artists/delete/{self.drake.pk}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Track.objects.values_list('title', flat=True)), ['One Dance'])
+        self.assertTrue(Artist.objects.filter(pk=self.drake.pk).exists())
+        self.assertIn('backfill_track_artists', str(list(get_messages(response.wsgi_request))[0]))
+
+
+class CloneAlbumTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', userid='admin12abc')
+        drake = Artist.objects.create(name='Drake')
+        self.views = Album.objects.create(title='Views', primary_artist=drake, cover_image_url='/media/views.jpg')
+        self.tracks = [
+            Track.objects.create(title=title, file_url=f'/media/{title}.mp3', album=self.views, artist_name='Drake')
+            for title in ('Keep the Family Close', 'One Dance', 'Hotline Bling')
+        ]
+        Track.objects.create(title='Other', file_url='/media/other.mp3', artist_name='Drake') # Not on the album
+
+    def test_album_is_copied_in_order_with_one_statement(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(f'/dashboard/clone-album/{self.views.pk}/')
+        self.assertEqual(response.status_code, 302)
+        playlist = Playlist.objects.get()
+        self.assertEqual((playlist.name, playlist.cover_image_url, playlist.owner_user_id), ('Views (Clone)', '/media/views.jpg', self.admin.pk))
+        self.assertEqual(
+            list(PlaylistTrack.objects.filter(playlist=playlist).order_by('position').values_list('track_id', flat=True)),
+            [track.pk for track in self.tracks]
+        )
+
+    def test_only_superusers_may_clone(self):
+        self.client.force_login(create_user('alice'))
+        response = self.client.post(f'/dashboard/clone-album/{self.views.pk}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+        self.client.logout()
+        self.client.post(f'/dashboard/clone-album/{self.views.pk}/')
+        self.assertFalse(Playlist.objects.exists())
+
+
+class HomeFeedInvalidationTests(TestCase):
+    """The shared home feed is served from the cache until a dashboard write drops it."""
+
+    def setUp(self):
+        cache.clear()
+        search_index._snapshot = None
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', userid='admin12abc')
+        self.client.force_login(admin)
+        self.drake = Artist.objects.create(name='Drake')
+        self.one_dance = Track.objects.create(title='One Dance', file_url='/media/1.mp3', artist_name='Drake')
+
+    def recent_titles(self):
+        return [track.title for track in get_home_feed()['recent_items']]
+
+    def test_feed_is_cached_between_writes(self):
+        self.assertEqual(self.recent_titles(), ['One Dance'])
+        Track.objects.create(title='Outside the dashboard', file_url='/media/2.mp3')
+        self.assertEqual(self.recent_titles(), ['One Dance'])
+
+    def test_track_writes_refresh_the_feed(self):
+        self.recent_titles()
+        self.client.post('/dashboard/tracks/add/', {'title': 'Hotline Bling', 'file_url': '/media/2.mp3', 'primary_artist': self.drake.pk})
+        self.assertEqual(self.recent_titles(), ['Hotline Bling', 'One Dance'])
+        hotline = Track.objects.get(title='Hotline Bling')
+        self.client.post(f'/dashboard/tracks/edit/{hotline.pk}/', {'title': 'Hotline Bling (Remix)', 'file_url': '/media/2.mp3', 'primary_artist': self.drake.pk})
+        self.assertEqual(self.recent_titles(), ['Hotline Bling (Remix)', 'One Dance'])
+        self.client.post(f'/dashboard/tracks/delete/{hotline.pk}/')
+        self.assertEqual(self.recent_titles(), ['One Dance'])
+
+    def test_album_writes_refresh_the_shelf(self):
+        self.assertEqual(get_home_feed()['albums'], [])
+        self.client.post('/dashboard/albums/add/', {'title': 'Views', 'primary_artist': self.drake.pk})
+        self.assertEqual([album.title for album in get_home_feed()['albums']], ['Views'])
+        self.client.post(f"/dashboard/albums/delete/{Album.objects.get().pk}/")
+        self.assertEqual(get_home_feed()['albums'], [])
@@ -7,6 +7,7 @@ urlpatterns = [
     path('tracks/add/', views.add_track, name='add_track'),
     path('tracks/edit/<int:track_id>/', views.edit_track, name='edit_track'),
     path('tracks/delete/<int:track_id>/', views.delete_track, name='delete_track'),
+    path('tracks/import/', views.import_catalog, name='import_catalog'), # Bulk CSV/JSON/NDJSON upload
 
     # --- Artist CRUD ---
     path('artists/add/', views.add_artist, name='add_artist'),
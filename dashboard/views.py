@@ -1,16 +1,31 @@
+import hashlib
 import json
+import os
+import tempfile
+from functools import wraps
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib import messages
-from home.models import Track, Album, Artist, CustomUser  # Import CustomUser instead of User
+from home.models import Track, Album, Artist, CatalogImport, CustomUser, TrackArtist  # Import CustomUser instead of User
 from .forms import TrackForm, ArtistForm, AlbumForm
 from django.db.models import Q
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from urllib.parse import urlencode
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.contrib.auth.models import User  # Add this import
 from django.db import connection
+from django.conf import settings
+from home.catalog import catalog_changed
+from home.catalog_ingest import (
+    catalog_imports_table_exists, checkpoint_name, create_catalog_imports_table, detect_format, file_checkpoint_key,
+    start_import,
+)
+from home.friend_edges import friend_edges_table_exists
+from home.middleware import invalidate_user_context
+from home.playlists import create_playlist_from_album
+from home.social_graph import forget_user
+from home.track_artists import credited_artist_ids, set_track_artists, track_artists_table_exists
 
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
@@ -56,29 +71,35 @@ def music_dashboard(request):
     context['artist_form'] = ArtistForm()
     context['album_form'] = AlbumForm()
 
-    # Find all artist names used in tracks
-    used_artist_names = set(
-        Track.objects.values_list('artist_name', flat=True)
-    )
-    used_artist_names.update(
-        Track.objects.exclude(artist_name2__isnull=True).exclude(artist_name2='').values_list('artist_name2', flat=True)
-    )
-    used_artist_names.update(
-        Track.objects.exclude(artist_name3__isnull=True).exclude(artist_name3='').values_list('artist_name3', flat=True)
-    )
-    # Get artist IDs for those names
+    # Artists credited on at least one track (index-only scan of track_artists, once it is backfilled)
     used_artist_ids = set(
-        Artist.objects.filter(name__in=used_artist_names).values_list('pk', flat=True)
-    )
+        TrackArtist.objects.values_list('artist_id', flat=True).distinct()
+    ) if track_artists_table_exists() else set()
     context['used_artist_ids'] = used_artist_ids
 
+    # Bulk imports, latest first (the table exists once a first import has run)
+    context['catalog_imports'] = CatalogImport.objects.order_by('-updated_at')[:5] if catalog_imports_table_exists() else []
+
     return render(request, 'dashboard.html', context)
 
 # --- CRUD Views (Initial - Non-AJAX for now) ---
 def redirect_with_section(section):
     return redirect(f'/dashboard/?section={section}')
 
+def requires_track_artists(section):
+    """Refuse writes that credit, or cascade to, track_artists until the table has been created."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not track_artists_table_exists():
+                messages.error(request, 'The track_artists table is missing: run manage.py backfill_track_artists first.')
+                return redirect_with_section(section)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
 # == TRACKS ==
+@requires_track_artists('tracks-section')
 def add_track(request):
     if request.method == 'POST':
         title = request.POST.get('title', '').strip()
@@ -112,12 +133,17 @@ def add_track(request):
         # Secondary artist names (optional)
         artist_name2 = None
         artist_name3 = None
+        track_artists = [primary_artist] # Credits for track_artists, in position order
         if secondary_artist_ids:
             try:
                 if len(secondary_artist_ids) > 0:
-                    artist_name2 = Artist.objects.get(pk=secondary_artist_ids[0]).name
+                    artist2 = Artist.objects.get(pk=secondary_artist_ids[0])
+                    artist_name2 = artist2.name
+                    track_artists.append(artist2)
                 if len(secondary_artist_ids) > 1:
-                    artist_name3 = Artist.objects.get(pk=secondary_artist_ids[1]).name
+                    artist3 = Artist.objects.get(pk=secondary_artist_ids[1])
+                    artist_name3 = artist3.name
+                    track_artists.append(artist3)
             except Artist.DoesNotExist:
                 pass
 
@@ -131,11 +157,15 @@ def add_track(request):
             artist_name2=artist_name2,
             artist_name3=artist_name3
         )
-        track.save()
+        with transaction.atomic():
+            track.save()
+            set_track_artists(track, track_artists)
+        catalog_changed(tracks=[track], artist_ids=[artist.pk for artist in track_artists])
         messages.success(request, 'Track added successfully!')
         return redirect_with_section('tracks-section')
     return redirect_with_section('tracks-section')
 
+@requires_track_artists('tracks-section')
 def edit_track(request, track_id):
     track = get_object_or_404(Track, pk=track_id)
     if request.method == 'POST':
@@ -166,12 +196,17 @@ def edit_track(request, track_id):
 
         artist_name2 = None
         artist_name3 = None
+        track_artists = [primary_artist] # Credits for track_artists, in position order
         if secondary_artist_ids:
             try:
                 if len(secondary_artist_ids) > 0:
-                    artist_name2 = Artist.objects.get(pk=secondary_artist_ids[0]).name
+                    artist2 = Artist.objects.get(pk=secondary_artist_ids[0])
+                    artist_name2 = artist2.name
+                    track_artists.append(artist2)
                 if len(secondary_artist_ids) > 1:
-                    artist_name3 = Artist.objects.get(pk=secondary_artist_ids[1]).name
+                    artist3 = Artist.objects.get(pk=secondary_artist_ids[1])
+                    artist_name3 = artist3.name
+                    track_artists.append(artist3)
             except Artist.DoesNotExist:
                 pass
 
@@ -183,15 +218,23 @@ def edit_track(request, track_id):
         track.artist_name = artist_name
         track.artist_name2 = artist_name2
         track.artist_name3 = artist_name3
-        track.save()
+        # Artists losing the credit need their page refreshed too
+        previous_artist_ids = credited_artist_ids(track)
+        with transaction.atomic():
+            track.save()
+            set_track_artists(track, track_artists)
+        catalog_changed(tracks=[track], artist_ids=previous_artist_ids + [artist.pk for artist in track_artists])
         messages.success(request, 'Track updated successfully!')
         return redirect_with_section('tracks-section')
     return redirect_with_section('tracks-section')
 
 @require_POST # Ensure only POST requests
+@requires_track_artists('tracks-section')
 def delete_track(request, track_id):
     track = get_object_or_404(Track, pk=track_id)
+    artist_ids = credited_artist_ids(track)
     track.delete()
+    catalog_changed(deleted_tracks=[track_id], artist_ids=artist_ids)
     messages.success(request, 'Track deleted successfully!')
     return redirect('dashboard')
 
@@ -200,7 +243,8 @@ def add_artist(request):
     if request.method == 'POST':
         form = ArtistForm(request.POST)
         if form.is_valid():
-            form.save()
+            artist = form.save()
+            catalog_changed(artists=[artist])
             messages.success(request, 'Artist added successfully!')
             return redirect_with_section('artists-section')
         else:
@@ -215,6 +259,7 @@ def edit_artist(request, artist_id):
         if form.is_valid():
             try:
                 form.save()
+                catalog_changed(artists=[artist])
                 messages.success(request, 'Artist updated successfully!')
             except IntegrityError:
                 messages.error(request, 'Cannot update artist name: it is referenced by one or more tracks. Please update or remove those tracks first.')
@@ -225,9 +270,11 @@ def edit_artist(request, artist_id):
     return redirect_with_section('artists-section')
 
 @require_POST
+@requires_track_artists('artists-section')
 def delete_artist(request, artist_id):
     artist = get_object_or_404(Artist, pk=artist_id)
     artist.delete()
+    catalog_changed(deleted_artists=[artist_id])
     messages.success(request, 'Artist deleted successfully!')
     return redirect('dashboard')
 
@@ -236,7 +283,8 @@ def add_album(request):
     if request.method == 'POST':
         form = AlbumForm(request.POST)
         if form.is_valid():
-            form.save()
+            album = form.save()
+            catalog_changed(albums=[album], artist_ids=[album.primary_artist_id])
             messages.success(request, 'Album added successfully!')
             return redirect_with_section('albums-section')
         else:
@@ -246,10 +294,12 @@ def add_album(request):
 
 def edit_album(request, album_id):
     album = get_object_or_404(Album, pk=album_id)
+    previous_artist_id = album.primary_artist_id # The form updates the instance in place
     if request.method == 'POST':
         form = AlbumForm(request.POST, instance=album)
         if form.is_valid():
             form.save()
+            catalog_changed(albums=[album], artist_ids=[previous_artist_id, album.primary_artist_id])
             messages.success(request, 'Album updated successfully!')
             return redirect_with_section('albums-section')
         else:
@@ -261,34 +311,60 @@ def edit_album(request, album_id):
 def delete_album(request, album_id):
     album = get_object_or_404(Album, pk=album_id)
     album.delete()
+    catalog_changed(deleted_albums=[album_id], artist_ids=[album.primary_artist_id])
     messages.success(request, 'Album deleted successfully!')
     return redirect('dashboard')
 
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
 @require_POST
 def clone_album_to_playlist(request, album_id):
     album = get_object_or_404(Album, pk=album_id)
-    
-    # Create new playlist
-    playlist = Playlists.objects.create(
-        owner_user_id=request.user.id,
-        name=f"{album.title} (Clone)",
-        cover_image_url=album.cover_image_url,
-        albums=album
-    )
-    
-    # Get all tracks from the album
-    album_tracks = Track.objects.filter(album_id=album_id)
-    
-    # Create playlist tracks
-    for track in album_tracks:
-        Playlisttracks.objects.create(
-            playlistid=playlist,
-            tracks=track
-        )
-    
-    messages.success(request, f'Album "{album.title}" has been cloned to playlist successfully!')
+
+    # New playlist plus every track link in one transaction (a single INSERT ... SELECT)
+    playlist, track_count = create_playlist_from_album(album, request.user.id)
+    invalidate_user_context(request.user.id) # New entry in the sidebar playlists
+
+    messages.success(request, f'Album "{album.title}" has been cloned to playlist "{playlist.name}" ({track_count} tracks)!')
     return redirect('dashboard')
 
+# == BULK IMPORT ==
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+@require_POST
+def import_catalog(request):
+    upload = request.FILES.get('catalog_file')
+    if not upload:
+        messages.error(request, 'Choose a catalog file to import.')
+        return redirect_with_section('tracks-section')
+    file_format = detect_format(upload.name)
+    if file_format is None:
+        messages.error(request, 'Catalog files must be .csv, .json or .ndjson.')
+        return redirect_with_section('tracks-section')
+
+    # Hashed while spooling: the same content as an unfinished import resumes after its last committed batch
+    os.makedirs(settings.CATALOG_IMPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(upload.name)[1], dir=settings.CATALOG_IMPORT_DIR)
+    digest = hashlib.sha256()
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in upload.chunks():
+            digest.update(chunk)
+            f.write(chunk)
+    if not catalog_imports_table_exists():
+        create_catalog_imports_table()
+    name = checkpoint_name(file_checkpoint_key(digest), upload.name)
+    finished = CatalogImport.objects.filter(name=name, finished_at__isnull=False).first()
+    if finished:
+        os.remove(path)
+        messages.info(request, f'{upload.name} was already imported on {finished.finished_at:%Y-%m-%d %H:%M}.')
+        return redirect_with_section('tracks-section')
+    if not start_import(path, file_format, name):
+        os.remove(path)
+        messages.error(request, f'{upload.name} is already being imported.')
+        return redirect_with_section('tracks-section')
+    messages.success(request, f'Importing {upload.name} in the background; reload the dashboard to follow its progress.')
+    return redirect_with_section('tracks-section')
+
 @user_passes_test(lambda u: u.is_superuser)
 def toggle_user_status(request, user_id):
     user = get_object_or_404(CustomUser, pk=user_id)  # Use CustomUser here too
@@ -318,6 +394,14 @@ def delete_user(request, user_id):
     # Avoid ORM to prevent selecting all fields (including last_login)
     from django.db import connection
     with connection.cursor() as cursor:
-        cursor.execute("DELETE FROM auth_user WHERE id = %s", [user_id])
+        cursor.execute("SELECT userid FROM auth_user WHERE id = %s", [user_id])
+        row = cursor.fetchone()
+        if row:
+            forget_user(user_id, row[0])
+        with transaction.atomic():
+            if friend_edges_table_exists():
+                # Tables created before ON DELETE CASCADE was added still refuse the delete
+                cursor.execute("DELETE FROM friend_edges WHERE user_id = %s OR friend_id = %s", [user_id, user_id])
+            cursor.execute("DELETE FROM auth_user WHERE id = %s", [user_id])
     messages.success(request, f'User has been deleted successfully.')
     return redirect('dashboard')
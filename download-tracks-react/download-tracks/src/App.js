@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useLayoutEffect, useRef } from 'react';
 import './modern.css';
 
 // Download button component
@@ -110,77 +110,143 @@ function TrackCard({ track, index }) {
   );
 }
 
+// How often tracks read from the stream are shown, instead of a re-render per network chunk
+const TRACK_FLUSH_INTERVAL = 250;
+// Rows rendered above and below the visible ones
+const OVERSCAN_ROWS = 3;
+
+// Only the rows of the grid near the viewport are in the DOM; padding stands in for the rest.
+// Columns and row height are measured from the grid, so the CSS keeps deciding the layout.
+function TrackGrid({ tracks }) {
+  const gridRef = useRef(null);
+  const [layout, setLayout] = useState({ columns: 1, rowHeight: 0 });
+  const [range, setRange] = useState({ start: 0, end: 8 });
+  const hasTracks = tracks.length > 0;
+
+  useLayoutEffect(() => {
+    const measure = () => {
+      const grid = gridRef.current;
+      const card = grid && grid.firstElementChild;
+      if (!card) return;
+      const style = getComputedStyle(grid);
+      const columns = style.gridTemplateColumns.split(' ').filter(Boolean).length || 1;
+      const rowHeight = card.offsetHeight + (parseFloat(style.rowGap) || 0);
+      setLayout(prev => (prev.columns === columns && prev.rowHeight === rowHeight ? prev : { columns, rowHeight }));
+    };
+    measure();
+    window.addEventListener('resize', measure);
+    return () => window.removeEventListener('resize', measure);
+  }, [hasTracks]);
+
+  useEffect(() => {
+    if (!layout.rowHeight) return;
+    const update = () => {
+      const top = gridRef.current.getBoundingClientRect().top;
+      const start = Math.max(0, Math.floor(-top / layout.rowHeight) - OVERSCAN_ROWS);
+      const end = start + Math.ceil(window.innerHeight / layout.rowHeight) + 2 * OVERSCAN_ROWS;
+      setRange(prev => (prev.start === start && prev.end === end ? prev : { start, end }));
+    };
+    update();
+    window.addEventListener('scroll', update, { passive: true });
+    window.addEventListener('resize', update);
+    return () => {
+      window.removeEventListener('scroll', update);
+      window.removeEventListener('resize', update);
+    };
+  }, [layout]);
+
+  const rows = Math.ceil(tracks.length / layout.columns);
+  const start = Math.min(range.start, rows);
+  const end = Math.min(range.end, rows);
+  const visible = tracks.slice(start * layout.columns, end * layout.columns);
+
+  return (
+    <div
+      className="tracks-grid"
+      ref={gridRef}
+      style={{
+        paddingTop: `calc(0.5rem + ${start * layout.rowHeight}px)`,
+        paddingBottom: `calc(0.5rem + ${(rows - end) * layout.rowHeight}px)`,
+      }}
+    >
+      {visible.map((track, i) => (
+        <TrackCard key={track.id} track={track} index={start * layout.columns + i} />
+      ))}
+    </div>
+  );
+}
+
 function App() {
   const [tracks, setTracks] = useState([]);
   const [search, setSearch] = useState('');
   const [isLoading, setIsLoading] = useState(true);
   const [darkMode, setDarkMode] = useState(true);
 
+  // Tracks read so far; the stream appends here and a timer copies it into state
+  const loadedRef = useRef([]);
+
   useEffect(() => {
-    // Simulate loading
+    const controller = new AbortController();
+    let shown = 0;
+    const flush = () => {
+      if (loadedRef.current.length === shown) return;
+      shown = loadedRef.current.length;
+      setTracks(loadedRef.current.slice());
+      setIsLoading(false);
+    };
+
+    // Read /api/tracks/ as newline-delimited JSON and show tracks as each chunk arrives,
+    // instead of waiting for the whole catalog in one response
+    const streamTracks = async () => {
+      const response = await fetch('/api/tracks/?format=ndjson', { signal: controller.signal });
+      if (!response.ok || !response.body) {
+        throw new Error(`Failed to load tracks (${response.status})`);
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffered.split('\n');
+        // The last piece may be a partial line, keep it for the next chunk
+        buffered = done ? '' : lines.pop();
+
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const item = JSON.parse(line);
+          if (item.success === false) {
+            throw new Error(item.error || 'Failed to load tracks');
+          }
+          loadedRef.current.push({ ...item, track_img_url: item.image_url });
+        }
+        if (done) break;
+      }
+    };
+
     setIsLoading(true);
-    setTimeout(() => {
-      // Manually added tracks with additional properties
-      const dbTracks = [
-        {
-          id: 1,
-          title: 'Stan',
-          artist_name: 'Eminem',
-          file_dl_url: 'https://www.woo55.com/adata/6713/03.%20Stan%20(www.SongsLover.com).mp3',
-          track_img_url: 'https://t2.genius.com/unsafe/340x340/https%3A%2F%2Fimages.genius.com%2F45656143acb76cff7f5a1269328a7268.600x600x1.png',
-          genre: 'Hip-Hop',
-          year: 2000
-        },
-        {
-          id: 2,
-          title: 'Creepin\'',
-          artist_name: 'DTMF Luther',
-          file_dl_url: 'https://share33.com/2022/Metro%20Boomin%20-%20HEROES%20&%20VILLAINS%20-%20(SongsLover.com)/10%20Creepin%20-%20(SongsLover.com).mp3',
-          track_img_url: 'https://images.genius.com/f3d1d78ded7a82fe8bc7ec6441eb9018.1000x996x1.jpg',
-          genre: 'R&B',
-          year: 2022
-        },
-        {
-          id: 3,
-          title: 'DTMF',
-          artist_name: 'DTMF Luther',
-          file_dl_url: 'https://manyuploading.com/music/Bad%20Bunny%20-%20DeBi%20TiRAR%20MaS%20FOToS%20Album%20-%202025%20-%20(SongsLover.com)/16.%20DtMF%20-%20(SongsLover.com).mp3',
-          track_img_url: 'https://charts-static.billboard.com/img/2025/01/bad-bunny-6eh-debitirarmasfotos-6xg-344x344.jpg',
-          genre: 'Reggaeton',
-          year: 2025
-        },
-        {
-          id: 4,
-          title: 'Blinding Lights',
-          artist_name: 'The Weeknd',
-          file_dl_url: 'https://z3.fm/download/25829629',
-          track_img_url: 'https://upload.wikimedia.org/wikipedia/en/e/e6/The_Weeknd_-_Blinding_Lights.png',
-          genre: 'Pop',
-          year: 2020
-        },
-        {
-          id: 5,
-          title: 'Lovely',
-          artist_name: 'Billie Eilish, Khalid',
-          file_dl_url: 'https://z3.fm/download/27381848',
-          track_img_url: 'https://external-content.duckduckgo.com/iu/?u=https%3A%2F%2Fvignette.wikia.nocookie.net%2Fwherearetheavocados%2Fimages%2Fe%2Fe5%2FLovely_-_Single.jpg%2Frevision%2Flatest%3Fcb%3D20180419182526&f=1&nofb=1&ipt=6c4b55fa487cd8b0437f8ab6bcf389947ca6726579c984437c5dc4eb3d20fd8a',
-          genre: 'Pop',
-          year: 1972
-        },
-        {
-          id: 6,
-          title: 'Beautiful Things',
-          artist_name: 'Benson Boone',
-          file_dl_url: 'https://z3.fm/download/40672721',
-          track_img_url: 'https://external-content.duckduckgo.com/iu/?u=https%3A%2F%2Ftse2.mm.bing.net%2Fth%3Fid%3DOIP.bo9DlohGfYKQaMqdUx-ysgAAAA%26cb%3Diwc2%26pid%3DApi&f=1&ipt=2aed494bb91c7f795b3741b65801804a0955c32d0ebc11bcd5ee5de6342752a3',
-          genre: 'Rock',
-          year: 2004
+    setTracks([]);
+    loadedRef.current = [];
+    const flushTimer = setInterval(flush, TRACK_FLUSH_INTERVAL);
+    streamTracks()
+      .catch(error => {
+        if (error.name !== 'AbortError') {
+          console.error('Error loading tracks:', error);
         }
-      ];
-      
-      setTracks(dbTracks);
-      setIsLoading(false);
-    }, 1000);
+      })
+      .finally(() => {
+        clearInterval(flushTimer);
+        if (!controller.signal.aborted) {
+          setTracks(loadedRef.current.slice());
+          setIsLoading(false);
+        }
+      });
+
+    return () => {
+      controller.abort();
+      clearInterval(flushTimer);
+    };
   }, []);
 
   const filteredTracks = tracks.filter(t => 
@@ -221,11 +287,7 @@ function App() {
             <p>Loading tracks...</p>
           </div>
         ) : filteredTracks.length > 0 ? (
-          <div className="tracks-grid">
-            {filteredTracks.map((track, index) => (
-              <TrackCard key={track.id} track={track} index={index} />
-            ))}
-          </div>
+          <TrackGrid tracks={filteredTracks} />
         ) : (
           <div className="no-results">
             <i className="fas fa-search"></i>
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        from . import checks # noqa: F401 (registers the system checks)
+        from .db_connections import connect_signals
+        connect_signals()
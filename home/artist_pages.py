@@ -0,0 +1,78 @@
+from django.core.cache import cache
+
+from .db_router import read_connection
+
+# One materialized payload per artist page, dropped by catalog_changed() when the artist,
+# one of their credited tracks or one of their albums is written from the dashboard
+ARTIST_PAGE_CACHE_KEY = 'artist_page:{}'
+# Safety net in case the catalog is changed outside the dashboard (admin, raw SQL, ...)
+ARTIST_PAGE_TIMEOUT = 60 * 60
+
+
+def build_artist_page(artist_id):
+    """Bio, images, ordered tracks, track count and albums of an artist, or None if there is no such artist."""
+    with read_connection().cursor() as cursor:
+        cursor.execute("""
+            SELECT name, bio, artist_image_url, artist_image_url2
+            FROM artists
+            WHERE artist_id = %s
+        """, [artist_id])
+        artist_row = cursor.fetchone()
+        if not artist_row:
+            return None
+
+        # Tracks through the (artist_id, track_id) index of track_artists
+        cursor.execute("""
+            SELECT t.track_id, t.title, t.file_url, t.track_img_url, t.artist_name
+            FROM track_artists ta
+            JOIN tracks t ON t.track_id = ta.track_id
+            WHERE ta.artist_id = %s
+            ORDER BY ta.track_id
+        """, [artist_id])
+        tracks = [{
+            'id': track[0],
+            'title': track[1],
+            'file_url': track[2],
+            'image_url': track[3] or '/static/home/assets/default-track.jpg',
+            'artist_name': track[4]
+        } for track in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT album_id, title, cover_image_url
+            FROM albums
+            WHERE primary_artist_id = %s
+            ORDER BY album_id
+        """, [artist_id])
+        albums = [{
+            'album_id': album[0],
+            'title': album[1],
+            'cover_image_url': album[2] or '/static/home/assets/album.jpg'
+        } for album in cursor.fetchall()]
+
+    return {
+        'artist': {
+            'name': artist_row[0],
+            'bio': artist_row[1],
+            'artist_image_url': artist_row[2],
+            'artist_image_url2': artist_row[3]
+        },
+        'tracks': tracks,
+        'track_count': len(tracks),
+        'albums': albums,
+    }
+
+
+def get_artist_page(artist_id):
+    """Return the cached artist payload, building it on a cache miss."""
+    key = ARTIST_PAGE_CACHE_KEY.format(artist_id)
+    page = cache.get(key)
+    if page is None:
+        page = build_artist_page(artist_id)
+        if page is not None:
+            cache.set(key, page, ARTIST_PAGE_TIMEOUT)
+    return page
+
+
+def invalidate_artist_pages(artist_ids):
+    if artist_ids:
+        cache.delete_many([ARTIST_PAGE_CACHE_KEY.format(artist_id) for artist_id in artist_ids])
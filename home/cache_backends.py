@@ -0,0 +1,35 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+from .metrics import registry
+
+_MISSING = object()
+HIT = (('result', 'hit'),)
+MISS = (('result', 'miss'),)
+
+
+class CacheStatsMixin:
+    """Counts hits and misses of get()/get_many() in freeflow_cache_requests_total; mix into any cache backend."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            registry.inc('freeflow_cache_requests_total', MISS)
+            return default
+        registry.inc('freeflow_cache_requests_total', HIT)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        registry.inc('freeflow_cache_requests_total', HIT, len(values))
+        registry.inc('freeflow_cache_requests_total', MISS, len(keys) - len(values))
+        return values
+
+
+class StatsLocMemCache(CacheStatsMixin, LocMemCache):
+    pass
+
+
+class StatsRedisCache(CacheStatsMixin, RedisCache):
+    pass
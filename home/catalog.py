@@ -0,0 +1,43 @@
+from .artist_pages import invalidate_artist_pages
+from .feed import invalidate_home_feed
+from .recommendations import invalidate_recommendations
+from .search_index import search_index
+from .versions import bump_catalog_version, catalog_version
+
+
+def catalog_changed(tracks=(), albums=(), artists=(), deleted_tracks=(), deleted_albums=(), deleted_artists=(),
+                    artist_ids=()):
+    """
+    Call after any track, album or artist write so the caches built from the catalog
+    are rebuilt on their next use and clients holding an old catalog ETag refetch.
+
+    Pass the saved instances and the ids of deleted rows so the search index can be
+    updated in place instead of rebuilt. artist_ids are the other artists whose page
+    shows the change: credited on a written track, or primary artist of a written album
+    (before and after an edit).
+    """
+    previous_version = catalog_version()
+    version = bump_catalog_version()
+    invalidate_home_feed()
+    invalidate_recommendations()
+    # artist_ids may hold None (an album without a primary artist)
+    invalidate_artist_pages(
+        {artist_id for artist_id in artist_ids if artist_id} | {artist.pk for artist in artists} | set(deleted_artists)
+    )
+    search_index.apply_changes(
+        previous_version, version,
+        tracks=tracks, albums=albums, artists=artists,
+        deleted_tracks=deleted_tracks, deleted_albums=deleted_albums, deleted_artists=deleted_artists,
+    )
+
+
+def catalog_imported(artist_ids=()):
+    """
+    Call after a bulk import. Like catalog_changed(), but the search index is not updated
+    in place: it misses the new version and is rebuilt from the database on its next use,
+    as is the typeahead.
+    """
+    bump_catalog_version()
+    invalidate_home_feed()
+    invalidate_recommendations()
+    invalidate_artist_pages({artist_id for artist_id in artist_ids if artist_id})
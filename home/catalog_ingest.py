@@ -0,0 +1,292 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .catalog import catalog_imported
+from .models import Album, Artist, CatalogImport
+from .track_artists import track_artists_table_exists
+
+logger = logging.getLogger(__name__)
+
+# Bulk catalog import: one record per track, read from the file as a stream and written in
+# batches of INGEST_BATCH_SIZE, each in one transaction together with the import's checkpoint.
+# Artists and albums are matched by name against maps loaded once, missing ones are created.
+
+# Records per batch (and per transaction)
+INGEST_BATCH_SIZE = 5000
+# Characters read from a JSON file at a time
+JSON_CHUNK_SIZE = 1 << 16
+INGEST_FORMATS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+# Fields of a record; title, file_url and artist are required. album_artist defaults to artist.
+INGEST_FIELDS = ('title', 'file_url', 'artist', 'artist2', 'artist3', 'album', 'album_artist', 'album_cover_url', 'track_image_url')
+# Longest value each field's column holds (artist3 is cut to 50 in tracks.artist_name3 only)
+FIELD_LENGTHS = {'title': 255, 'file_url': 512, 'artist': 255, 'artist2': 255, 'artist3': 255, 'album': 255,
+                 'album_artist': 255, 'album_cover_url': 512, 'track_image_url': 512}
+ARTIST_NAME3_LENGTH = 50
+
+_JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def catalog_imports_table_exists():
+    return CatalogImport._meta.db_table in connection.introspection.table_names()
+
+
+def create_catalog_imports_table():
+    """Create catalog_imports (the model is unmanaged, so no migration does it)."""
+    with connection.schema_editor() as schema_editor:
+        schema_editor.create_model(CatalogImport)
+
+
+def file_checkpoint_key(digest):
+    """Checkpoint key of a catalog file from the sha256 of its content."""
+    return f'sha256:{digest.hexdigest()}'
+
+
+def file_digest(binary_file):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: binary_file.read(1 << 20), b''):
+        digest.update(chunk)
+    return digest
+
+
+def checkpoint_name(key, filename):
+    """
+    Name a file's import is checkpointed under. It ends with the content key, so the same content
+    resumes (or is found finished) whatever the file is called and a changed file starts over;
+    the file name in front is for display, and an earlier import of the content keeps its own.
+    """
+    existing = CatalogImport.objects.filter(name__endswith=key).values_list('name', flat=True).first()
+    return existing or f'{filename} {key}'
+
+
+def detect_format(filename):
+    return INGEST_FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def read_json_array(text):
+    """Objects of a top-level JSON array, decoded one at a time so the file is never held in memory."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while not buffer and (chunk := text.read(JSON_CHUNK_SIZE)): # Leading whitespace may fill whole chunks
+        buffer = chunk.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("A JSON catalog must be an array of objects")
+    position = 1
+    eof = False
+    while True:
+        position = _JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("The JSON catalog is truncated or invalid")
+            chunk = text.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield record
+
+
+def read_records(binary_file, file_format):
+    """Records of a catalog file opened in binary mode, as dicts, in file order."""
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        return csv.DictReader(text)
+    if file_format == 'ndjson':
+        return (json.loads(line) for line in text if line.strip())
+    if file_format == 'json':
+        return read_json_array(text)
+    raise ValueError(f"Unknown catalog format {file_format!r}, expected one of csv, json, ndjson")
+
+
+def clean_record(record):
+    """Record with stripped values (None when empty), or None when it can't be imported."""
+    if not isinstance(record, dict):
+        return None
+    cleaned = {}
+    for field in INGEST_FIELDS:
+        value = record.get(field)
+        value = str(value).strip() if value is not None else ''
+        if len(value) > FIELD_LENGTHS[field]:
+            return None
+        cleaned[field] = value or None
+    if not (cleaned['title'] and cleaned['file_url'] and cleaned['artist']):
+        return None
+    cleaned['album_artist'] = cleaned['album_artist'] or cleaned['artist']
+    return cleaned
+
+
+def first_new_id(cursor, table, column):
+    """First free primary key; FOR UPDATE holds off other inserts into the table until the batch commits."""
+    lock = ' FOR UPDATE' if connection.features.has_select_for_update else ''
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}{lock}")
+    return cursor.fetchone()[0] + 1
+
+
+class CatalogIngest:
+    """
+    One import run. The name identifies the import across runs: running it again with the same
+    name skips the records already committed. progress, if given, is called with the
+    CatalogImport row after every batch.
+    """
+
+    def __init__(self, name, batch_size=INGEST_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.job, _ = CatalogImport.objects.get_or_create(name=name)
+        # The lowest artist_id wins when a name is used twice, as in backfill_track_artists
+        self.artist_ids = {}
+        for artist_id, artist_name in Artist.objects.order_by('-artist_id').values_list('artist_id', 'name').iterator(chunk_size=10000):
+            self.artist_ids[artist_name] = artist_id
+        self.album_ids = {}
+        for album_id, title, artist_id in Album.objects.order_by('-album_id').values_list('album_id', 'title', 'primary_artist_id').iterator(chunk_size=10000):
+            self.album_ids[title, artist_id] = album_id
+        self.with_track_artists = track_artists_table_exists()
+        self.credited_artist_ids = set()
+
+    def run(self, records):
+        """Import records (an iterable of dicts) from where the last run stopped. Returns the CatalogImport row."""
+        if self.job.finished_at:
+            return self.job
+        self.job.error = None # Saved with the first batch
+        records = islice(records, self.job.records_done, None)
+        try:
+            while batch := list(islice(records, self.batch_size)):
+                self.write_batch(batch)
+                if self.progress:
+                    self.progress(self.job)
+        except Exception as e:
+            CatalogImport.objects.filter(pk=self.job.pk).update(error=str(e), updated_at=timezone.now())
+            raise
+        finally:
+            if self.credited_artist_ids:
+                catalog_imported(self.credited_artist_ids)
+        self.job.finished_at = timezone.now()
+        self.job.error = None
+        self.job.save(update_fields=['finished_at', 'error', 'updated_at'])
+        return self.job
+
+    def write_batch(self, batch):
+        rows = [record for record in map(clean_record, batch) if record]
+        new_artists = {}
+        new_albums = {}
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Artists first: albums and credits point at them
+            names = dict.fromkeys(
+                name for record in rows
+                for name in (record['artist'], record['artist2'], record['artist3'], record['album_artist'])
+                if name and name not in self.artist_ids
+            )
+            if names:
+                first_id = first_new_id(cursor, 'artists', 'artist_id')
+                new_artists = {name: first_id + i for i, name in enumerate(names)}
+                cursor.executemany("INSERT INTO artists (artist_id, name) VALUES (%s, %s)", [
+                    (artist_id, name) for name, artist_id in new_artists.items()
+                ])
+
+            def artist_id(name):
+                return self.artist_ids.get(name) or new_artists[name]
+
+            albums = {}
+            for record in rows:
+                key = (record['album'], artist_id(record['album_artist']))
+                if record['album'] and key not in self.album_ids:
+                    albums.setdefault(key, record['album_cover_url'])
+            if albums:
+                first_id = first_new_id(cursor, 'albums', 'album_id')
+                new_albums = {key: first_id + i for i, key in enumerate(albums)}
+                cursor.executemany(
+                    "INSERT INTO albums (album_id, title, cover_image_url, primary_artist_id) VALUES (%s, %s, %s, %s)",
+                    [(album_id, title, albums[title, primary_artist_id], primary_artist_id)
+                     for (title, primary_artist_id), album_id in new_albums.items()]
+                )
+
+            credits = []
+            track_rows = []
+            first_track_id = first_new_id(cursor, 'tracks', 'track_id') if rows else None
+            for i, record in enumerate(rows):
+                track_id = first_track_id + i
+                album_key = (record['album'], artist_id(record['album_artist']))
+                track_rows.append((
+                    track_id, record['title'], record['file_url'],
+                    (self.album_ids.get(album_key) or new_albums[album_key]) if record['album'] else None,
+                    record['track_image_url'], record['artist'], record['artist2'],
+                    record['artist3'][:ARTIST_NAME3_LENGTH] if record['artist3'] else None,
+                ))
+                credited = dict.fromkeys(artist_id(name) for name in (record['artist'], record['artist2'], record['artist3']) if name)
+                credits.extend((track_id, credited_id, position) for position, credited_id in enumerate(credited, 1))
+            if track_rows:
+                cursor.executemany(
+                    "INSERT INTO tracks (track_id, title, file_url, album_id, track_img_url, artist_name, artist_name2, artist_name3) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", track_rows
+                )
+            if credits and self.with_track_artists:
+                cursor.executemany("INSERT INTO track_artists (track_id, artist_id, position) VALUES (%s, %s, %s)", credits)
+
+            # Checkpoint in the same transaction: a batch is either fully imported and counted, or neither
+            self.job.records_done += len(batch)
+            self.job.tracks_created += len(track_rows)
+            self.job.albums_created += len(new_albums)
+            self.job.artists_created += len(new_artists)
+            self.job.skipped += len(batch) - len(rows)
+            self.job.save()
+
+        # Only after the commit, so a rolled back batch leaves no ids behind
+        self.artist_ids.update(new_artists)
+        self.album_ids.update(new_albums)
+        self.credited_artist_ids.update(artist_id for _, artist_id, _ in credits)
+        self.credited_artist_ids.update(primary_artist_id for _, primary_artist_id in new_albums)
+
+
+def import_file(path, file_format, name):
+    """
+    Import an uploaded catalog file, then delete it. Resumes a previous run of the same name, so a
+    failed import continues where it stopped when the same file is uploaded again.
+    """
+    try:
+        if not catalog_imports_table_exists():
+            create_catalog_imports_table()
+        with open(path, 'rb') as f:
+            CatalogIngest(name).run(read_records(f, file_format))
+    except Exception:
+        logger.exception("Import of %s failed", name)
+    finally:
+        os.remove(path)
+        connection.close() # Runs in its own thread, whose connection nothing else closes
+
+
+_running_imports = set()
+_running_lock = threading.Lock()
+
+
+def start_import(path, file_format, name):
+    """
+    Run import_file() in a background thread; its progress is in the CatalogImport row.
+    Returns False, starting nothing, when this process is already running an import of that name.
+    """
+    with _running_lock:
+        if name in _running_imports:
+            return False
+        _running_imports.add(name)
+
+    def run():
+        try:
+            import_file(path, file_format, name)
+        finally:
+            with _running_lock:
+                _running_imports.discard(name)
+
+    threading.Thread(target=run, name=f'catalog-import-{name}', daemon=True).start()
+    return True
@@ -0,0 +1,17 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Version stamps (home/versions.py) and cache invalidation only reach every worker through a shared cache."""
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+    return [Error(
+        "The default cache is per process: a write handled by one worker leaves the others serving "
+        "old ETags, search indexes and cached pages.",
+        hint="Set CACHE_REDIS_URL (or point CACHES['default'] at another shared backend). With a single "
+             "server process, add 'home.E001' to SILENCED_SYSTEM_CHECKS.",
+        id='home.E001',
+    )]
@@ -0,0 +1,62 @@
+import os
+import threading
+import weakref
+
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+class ConnectionStats:
+    """
+    Per-process counters of database connections opened versus requests served. With
+    persistent connections opened/requests tends to 0; without them it is 1 or more.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Connection wrappers (one per thread and alias) that opened a connection at least once
+        self._wrappers = weakref.WeakSet()
+        # Never reset, for the metrics endpoint
+        self.connections_opened_total = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_opened = 0
+            self.requests = 0
+
+    def connection_opened(self, sender, connection, **kwargs):
+        with self._lock:
+            self.connections_opened += 1
+            self.connections_opened_total += 1
+            self._wrappers.add(connection)
+
+    def request_started(self, sender, **kwargs):
+        with self._lock:
+            self.requests += 1
+
+    def snapshot(self):
+        settings_dict = connections['default'].settings_dict
+        with self._lock:
+            open_now = sum(1 for wrapper in self._wrappers if wrapper.connection is not None)
+            return {
+                'pid': os.getpid(),
+                'conn_max_age': settings_dict['CONN_MAX_AGE'],
+                'conn_health_checks': settings_dict['CONN_HEALTH_CHECKS'],
+                'open_connections': open_now,
+                'connections_opened': self.connections_opened,
+                'connections_opened_total': self.connections_opened_total,
+                'requests': self.requests,
+                'connections_per_request': (
+                    round(self.connections_opened / self.requests, 3) if self.requests else None
+                ),
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+def connect_signals():
+    connection_created.connect(connection_stats.connection_opened, dispatch_uid='connection_stats_opened')
+    request_started.connect(connection_stats.request_started, dispatch_uid='connection_stats_request')
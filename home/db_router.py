@@ -0,0 +1,73 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Read/write splitting. Only views decorated with replica_reads() read from the replica;
+# everything else (sessions, auth, writes, the home feed and the background search index
+# builds) stays on the primary.
+REPLICA_DB_ALIAS = 'replica'
+# Requests after a write from the same browser read the primary for REPLICA_LAG seconds
+PRIMARY_COOKIE = 'read_primary'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def read_alias():
+    """Alias reads should use right now: the replica inside replica_reads() unless pinned to the primary."""
+    if _replica_reads.get() and not _pinned_to_primary.get() and replica_configured():
+        return REPLICA_DB_ALIAS
+    return DEFAULT_DB_ALIAS
+
+
+def read_connection():
+    """Connection for raw SQL reads, routed like ORM reads."""
+    return connections[read_alias()]
+
+
+def replica_reads(version=None):
+    """
+    Let a read-only view read from the replica. version is an optional callable returning the
+    time_ns stamp of the data's last write (e.g. catalog_version): within REPLICA_LAG seconds of it
+    the replica may not have the write yet, so the view reads the primary instead.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            use_replica = version is None or time.time_ns() - version() > settings.REPLICA_LAG * 1_000_000_000
+            token = _replica_reads.set(use_replica)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return wrapper
+    return decorator
+
+
+def pin_to_primary(pinned):
+    return _pinned_to_primary.set(pinned)
+
+
+def unpin(token):
+    _pinned_to_primary.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True # Same data on both aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
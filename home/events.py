@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.db import connection
+
+# In-process push channel behind the /api/events/ stream. Views publish from worker threads,
+# every open stream holds a Subscription whose queue lives on the ASGI event loop.
+# Topics: 'user:<id>' for events addressed to a user, 'listening:<id>' for a user's presence.
+# Like the memory presence backend it only reaches streams served by the same process, so
+# friends.js keeps a slow reconciliation poll running while its stream is open.
+
+# Events a slow stream may have queued before new ones are dropped (the client resyncs on reconnect)
+EVENT_QUEUE_SIZE = 100
+
+
+def user_topic(user_id):
+    return f'user:{int(user_id)}'
+
+
+def listening_topic(user_id):
+    return f'listening:{int(user_id)}'
+
+
+class Subscription:
+    def __init__(self, bus, loop):
+        self._bus = bus
+        self._loop = loop
+        self.queue = asyncio.Queue(EVENT_QUEUE_SIZE)
+        self.topics = frozenset()
+
+    def set_topics(self, topics):
+        self._bus._resubscribe(self, frozenset(topics))
+
+    def close(self):
+        self._bus._resubscribe(self, frozenset())
+
+    def deliver(self, message):
+        # Called from any thread; the queue is only touched on its own loop
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass # Loop already closed, the stream is gone
+
+    def _put(self, message):
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Next (event, data) message, or None after timeout seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, topics):
+        """New Subscription on the running event loop (call it from the async view)."""
+        subscription = Subscription(self, asyncio.get_running_loop())
+        subscription.set_topics(topics)
+        return subscription
+
+    def _resubscribe(self, subscription, topics):
+        with self._lock:
+            for topic in subscription.topics - topics:
+                self._subscribers[topic].discard(subscription)
+                if not self._subscribers[topic]:
+                    del self._subscribers[topic]
+            for topic in topics - subscription.topics:
+                self._subscribers[topic].add(subscription)
+            subscription.topics = topics
+
+    def publish(self, topics, event, data):
+        with self._lock:
+            subscriptions = set()
+            for topic in topics:
+                subscriptions.update(self._subscribers.get(topic, ()))
+        for subscription in subscriptions:
+            subscription.deliver((event, data))
+
+
+event_bus = EventBus()
+
+
+def publish_to_users(user_ids, event, data=None):
+    event_bus.publish([user_topic(user_id) for user_id in user_ids], event, data or {})
+
+
+def publish_listening(user_id, listeningto):
+    """Sent to every stream following this user; costs nothing when nobody is listening."""
+    event_bus.publish(
+        [listening_topic(user_id)], 'listening', {'user_id': int(user_id), 'listeningto': listeningto}
+    )
+
+
+def load_friend_ids(user_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT friend_id FROM friend_edges WHERE user_id = %s AND status = 'accepted'", [user_id]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def stream_topics(user_id, friend_ids):
+    return [user_topic(user_id)] + [listening_topic(friend_id) for friend_id in friend_ids]
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
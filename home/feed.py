@@ -0,0 +1,64 @@
+from django.core.cache import cache
+
+from .models import Album, Track
+
+# Cache key for the catalog part of the home page context (shared by every visitor)
+HOME_FEED_CACHE_KEY = 'home_feed'
+# Safety net in case the catalog is changed outside the dashboard (admin, raw SQL, ...)
+HOME_FEED_TIMEOUT = 15 * 60
+
+MADE_FOR_YOU_COUNT = 7
+RECENT_COUNT = 5
+ALBUM_SHELF_PAGE_SIZE = 6 # Two rows of three albums per page on the shelf
+ALBUM_SHELF_MAX_PAGE_SIZE = 48
+
+
+def album_shelf_page(after=None, limit=ALBUM_SHELF_PAGE_SIZE):
+    """
+    Keyset page of the album shelf: albums with album_id > after, covers and titles only.
+    Returns (albums, next_cursor); next_cursor is None on the last page.
+    """
+    albums = Album.objects.only('album_id', 'title', 'cover_image_url').order_by('album_id')
+    if after is not None:
+        albums = albums.filter(album_id__gt=after)
+    # Fetch one extra row to know whether there is a next page without a COUNT(*)
+    albums = list(albums[:limit + 1])
+    next_cursor = None
+    if len(albums) > limit:
+        albums = albums[:limit]
+        next_cursor = albums[-1].album_id
+    return albums, next_cursor
+
+
+def build_home_feed():
+    """Run the catalog queries for the home page and return them as plain lists."""
+    # select_related('album') so the template never lazy-loads album titles per card
+    made_for_you = list(Track.objects.select_related('album')[:MADE_FOR_YOU_COUNT])
+    recent = list(Track.objects.select_related('album').order_by('-track_id')[:RECENT_COUNT])
+    # The latest track is the first "recent" track, no need for a separate query
+    latest_track = recent[0] if recent else None
+
+    # Only the first shelf page; the template fetches the rest from /api/albums/ while scrolling
+    albums, albums_next_cursor = album_shelf_page()
+
+    return {
+        'made_for_you_items': made_for_you,
+        'recent_items': recent,
+        'initial_player_track': latest_track,
+        'albums': albums,
+        'albums_next_cursor': albums_next_cursor,
+    }
+
+
+def get_home_feed():
+    """Return the cached home feed, building it on a cache miss."""
+    feed = cache.get(HOME_FEED_CACHE_KEY)
+    if feed is None:
+        feed = build_home_feed()
+        cache.set(HOME_FEED_CACHE_KEY, feed, HOME_FEED_TIMEOUT)
+    return feed
+
+
+def invalidate_home_feed():
+    """Drop the cached feed; call this after any track, album or artist write."""
+    cache.delete(HOME_FEED_CACHE_KEY)
@@ -0,0 +1,58 @@
+from django.db import connection, transaction
+
+from .models import FriendEdge
+from .schema import create_model_cascading
+
+
+def friend_edges_table_exists():
+    return FriendEdge._meta.db_table in connection.introspection.table_names()
+
+
+def create_friend_edges_table():
+    """
+    Create friend_edges with its indexes and foreign keys (the model is unmanaged, so no migration does it).
+    Deleting a user in SQL drops its edges in both directions.
+    """
+    create_model_cascading(FriendEdge)
+
+
+def add_friend_edges(cursor, user_id, friend_id):
+    """
+    Both directions of an accepted friendship; call it in the transaction that writes friendships.
+    Directions already stored are left alone, so it never trips the unique (user_id, friend_id) index.
+    """
+    user_id, friend_id = int(user_id), int(friend_id) # Session ids are strings
+    cursor.execute(
+        "SELECT user_id, friend_id FROM friend_edges WHERE (user_id = %s AND friend_id = %s) OR (user_id = %s AND friend_id = %s)",
+        [user_id, friend_id, friend_id, user_id]
+    )
+    existing = set(cursor.fetchall())
+    missing = [edge for edge in [(user_id, friend_id), (friend_id, user_id)] if edge not in existing]
+    if missing:
+        cursor.executemany(
+            "INSERT INTO friend_edges (user_id, friend_id, status) VALUES (%s, %s, 'accepted')", missing
+        )
+
+
+def remove_friend_edges(cursor, user_id, friend_id):
+    """Both directions of an ended friendship; call it in the transaction that deletes from friendships."""
+    cursor.execute(
+        "DELETE FROM friend_edges WHERE (user_id = %s AND friend_id = %s) OR (user_id = %s AND friend_id = %s)",
+        [user_id, friend_id, friend_id, user_id]
+    )
+
+
+def backfill_friend_edges():
+    """Rebuild friend_edges from the accepted friendships. Returns the number of rows written."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM friend_edges")
+        # UNION (not UNION ALL) so a pair stored in both directions in friendships is written once
+        cursor.execute("""
+            INSERT INTO friend_edges (user_id, friend_id, status)
+            SELECT user_id, friend_id, 'accepted' FROM (
+                SELECT user1_id AS user_id, user2_id AS friend_id FROM friendships WHERE status = 'accepted'
+                UNION
+                SELECT user2_id, user1_id FROM friendships WHERE status = 'accepted'
+            ) edges
+        """)
+        return cursor.rowcount
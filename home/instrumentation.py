@@ -0,0 +1,92 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Longest statement text kept in logs
+SLOW_SQL_LOG_LENGTH = 500
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times every statement run by one request (ORM and raw cursors alike)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total += duration
+            if duration > self.slowest:
+                self.slowest = duration
+                self.slowest_sql = sql
+
+
+def query_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Per request: query count, DB time, slowest statement, time spent outside the database
+    (Python, serialization, template rendering) and response size. Logs a warning when a view
+    runs more queries than its budget (settings.QUERY_BUDGETS) and adds a Server-Timing header.
+    Costs two perf_counter() calls per statement, so it can stay on in production.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_INSTRUMENTATION:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        # Streaming bodies are produced after this point, their size is unknown here
+        size = None if response.streaming else len(response.content)
+        budget = query_budget(view_name)
+        over_budget = recorder.count > budget
+        view = (('view', view_name),)
+        registry.inc('freeflow_db_queries_total', view, recorder.count)
+        registry.inc('freeflow_db_query_seconds_total', view, recorder.total)
+        if size is not None:
+            registry.inc('freeflow_http_response_bytes_total', view, size)
+        if over_budget:
+            registry.inc('freeflow_query_budget_exceeded_total', view)
+
+        app = total - recorder.total
+        response['Server-Timing'] = f"db;dur={recorder.total * 1000:.1f};desc=\"{recorder.count} queries\", app;dur={app * 1000:.1f}"
+        if over_budget:
+            logger.warning(
+                "%s ran %d queries (budget %d), %.1f ms in the database; slowest %.1f ms: %s",
+                view_name, recorder.count, budget, recorder.total * 1000, recorder.slowest * 1000,
+                (recorder.slowest_sql or '')[:SLOW_SQL_LOG_LENGTH],
+            )
+        logger.debug(
+            "%s %s -> %s: %d queries, db %.1f ms, app %.1f ms, %s bytes",
+            request.method, view_name, response.status_code, recorder.count,
+            recorder.total * 1000, app * 1000, size if size is not None else 'streamed',
+        )
+        return response
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from home.friend_edges import backfill_friend_edges, create_friend_edges_table, friend_edges_table_exists
+
+
+class Command(BaseCommand):
+    help = "Create the friend_edges table if it is missing and rebuild it from the accepted friendships."
+
+    def handle(self, *args, **options):
+        if not friend_edges_table_exists():
+            create_friend_edges_table()
+            self.stdout.write("Created table friend_edges")
+        written = backfill_friend_edges()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} friend_edges rows"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from home.playlist_positions import POSITION_GAP, add_position_column, position_column_exists
+
+
+class Command(BaseCommand):
+    help = "Add playlisttracks.position with its (playlistid, position) index if missing, and rank unranked rows in insertion order."
+
+    def handle(self, *args, **options):
+        if not position_column_exists():
+            add_position_column()
+            self.stdout.write("Added column playlisttracks.position and its index")
+        # Spacing by id keeps today's insertion order and leaves POSITION_GAP between rows
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE playlisttracks SET position = id * %s WHERE position = 0", [POSITION_GAP])
+            ranked = cursor.rowcount
+        self.stdout.write(self.style.SUCCESS(f"Ranked {ranked} playlist tracks"))
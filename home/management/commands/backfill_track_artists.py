@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from home.track_artists import backfill_track_artists, create_track_artists_table, track_artists_table_exists
+
+
+class Command(BaseCommand):
+    help = "Create the track_artists table if it is missing and rebuild it from the artist_name columns of tracks."
+
+    def handle(self, *args, **options):
+        if not track_artists_table_exists():
+            create_track_artists_table()
+            self.stdout.write("Created table track_artists")
+        written = backfill_track_artists()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} track_artists rows"))
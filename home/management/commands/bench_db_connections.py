@@ -0,0 +1,89 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from home.db_connections import connection_stats
+from home.models import CustomUser
+
+from .bench_typeahead import percentile
+from .loadtest import benchmark_client
+
+# Hot read endpoints of the player and friends sidebar
+DEFAULT_ENDPOINTS = [
+    '/api/tracks/?limit=50',
+    '/api/typeahead/?q=a',
+    '/api/friends/list/',
+    '/api/friends/active/',
+    '/api/get_pending_requests/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request latency on the hot API endpoints with a new database connection per request "
+        "(CONN_MAX_AGE=0) and with persistent connections, against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and mode")
+        parser.add_argument('--endpoint', action='append', help="Endpoint to request (repeatable)")
+        parser.add_argument('--user', type=int, help="auth_user id to log in as (default: first user)")
+        parser.add_argument('--max-age', type=int, default=None,
+                            help="CONN_MAX_AGE of the persistent run (default: DB_CONN_MAX_AGE, or 60)")
+        parser.add_argument('--no-health-checks', action='store_true', help="Persistent run without CONN_HEALTH_CHECKS")
+
+    def request(self, client, endpoint):
+        # The test client leaves connections open between requests; the real handler
+        # runs close_old_connections() when a request starts and when it finishes
+        close_old_connections()
+        response = client.get(endpoint)
+        close_old_connections()
+        return response
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(pk=options['user']) if options['user'] else CustomUser.objects.order_by('pk')
+        user = user.first()
+        if user is None:
+            raise CommandError("No user to log in as")
+        endpoints = options['endpoint'] or DEFAULT_ENDPOINTS
+        max_age = options['max_age'] if options['max_age'] is not None else (settings.DB_CONN_MAX_AGE or 60)
+        modes = [
+            ('per request', 0, False),
+            ('persistent', max_age, not options['no_health_checks']),
+        ]
+
+        results = {}
+        for label, conn_max_age, health_checks in modes:
+            # Applies to connections opened from now on
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+            connection.settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+            client = benchmark_client(user)
+
+            for endpoint in endpoints:
+                for _ in range(5): # Warm caches and the connection
+                    self.request(client, endpoint)
+                connection_stats.reset()
+                timings = []
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    response = self.request(client, endpoint)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code >= 400:
+                        raise CommandError(f"{endpoint} returned {response.status_code}")
+                timings.sort()
+                stats = connection_stats.snapshot()
+                results[label, endpoint] = timings
+                self.stdout.write(
+                    f"{label:<12} {endpoint:<32} p50 {percentile(timings, 50):7.3f} ms  "
+                    f"p99 {percentile(timings, 99):7.3f} ms  "
+                    f"{stats['connections_opened']} connections for {stats['requests']} requests"
+                )
+        connection.close()
+
+        for endpoint in endpoints:
+            before = percentile(results['per request', endpoint], 50)
+            after = percentile(results['persistent', endpoint], 50)
+            self.stdout.write(f"{endpoint:<32} p50 {before:.3f} -> {after:.3f} ms ({(1 - after / before) * 100:.0f}% lower)")
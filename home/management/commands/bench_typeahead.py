@@ -0,0 +1,126 @@
+import random
+import resource
+import string
+import time
+from itertools import accumulate
+
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from home.models import CustomUser, Track
+from home.typeahead import TYPEAHEAD_TOP_K, TypeaheadSnapshot, typeahead_index
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def synthetic_word(rng):
+    syllables = rng.randint(1, 3)
+    return ''.join(rng.choice('bcdfghklmnprstvz') + rng.choice('aeiou') for _ in range(syllables))
+
+
+def synthetic_catalog(tracks, seed):
+    """(rows, popularity) for a fake catalog with skewed word and playlist-count distributions."""
+    rng = random.Random(seed)
+    vocabulary = list({synthetic_word(rng) for _ in range(40000)})
+    artists = [' '.join(rng.choices(vocabulary, k=rng.randint(1, 2))).title() for _ in range(max(1, tracks // 20))]
+    # Zipf-like weights so the most common words produce very large prefix ranges, as in a real catalog
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    rows = []
+    popularity = {}
+    for track_id in range(1, tracks + 1):
+        title = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(1, 4))).title()
+        featured = rng.choice(artists) if rng.random() < 0.2 else None
+        rows.append((track_id, title, rng.choice(artists), featured, None))
+        popularity[track_id] = int(rng.paretovariate(1.2)) - 1
+    return rows, popularity
+
+
+def keystroke_queries(rows, count, seed):
+    """Queries as a picker sends them: every prefix of a title or artist as it is typed, plus some misses."""
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < count:
+        if rng.random() < 0.1:
+            queries.append(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 8))))
+            continue
+        row = rng.choice(rows)
+        text = row[1] if rng.random() < 0.7 else row[2]
+        queries.extend(text[:end] for end in range(1, len(text) + 1))
+    return queries[:count]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark typeahead lookups (p50/p99): in memory on a synthetic catalog, or with --live "
+        "through /api/typeahead/ (middleware, lookup, track fetch and JSON) on the database catalog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=1_000_000, help="Size of the synthetic catalog")
+        parser.add_argument('--queries', type=int, default=50_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--live', action='store_true', help="Index the database catalog instead of a synthetic one")
+        parser.add_argument('--target-ms', type=float, default=10.0, help="Fail when p99 is above this")
+
+    def request(self, client, query):
+        # The real handler runs close_old_connections() when a request starts and when it finishes
+        close_old_connections()
+        try:
+            response = client.get(f'/api/typeahead/?q={quote(query)}')
+        finally:
+            close_old_connections()
+        if response.status_code != 200:
+            raise CommandError(f"/api/typeahead/ returned {response.status_code} for {query!r}")
+        return response.json()['tracks']
+
+    def handle(self, *args, **options):
+        from .loadtest import benchmark_client # loadtest imports this module
+
+        seed = options['seed']
+        started = time.perf_counter()
+        if options['live']:
+            # The index the view uses, built up front: until it is ready the view suggests nothing
+            snapshot = typeahead_index.build()
+            # Queries are typed from the same titles and artist names
+            rows = list(Track.objects.values_list('track_id', 'title', 'artist_name'))
+            user = CustomUser.objects.order_by('pk').first()
+            if user is None:
+                raise CommandError("No user to log in as")
+            client = benchmark_client(user)
+            lookup = lambda query: self.request(client, query)
+        else:
+            self.stdout.write(f"Generating {options['tracks']:,} synthetic tracks...")
+            rows, popularity = synthetic_catalog(options['tracks'], seed)
+            started = time.perf_counter()
+            snapshot = TypeaheadSnapshot(rows, popularity)
+            lookup = lambda query: snapshot.suggest(query, TYPEAHEAD_TOP_K)
+        build_seconds = time.perf_counter() - started
+        self.stdout.write(f"Indexed {len(snapshot):,} tracks in {build_seconds:.1f}s "
+                          f"(peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB)")
+        if not rows:
+            raise CommandError("The catalog is empty")
+
+        queries = keystroke_queries(rows, options['queries'], seed)
+        timings = []
+        hits = 0
+        for query in queries:
+            start = time.perf_counter()
+            if lookup(query):
+                hits += 1
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        p99 = percentile(timings, 99)
+        self.stdout.write(
+            f"{len(queries):,} queries ({hits:,} with suggestions): "
+            f"p50 {percentile(timings, 50):.3f} ms, p95 {percentile(timings, 95):.3f} ms, "
+            f"p99 {p99:.3f} ms, max {timings[-1]:.3f} ms"
+        )
+        if p99 > options['target_ms']:
+            raise CommandError(f"p99 {p99:.3f} ms is above the {options['target_ms']} ms target")
+        self.stdout.write(self.style.SUCCESS(f"p99 is within the {options['target_ms']} ms target"))
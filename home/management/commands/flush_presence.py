@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from home.presence import presence_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Write pending \"listening to\" changes from the presence store to auth_user. "
+        "Web processes flush on their own every PRESENCE_FLUSH_INTERVAL seconds; this is for a flush before a deploy."
+    )
+
+    def handle(self, *args, **options):
+        written = presence_store.flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed presence of {written} users"))
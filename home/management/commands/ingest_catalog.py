@@ -0,0 +1,68 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.catalog_ingest import (
+    INGEST_BATCH_SIZE, INGEST_FIELDS, CatalogIngest, catalog_imports_table_exists, create_catalog_imports_table,
+    checkpoint_name, detect_format, file_checkpoint_key, file_digest, read_records,
+)
+from home.models import CatalogImport
+
+
+class Command(BaseCommand):
+    help = (
+        "Import tracks, with their albums and artists, from a CSV, JSON (array) or NDJSON file with one record "
+        f"per track: {', '.join(INGEST_FIELDS)}. Artists and albums are matched by name and created when missing. "
+        "An interrupted import resumes where it stopped when run again on a file with the same content."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json', 'ndjson'], help="Default: from the file extension")
+        parser.add_argument('--name', help="Import name the checkpoint is kept under (default: file name and content hash)")
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+        parser.add_argument('--restart', action='store_true', help="Forget the checkpoint and import the whole file again")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        if file_format is None:
+            raise CommandError(f"Can't tell the format of {path}; pass --format")
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        if not catalog_imports_table_exists():
+            create_catalog_imports_table()
+            self.stdout.write("Created table catalog_imports")
+
+        name = options['name']
+        if not name:
+            with open(path, 'rb') as f:
+                name = checkpoint_name(file_checkpoint_key(file_digest(f)), os.path.basename(path))
+        if options['restart']:
+            CatalogImport.objects.filter(name=name).delete()
+
+        started = time.perf_counter()
+
+        def progress(job):
+            seconds = time.perf_counter() - started
+            self.stdout.write(
+                f"{job.records_done:>10,} records  {job.tracks_created:>10,} tracks  {job.albums_created:>8,} albums  "
+                f"{job.artists_created:>8,} artists  {job.skipped:>6,} skipped  ({seconds:.0f}s)"
+            )
+
+        ingest = CatalogIngest(name, batch_size=options['batch_size'], progress=progress)
+        if ingest.job.finished_at:
+            self.stdout.write(f"{name} was already imported on {ingest.job.finished_at:%Y-%m-%d %H:%M}; pass --restart to import it again")
+            return
+        if ingest.job.records_done:
+            self.stdout.write(f"Resuming {name} after record {ingest.job.records_done:,}")
+        with open(path, 'rb') as f:
+            try:
+                job = ingest.run(read_records(f, file_format))
+            except ValueError as e:
+                raise CommandError(f"{e} (committed up to record {ingest.job.records_done:,}; run again to resume)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {name}: {job.tracks_created:,} tracks, {job.albums_created:,} albums, {job.artists_created:,} artists, "
+            f"{job.skipped:,} records skipped, in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,264 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.db.models import Max
+from django.test import Client
+from django.urls import resolve
+
+from home.models import Album, CustomUser, Playlist, Track
+
+from .bench_typeahead import percentile
+
+# Ids sampled from the database for the scenarios to pick from
+LOADTEST_SAMPLE_SIZE = 500
+# A p95 this close to the baseline is noise, whatever the percentage
+REGRESSION_FLOOR_MS = 1.0
+
+
+def sample_ids(model, count, rng):
+    """Up to count existing primary keys, drawn at random without scanning the table."""
+    max_id = model.objects.aggregate(top=Max('pk'))['top'] or 0
+    ids = set()
+    for _ in range(10):
+        if len(ids) >= count or not max_id:
+            break
+        candidates = [rng.randint(1, max_id) for _ in range(count)]
+        ids.update(model.objects.filter(pk__in=candidates).values_list('pk', flat=True))
+    return sorted(ids)[:count]
+
+
+class Fixture:
+    """What the scenarios request: ids and titles sampled from the catalog being tested."""
+
+    def __init__(self, rng):
+        self.album_ids = sample_ids(Album, LOADTEST_SAMPLE_SIZE, rng)
+        self.playlist_ids = sample_ids(Playlist, LOADTEST_SAMPLE_SIZE, rng)
+        track_ids = sample_ids(Track, LOADTEST_SAMPLE_SIZE, rng)
+        self.titles = list(Track.objects.filter(pk__in=track_ids).values_list('title', flat=True))
+        self.user_ids = sample_ids(CustomUser, LOADTEST_SAMPLE_SIZE, rng)
+        self.superuser = CustomUser.objects.filter(is_superuser=True).order_by('pk').first()
+
+
+# Scenario name -> function(fixture, rng) returning the paths one visit requests, in order
+def home_visit(fixture, rng):
+    return ['/', '/api/albums/', '/api/get_friends_list/', '/api/get_notifications/']
+
+
+def search_visit(fixture, rng):
+    # Every keystroke of a title goes to the typeahead, then the full query to the search page
+    title = rng.choice(fixture.titles).lower()
+    return [f'/api/typeahead/?q={quote(title[:end])}' for end in range(1, len(title) + 1)] + [f'/api/search/?q={quote(title)}']
+
+
+def album_visit(fixture, rng):
+    return [f'/api/album/{rng.choice(fixture.album_ids)}/']
+
+
+def playlist_visit(fixture, rng):
+    return [f'/api/playlist/{rng.choice(fixture.playlist_ids)}/']
+
+
+def friends_visit(fixture, rng):
+    # One round of the sidebar's polling
+    return ['/api/friends/active/', '/api/get_pending_requests/', '/api/get_notifications/']
+
+
+def dashboard_visit(fixture, rng):
+    return ['/dashboard/']
+
+
+SCENARIOS = {
+    'home': home_visit,
+    'search': search_visit,
+    'album': album_visit,
+    'playlist': playlist_visit,
+    'friends': friends_visit,
+    'dashboard': dashboard_visit,
+}
+
+
+def benchmark_client(user):
+    """Test client logged in as user, sending a Host header the settings accept outside the test runner."""
+    host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+    client = Client(HTTP_HOST=host)
+    client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+    return client
+
+
+def endpoint_name(path):
+    match = resolve(urlsplit(path).path)
+    return match.view_name
+
+
+def summarize(timings, seconds):
+    timings = sorted(timings)
+    return {
+        'requests': len(timings),
+        'rps': round(len(timings) / seconds, 1) if seconds else 0,
+        'p50': round(percentile(timings, 50), 3),
+        'p95': round(percentile(timings, 95), 3),
+        'p99': round(percentile(timings, 99), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay scripted scenarios (home page, search typing, album and playlist opens, friend polling, "
+        "dashboard) against the configured database through the full middleware stack, report p50/p95/p99 "
+        "latency and throughput per endpoint and compare them with a stored baseline. Seed a large catalog "
+        "with seed_catalog first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Scenario to run (repeatable, default: all)")
+        parser.add_argument('--concurrency', type=int, default=4, help="Simulated users running each scenario at once")
+        parser.add_argument('--visits', type=int, default=50, help="Visits per simulated user and scenario")
+        parser.add_argument('--warmup', type=int, default=5, help="Visits per scenario before measuring")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'loadtest_baseline.json'),
+                            help="Baseline JSON file (default: loadtest_baseline.json next to manage.py)")
+        parser.add_argument('--save-baseline', action='store_true', help="Write these results as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help="Percent over the baseline p95 (or under its throughput) counted as a regression")
+
+    def request(self, client, path):
+        # The real handler runs close_old_connections() when a request starts and when it finishes
+        close_old_connections()
+        try:
+            return client.get(path)
+        finally:
+            close_old_connections()
+
+    def run_visits(self, scenario, fixture, user, visits, seed, timings, errors):
+        rng = random.Random(seed)
+        client = benchmark_client(user)
+        try:
+            for _ in range(visits):
+                for path in SCENARIOS[scenario](fixture, rng):
+                    start = time.perf_counter()
+                    response = self.request(client, path)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    endpoint = endpoint_name(path)
+                    timings.setdefault(endpoint, []).append(elapsed)
+                    if response.status_code >= 400:
+                        errors[endpoint] = errors.get(endpoint, 0) + 1
+        finally:
+            connections.close_all() # This thread's connections
+
+    def run_scenario(self, scenario, fixture, options, rng):
+        if scenario == 'dashboard':
+            users = [fixture.superuser] * options['concurrency']
+        else:
+            users = list(CustomUser.objects.filter(pk__in=rng.sample(fixture.user_ids, min(options['concurrency'], len(fixture.user_ids)))))
+            users = [users[i % len(users)] for i in range(options['concurrency'])]
+
+        if options['warmup']:
+            self.run_visits(scenario, fixture, users[0], options['warmup'], rng.random(), {}, {})
+
+        results = [({}, {}) for _ in users]
+        threads = [
+            threading.Thread(target=self.run_visits, args=(scenario, fixture, user, options['visits'], rng.random(), timings, errors))
+            for user, (timings, errors) in zip(users, results)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        timings, errors = {}, {}
+        for thread_timings, thread_errors in results:
+            for endpoint, values in thread_timings.items():
+                timings.setdefault(endpoint, []).extend(values)
+            for endpoint, count in thread_errors.items():
+                errors[endpoint] = errors.get(endpoint, 0) + count
+        summary = {}
+        for endpoint, values in timings.items():
+            summary[f'{scenario} {endpoint}'] = dict(summarize(values, seconds), errors=errors.get(endpoint, 0))
+        visits = options['visits'] * len(users)
+        self.stdout.write(f"{scenario}: {visits} visits in {seconds:.1f}s ({visits / seconds:.1f} visits/s)")
+        return summary
+
+    def compare(self, results, baseline, tolerance):
+        """Lines comparing results with the baseline, and the endpoints that regressed."""
+        lines, regressions = [], []
+        for key, current in results.items():
+            before = baseline.get(key)
+            if before is None:
+                lines.append(f"{key:<44} new endpoint, no baseline")
+                continue
+            slower = current['p95'] > before['p95'] * (1 + tolerance / 100) and current['p95'] - before['p95'] > REGRESSION_FLOOR_MS
+            fewer = current['rps'] < before['rps'] * (1 - tolerance / 100)
+            change = (current['p95'] / before['p95'] - 1) * 100 if before['p95'] else 0
+            lines.append(
+                f"{key:<44} p95 {before['p95']:8.2f} -> {current['p95']:8.2f} ms ({change:+.0f}%)  "
+                f"rps {before['rps']:7.1f} -> {current['rps']:7.1f}{'  REGRESSION' if slower or fewer else ''}"
+            )
+            if slower or fewer:
+                regressions.append(key)
+        return lines, regressions
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        fixture = Fixture(rng)
+        if not fixture.user_ids:
+            raise CommandError("No users in the database; run seed_catalog first")
+        scenarios = options['scenario'] or list(SCENARIOS)
+        skipped = {
+            'search': not fixture.titles, 'album': not fixture.album_ids,
+            'playlist': not fixture.playlist_ids, 'dashboard': fixture.superuser is None,
+        }
+        for scenario in scenarios:
+            if skipped.get(scenario):
+                self.stdout.write(self.style.WARNING(f"Skipping {scenario}: nothing to request in this database"))
+        scenarios = [scenario for scenario in scenarios if not skipped.get(scenario)]
+
+        results = {}
+        for scenario in scenarios:
+            results.update(self.run_scenario(scenario, fixture, options, rng))
+
+        self.stdout.write(f"\n{'endpoint':<44} {'requests':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6}")
+        for key, result in results.items():
+            self.stdout.write(
+                f"{key:<44} {result['requests']:>8} {result['rps']:>8.1f} {result['p50']:>9.2f} "
+                f"{result['p95']:>9.2f} {result['p99']:>9.2f} {result['errors']:>6}"
+            )
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'database': connection.vendor,
+                    'concurrency': options['concurrency'],
+                    'visits': options['visits'],
+                    'endpoints': results,
+                }, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Saved the baseline to {options['baseline']}"))
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write("No baseline to compare with; run again with --save-baseline to store one")
+            return
+
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        if (baseline.get('concurrency'), baseline.get('visits')) != (options['concurrency'], options['visits']):
+            self.stdout.write(self.style.WARNING(
+                f"The baseline ran with --concurrency {baseline.get('concurrency')} --visits {baseline.get('visits')}; "
+                "results are not directly comparable"
+            ))
+        lines, regressions = self.compare(results, baseline['endpoints'], options['tolerance'])
+        self.stdout.write(f"\nAgainst the baseline of {baseline.get('created')}:")
+        for line in lines:
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} endpoint(s) regressed by more than {options['tolerance']:.0f}%: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f"No endpoint regressed by more than {options['tolerance']:.0f}%"))
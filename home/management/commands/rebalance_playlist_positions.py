@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from home.models import Playlist
+from home.playlist_positions import playlists_to_rebalance, rebalance_playlist
+
+
+class Command(BaseCommand):
+    help = (
+        "Respace playlist positions POSITION_GAP apart. By default only the playlists whose gaps "
+        "got too small through repeated moves (found by a query on playlisttracks); run it periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--playlist', type=int, action='append', help="Rebalance this playlist (repeatable)")
+        parser.add_argument('--all', action='store_true', help="Rebalance every playlist")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            playlist_ids = Playlist.objects.order_by('pk').values_list('pk', flat=True).iterator()
+        elif options['playlist']:
+            playlist_ids = options['playlist']
+        else:
+            playlist_ids = playlists_to_rebalance()
+
+        playlists = rows = 0
+        for playlist_id in playlist_ids:
+            rows += rebalance_playlist(playlist_id)
+            playlists += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebalanced {playlists} playlists ({rows} tracks)"))
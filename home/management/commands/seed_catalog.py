@@ -0,0 +1,193 @@
+import random
+import string
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from home.friend_edges import backfill_friend_edges, friend_edges_table_exists
+from home.playlist_positions import POSITION_GAP, position_column_exists
+from home.track_artists import backfill_track_artists, track_artists_table_exists
+
+from .bench_typeahead import synthetic_word
+
+# Rows per INSERT batch (and per transaction)
+SEED_BATCH_SIZE = 5000
+# Seeded accounts are loadtest_<n>, all with this password; loadtest_1 is a superuser
+SEED_USERNAME_PREFIX = 'loadtest_'
+SEED_PASSWORD = 'loadtest'
+LOCAL_HOSTS = {'', 'localhost', '127.0.0.1', '::1'}
+
+
+def is_local_database():
+    host = connection.settings_dict.get('HOST') or ''
+    return connection.vendor == 'sqlite' or host in LOCAL_HOSTS or host.startswith('/') # '/...' is a unix socket
+
+
+def next_id(table, column):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+        return cursor.fetchone()[0] + 1
+
+
+def insert_rows(sql, rows):
+    """executemany() in batches of SEED_BATCH_SIZE, one transaction each. Returns the number of rows."""
+    rows = iter(rows)
+    written = 0
+    while batch := list(islice(rows, SEED_BATCH_SIZE)):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+        written += len(batch)
+    return written
+
+
+def zipf_cum_weights(count, exponent=1.0):
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the local database with a large synthetic catalog for load tests: artists, albums, tracks, "
+        "users with friendships, pending requests and playlists. Rows are appended after the existing ones. "
+        "Same --seed, same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=1_000_000)
+        parser.add_argument('--albums', type=int, default=50_000)
+        parser.add_argument('--artists', type=int, default=20_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--friends', type=int, default=20, help="Average friends per user")
+        parser.add_argument('--playlists', type=float, default=2, help="Average playlists per user")
+        parser.add_argument('--playlist-tracks', type=int, default=25, help="Average tracks per playlist")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--allow-remote', action='store_true', help="Seed a database that is not on this machine")
+
+    def step(self, label, sql, rows):
+        started = time.perf_counter()
+        written = insert_rows(sql, rows)
+        self.stdout.write(f"{label:<18} {written:>10,} rows in {time.perf_counter() - started:6.1f}s")
+        return written
+
+    def handle(self, *args, **options):
+        if not is_local_database() and not options['allow_remote']:
+            raise CommandError(
+                f"{connection.settings_dict.get('HOST')} is not a local database; pass --allow-remote to seed it anyway"
+            )
+        if options['tracks'] < 1 or options['users'] < 2 or options['albums'] < 1 or options['artists'] < 1:
+            raise CommandError("Need at least one track, album and artist and two users")
+
+        rng = random.Random(options['seed'])
+        vocabulary = sorted({synthetic_word(rng) for _ in range(40000)})
+        # Zipf-like weights: a few words and tracks are very common, as in a real catalog
+        word_weights = zipf_cum_weights(len(vocabulary))
+
+        def phrase(min_words, max_words):
+            return ' '.join(rng.choices(vocabulary, cum_weights=word_weights, k=rng.randint(min_words, max_words))).title()
+
+        first_artist = next_id('artists', 'artist_id')
+        artist_names = [phrase(1, 2) for _ in range(options['artists'])]
+        self.step('artists', "INSERT INTO artists (artist_id, name, bio) VALUES (%s, %s, %s)", (
+            (first_artist + i, name, None) for i, name in enumerate(artist_names)
+        ))
+
+        first_album = next_id('albums', 'album_id')
+        album_artists = [rng.randrange(options['artists']) for _ in range(options['albums'])]
+        self.step('albums', "INSERT INTO albums (album_id, title, cover_image_url, primary_artist_id) VALUES (%s, %s, %s, %s)", (
+            (first_album + i, phrase(1, 3), f'/media/seed/albums/{first_album + i}.jpg', first_artist + artist)
+            for i, artist in enumerate(album_artists)
+        ))
+
+        first_track = next_id('tracks', 'track_id')
+
+        def track_rows():
+            for i in range(options['tracks']):
+                track_id = first_track + i
+                # One track in ten is a single without an album
+                album = rng.randrange(options['albums']) if rng.random() < 0.9 else None
+                artist = album_artists[album] if album is not None else rng.randrange(options['artists'])
+                featured = [artist_names[rng.randrange(options['artists'])] for _ in range(rng.choice((0, 0, 0, 0, 1, 1, 2)))]
+                featured += [None] * (2 - len(featured))
+                yield (
+                    track_id, phrase(1, 4), f'/media/seed/tracks/{track_id}.mp3',
+                    first_album + album if album is not None else None,
+                    artist_names[artist], featured[0], featured[1][:50] if featured[1] else None,
+                )
+
+        self.step('tracks', (
+            "INSERT INTO tracks (track_id, title, file_url, album_id, artist_name, artist_name2, artist_name3) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)"
+        ), track_rows())
+
+        first_user = next_id('auth_user', 'id')
+        password = make_password(SEED_PASSWORD) # Hashed once, shared by every seeded account
+        joined = datetime.now() - timedelta(days=3 * 365)
+        self.step('users', (
+            "INSERT INTO auth_user (id, password, username, email, is_superuser, is_active, date_joined, icon_url, userid) "
+            "VALUES (%s, %s, %s, %s, %s, 1, %s, '', %s)"
+        ), (
+            (
+                first_user + i, password, f'{SEED_USERNAME_PREFIX}{first_user + i}',
+                f'{SEED_USERNAME_PREFIX}{first_user + i}@example.com', 1 if i == 0 else 0,
+                joined + timedelta(minutes=i),
+                # Same shape as generate_unique_userid(): username, two digits, three letters
+                f"{SEED_USERNAME_PREFIX}{first_user + i}{rng.randrange(100):02d}{''.join(rng.choices(string.ascii_lowercase, k=3))}",
+            ) for i in range(options['users'])
+        ))
+
+        users = options['users']
+
+        def friendship_rows():
+            # Every user befriends about half its friends among the users after it, so pairs are
+            # unique; being picked by the users before it makes up the other half
+            for i in range(users - 1):
+                count = min(users - i - 1, rng.randint(0, options['friends']))
+                for j in rng.sample(range(i + 1, users), count):
+                    yield first_user + i, first_user + j
+
+        self.step('friendships', "INSERT INTO friendships (user1_id, user2_id, status) VALUES (%s, %s, 'accepted')", friendship_rows())
+        self.step('friend_requests', "INSERT INTO friend_requests (sender_id, recipient_id) VALUES (%s, %s)", (
+            (first_user + sender, first_user + recipient)
+            for sender, recipient in (rng.sample(range(users), 2) for _ in range(users // 5))
+        ))
+
+        first_playlist = next_id('playlists', 'playlist_id')
+        playlist_owners = [
+            first_user + owner for owner in range(users)
+            for _ in range(rng.randint(0, round(2 * options['playlists'])))
+        ]
+        self.step('playlists', "INSERT INTO playlists (playlist_id, owner_user_id, name) VALUES (%s, %s, %s)", (
+            (first_playlist + i, owner, phrase(1, 3)) for i, owner in enumerate(playlist_owners)
+        ))
+
+        with_positions = position_column_exists()
+        track_weights = zipf_cum_weights(options['tracks'], 0.8)
+        track_ids = range(first_track, first_track + options['tracks'])
+
+        def playlist_track_rows():
+            for i in range(len(playlist_owners)):
+                count = rng.randint(1, 2 * options['playlist_tracks'] - 1)
+                tracks = dict.fromkeys(rng.choices(track_ids, cum_weights=track_weights, k=count)) # Deduplicated, in order
+                for position, track_id in enumerate(tracks, 1):
+                    row = (first_playlist + i, track_id)
+                    yield row + (position * POSITION_GAP,) if with_positions else row
+
+        self.step('playlisttracks', (
+            "INSERT INTO playlisttracks (playlistid, tracks, position) VALUES (%s, %s, %s)" if with_positions
+            else "INSERT INTO playlisttracks (playlistid, tracks) VALUES (%s, %s)"
+        ), playlist_track_rows())
+
+        # Derived tables, when this database has them
+        if friend_edges_table_exists():
+            self.stdout.write(f"Rebuilt friend_edges: {backfill_friend_edges():,} rows")
+        if track_artists_table_exists():
+            self.stdout.write(f"Rebuilt track_artists: {backfill_track_artists():,} rows")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded users {SEED_USERNAME_PREFIX}{first_user}..{SEED_USERNAME_PREFIX}{first_user + users - 1} "
+            f"(password '{SEED_PASSWORD}', the first one is a superuser). Restart the server so its "
+            "in-process caches and search indexes pick up the new catalog."
+        ))
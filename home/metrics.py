@@ -0,0 +1,232 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Prometheus metrics without the client library. Every thread updates its own shard of the
+# registry (no lock on the request path); collect() merges the shards. Each process also dumps
+# its totals to METRICS_DIR so the /metrics endpoint can add up every worker of the server.
+
+# Latency histogram bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds between two dumps of a process's metrics to METRICS_DIR
+METRICS_DUMP_INTERVAL = 5
+
+# name -> (type, help)
+METRICS = {
+    'freeflow_http_requests_total': ('counter', "Requests served, by URL name and status class."),
+    'freeflow_http_request_errors_total': ('counter', "Requests answered with a 5xx status, by URL name."),
+    'freeflow_http_request_duration_seconds': ('histogram', "Request latency, by URL name."),
+    'freeflow_http_response_bytes_total': ('counter', "Response body bytes (streamed bodies not included), by URL name."),
+    'freeflow_db_queries_total': ('counter', "Database statements run, by URL name."),
+    'freeflow_db_query_seconds_total': ('counter', "Time spent in database statements, by URL name."),
+    'freeflow_query_budget_exceeded_total': ('counter', "Requests that ran more queries than their budget, by URL name."),
+    'freeflow_cache_requests_total': ('counter', "Cache lookups by result (hit or miss)."),
+    'freeflow_db_connections_opened_total': ('counter', "Database connections opened."),
+    'freeflow_db_connections_open': ('gauge', "Database connections currently open, by process."),
+}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock() # Only taken when a thread registers its shard
+        self._shards = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = ({}, {}) # counters, histograms
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        """labels: tuple of (name, value) pairs, always in the same order for a metric."""
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        histograms = self._shard()[1]
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # One count per bucket, one for +Inf, then the sum
+            histogram = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    def collect(self):
+        """(counters, histograms) summed over every thread of this process."""
+        with self._lock:
+            shards = list(self._shards)
+        counters, histograms = {}, {}
+        for shard_counters, shard_histograms in shards:
+            for key, value in shard_counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, histogram in shard_histograms.copy().items():
+                total = histograms.setdefault(key, [0] * len(histogram))
+                for i, value in enumerate(histogram):
+                    total[i] += value
+        return counters, histograms
+
+
+registry = MetricsRegistry()
+
+
+def process_metrics():
+    """This process's metrics as a JSON-able dict."""
+    from .db_connections import connection_stats
+
+    counters, histograms = registry.collect()
+    stats = connection_stats.snapshot()
+    counters[('freeflow_db_connections_opened_total', ())] = stats['connections_opened_total']
+    return {
+        'pid': os.getpid(),
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, histogram] for (name, labels), histogram in histograms.items()],
+        'gauges': [['freeflow_db_connections_open', [['pid', str(os.getpid())]], stats['open_connections']]],
+    }
+
+
+def metrics_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'{pid}.json')
+
+
+def dump_process_metrics():
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = metrics_path(os.getpid())
+    # A temp file of its own (not *.json, so merged_metrics() skips it): two dumps never share one
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=settings.METRICS_DIR)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(process_metrics(), f)
+        os.replace(tmp_path, path) # Readers never see a half-written file
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merged_metrics():
+    """
+    Metrics of every process that dumped to METRICS_DIR, this one read live. Counters and
+    histograms of exited processes still count (they are totals); their gauges are dropped.
+    """
+    snapshots = [process_metrics()]
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        try:
+            pid = int(os.path.basename(path)[:-5])
+            if pid == os.getpid():
+                continue
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (ValueError, OSError):
+            continue
+        if not process_alive(pid):
+            snapshot['gauges'] = []
+        snapshots.append(snapshot)
+
+    counters, histograms, gauges = {}, {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, histogram in snapshot['histograms']:
+            total = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(histogram))
+            for i, value in enumerate(histogram):
+                total[i] += value
+        for name, labels, value in snapshot['gauges']:
+            gauges[(name, tuple(map(tuple, labels)))] = value
+    return counters, histograms, gauges
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus(counters, histograms, gauges):
+    """Prometheus text exposition format (version 0.0.4)."""
+    series = {}
+    for (name, labels), value in sorted(list(counters.items()) + list(gauges.items())):
+        series.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+    for (name, labels), histogram in sorted(histograms.items()):
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {histogram[-1]}")
+        lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+    output = []
+    for name, (metric_type, help_text) in METRICS.items():
+        if name in series:
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(series[name])
+    return '\n'.join(output) + '\n'
+
+
+@atexit.register
+def _dump_at_exit():
+    # Keep the totals of a worker that is recycled between two periodic dumps
+    if settings.configured and settings.METRICS_DIR:
+        try:
+            dump_process_metrics()
+        except OSError:
+            pass
+
+
+class MetricsMiddleware:
+    """Request count, 5xx count and latency histogram per URL name; dumps the process totals every few seconds."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._next_dump = 0
+        self._dump_lock = threading.Lock()
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = (('view', match.view_name if match else 'unresolved'),)
+        registry.inc('freeflow_http_requests_total', view + (('status', f'{response.status_code // 100}xx'),))
+        if response.status_code >= 500:
+            registry.inc('freeflow_http_request_errors_total', view)
+        registry.observe('freeflow_http_request_duration_seconds', view, duration)
+
+        now = time.monotonic()
+        # Unlocked peek first; the lock makes one of the threads that see it due do the dump
+        if now >= self._next_dump and self._dump_lock.acquire(blocking=False):
+            try:
+                if now >= self._next_dump:
+                    self._next_dump = now + METRICS_DUMP_INTERVAL
+                    dump_process_metrics()
+            except OSError:
+                pass # Metrics must never fail a request
+            finally:
+                self._dump_lock.release()
+        return response
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from .models import Playlist
+from .db_router import PRIMARY_COOKIE, pin_to_primary, replica_configured, unpin
+from .versions import bump_version, get_version
+
+# Where the user context is kept inside the session
+USER_CONTEXT_SESSION_KEY = '_user_context'
+# Per-user version stamp in the shared cache, bumped by invalidate_user_context()
+USER_CONTEXT_VERSION_KEY = 'user_context_version:{}'
+
+ANONYMOUS_CONTEXT = {
+    'is_authenticated': False,
+    'is_superuser': False,
+    'username': None,
+    'listeningto': None,
+    'userid': None,
+    'icon_url': None,
+    'playlists': [],
+}
+
+
+def load_user_context(user_id):
+    """Load the profile fields and playlist summary used by the page templates and API views."""
+    context = dict(ANONYMOUS_CONTEXT)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT is_superuser, username, listeningto, userid, icon_url FROM auth_user WHERE id=%s", [user_id])
+        row = cursor.fetchone()
+        if not row:
+            return context
+        context.update({
+            'is_authenticated': True,
+            'is_superuser': bool(row[0]),
+            'username': row[1],
+            'listeningto': row[2],
+            'userid': row[3],
+            'icon_url': row[4],
+        })
+        cursor.execute("SELECT playlist_id, name, cover_image_url FROM playlists WHERE owner_user_id=%s", [user_id])
+        # Lists (not tuples) so the context survives the JSON session serializer unchanged
+        context['playlists'] = [list(p) for p in cursor.fetchall()]
+    return context
+
+
+def get_user_context(request):
+    """
+    Return the user context for this request, from the session when its version is current,
+    otherwise from the database (and store it back in the session).
+    """
+    user_id = request.session.get('_auth_user_id')
+    if not user_id:
+        return dict(ANONYMOUS_CONTEXT)
+
+    version = get_version(USER_CONTEXT_VERSION_KEY.format(user_id))
+    cached = request.session.get(USER_CONTEXT_SESSION_KEY)
+    if cached and cached.get('user_id') == user_id and cached.get('version') == version:
+        return cached['data']
+
+    context = load_user_context(user_id)
+    request.session[USER_CONTEXT_SESSION_KEY] = {'user_id': user_id, 'version': version, 'data': context}
+    return context
+
+
+def invalidate_user_context(user_id):
+    """Force every session of this user to reload its context on the next request."""
+    bump_version(USER_CONTEXT_VERSION_KEY.format(user_id))
+
+
+def user_owns_playlist(request, playlist_id):
+    """
+    Ownership check against the cached playlist summary (no query on a warm session). A playlist
+    missing from it is looked up by primary key: the summary may predate a change made elsewhere.
+    """
+    try:
+        playlist_id = int(playlist_id)
+    except (TypeError, ValueError):
+        return False
+    if any(p[0] == playlist_id for p in request.user_context['playlists']):
+        return True
+    user_id = request.session.get('_auth_user_id')
+    return bool(user_id) and Playlist.objects.filter(pk=playlist_id, owner_user_id=user_id).exists()
+
+
+class UserContextMiddleware:
+    """
+    Attach request.user_context: the logged-in user's profile and playlist summary,
+    loaded at most once per request and cached in the session between requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Lazy so API views that never touch it don't pay for the version lookup
+        request.user_context = SimpleLazyObject(lambda: get_user_context(request))
+        return self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes for the replica router: a request that may write (unsafe method) reads the
+    primary, and so do the same browser's requests for the next REPLICA_LAG seconds.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        token = pin_to_primary(writes or PRIMARY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            unpin(token)
+        if writes and replica_configured():
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=settings.REPLICA_LAG, httponly=True, samesite='Lax')
+        return response
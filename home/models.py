@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Now
 from django.templatetags.static import static # Needed for default image path
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
@@ -122,16 +123,57 @@ class PlaylistTrack(models.Model):
     id = models.AutoField(primary_key=True)
     playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, db_column='playlistid')
     track = models.ForeignKey('Track', on_delete=models.CASCADE, db_column='tracks')
+    # Fractional rank within the playlist, see home/playlist_positions.py
+    position = models.FloatField(default=0)
 
     class Meta:
         db_table = 'playlisttracks'
         managed = False
         unique_together = ('playlist', 'track')
+        indexes = [models.Index(fields=['playlist', 'position'], name='playlisttracks_pl_pos')]
+
+class TrackArtist(models.Model):
+    """
+    Normalized track credits: one row per artist of a track, position 1 being the primary artist.
+    The artist_name columns on Track stay as the display copy; lookups by artist go through this table.
+    """
+    id = models.AutoField(primary_key=True)
+    # The (track, position) unique index covers lookups by track, (artist, track) covers lookups by artist
+    track = models.ForeignKey('Track', on_delete=models.CASCADE, db_column='track_id', db_index=False, related_name='track_artists')
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, db_column='artist_id', db_index=False, related_name='track_artists')
+    position = models.PositiveSmallIntegerField() # 1 = primary, 2 and 3 = featured
+
+    class Meta:
+        db_table = 'track_artists'
+        managed = False # Created by the backfill_track_artists command
+        unique_together = ('track', 'position')
+        indexes = [models.Index(fields=['artist', 'track'], name='track_artists_artist_track')]
 
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
 from django.db import models
 
+class CatalogImport(models.Model):
+    """
+    Checkpoint of a bulk catalog import (home/catalog_ingest.py), updated in the transaction of
+    every batch so an interrupted import resumes after the last committed record.
+    """
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=255, unique=True) # File name and content hash unless given
+    records_done = models.PositiveIntegerField(default=0) # Records read, skipped ones included
+    tracks_created = models.PositiveIntegerField(default=0)
+    albums_created = models.PositiveIntegerField(default=0)
+    artists_created = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'catalog_imports'
+        managed = False # Created by the ingest_catalog command
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, username, email, password=None, **extra_fields):
         if not username:
@@ -194,8 +236,9 @@ class Friendship(models.Model):
         choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected')],
         default='pending'
     )
-    created_at = models.DateTimeField(auto_now_add=True) # Use auto_now_add for creation timestamp
-    updated_at = models.DateTimeField(auto_now=True) # Use auto_now for update timestamp
+    # db_default: the raw SQL INSERTs in home/views.py leave both to the table's DEFAULT CURRENT_TIMESTAMP
+    created_at = models.DateTimeField(auto_now_add=True, db_default=Now()) # Use auto_now_add for creation timestamp
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now()) # Use auto_now for update timestamp
 
     class Meta:
         db_table = 'friendships'
@@ -205,6 +248,24 @@ class Friendship(models.Model):
     def __str__(self):
         return f"{self.user1.username} -> {self.user2.username} ({self.status})"
 
+class FriendEdge(models.Model):
+    """
+    Accepted friendships stored once per direction, so "friends of X" is one range scan on
+    (user_id, status) instead of an OR over user1_id/user2_id. Written next to friendships
+    in the same transaction, see home/friend_edges.py.
+    """
+    id = models.AutoField(primary_key=True)
+    # (user, status, friend) serves friend lists, the unique (user, friend) index point lookups and deletes
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_column='user_id', db_index=False, related_name='friend_edges')
+    friend = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_column='friend_id', related_name='+')
+    status = models.CharField(max_length=10, default='accepted')
+
+    class Meta:
+        db_table = 'friend_edges'
+        managed = False # Created by the backfill_friend_edges command
+        unique_together = ('user', 'friend')
+        indexes = [models.Index(fields=['user', 'status', 'friend'], name='friend_edges_user_status')]
+
 class BlockedUser(models.Model):
     block_id = models.AutoField(primary_key=True)
     blocker = models.ForeignKey(
@@ -219,7 +280,7 @@ class BlockedUser(models.Model):
         related_name='blocked_by', # Users who have blocked this user
         db_column='blocked_id'
     )
-    created_at = models.DateTimeField(auto_now_add=True) # Use auto_now_add
+    created_at = models.DateTimeField(auto_now_add=True, db_default=Now()) # Use auto_now_add
     reason = models.CharField(max_length=255, null=True, blank=True)
 
     class Meta:
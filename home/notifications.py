@@ -0,0 +1,42 @@
+from django.db import connection
+
+# Notifications are the friend requests a user received. The cursor is friend_requests.id,
+# which only grows, so "anything new?" is "any request for me with id > cursor".
+# Longest long-poll wait (seconds) and how often a waiting request re-reads the cursor
+NOTIFICATION_MAX_WAIT = 25
+NOTIFICATION_POLL_INTERVAL = 1
+
+
+def fetch_notifications(user_id, since=None):
+    """
+    Friend requests received by user_id with id > since, oldest first, with their sender
+    in the same query. Returns (notifications, cursor to pass as since next time).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT fr.id, u.username, u.userid, u.icon_url
+            FROM friend_requests fr
+            JOIN auth_user u ON u.id = fr.sender_id
+            WHERE fr.recipient_id = %s AND fr.id > %s
+            ORDER BY fr.id
+        """, [user_id, since or 0])
+        notifications = [{
+            'type': 'request',
+            'request_id': row[0],
+            'sender_username': row[1],
+            'sender_userid': row[2],
+            'sender_icon_url': row[3],
+            'message': f"{row[1]} sent you a friend request.",
+        } for row in cursor.fetchall()]
+    cursor_id = notifications[-1]['request_id'] if notifications else (since or 0)
+    return notifications, cursor_id
+
+
+def latest_notification_id(user_id):
+    """
+    Newest friend request id for user_id (0 if none). One MAX() on the recipient index, read from the
+    database rather than a cache so a request inserted by any worker ends every waiting long-poll.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT MAX(id) FROM friend_requests WHERE recipient_id = %s", [user_id])
+        return cursor.fetchone()[0] or 0
@@ -0,0 +1,123 @@
+from django.db import connection, transaction
+
+from .models import PlaylistTrack
+
+# Playlist order is stored as a fractional rank in playlisttracks.position (DOUBLE).
+# Rows are spaced POSITION_GAP apart; moving a track writes the midpoint of its new
+# neighbours, so a reorder updates exactly one row whatever the playlist length.
+POSITION_GAP = 1024.0
+# Below this gap a playlist is picked up by rebalance_playlist_positions (about 20 halvings,
+# far from the precision limit of a double)
+REBALANCE_GAP = 1e-3
+
+
+def position_column_exists():
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_table_description(cursor, PlaylistTrack._meta.db_table)
+    return any(column.name == 'position' for column in columns)
+
+
+def add_position_column():
+    """Add playlisttracks.position and the (playlistid, position) index (the model is unmanaged, so no migration does it)."""
+    with connection.schema_editor() as schema_editor:
+        schema_editor.add_field(PlaylistTrack, PlaylistTrack._meta.get_field('position'))
+    # Some backends rebuild the table (and its Meta indexes) in add_field, others don't
+    with connection.cursor() as cursor:
+        existing = connection.introspection.get_constraints(cursor, PlaylistTrack._meta.db_table)
+    with connection.schema_editor() as schema_editor:
+        for index in PlaylistTrack._meta.indexes:
+            if index.name not in existing:
+                schema_editor.add_index(PlaylistTrack, index)
+
+
+def append_position_sql():
+    """
+    INSERT ... SELECT appending a track after the current last one of a playlist.
+    Parameters: playlist_id, track_id, playlist_id. The MAX() is one lookup on the index.
+    """
+    return (
+        "INSERT INTO playlisttracks (playlistid, tracks, position) "
+        f"SELECT %s, %s, COALESCE(MAX(position), 0) + {POSITION_GAP} FROM playlisttracks WHERE playlistid=%s"
+    )
+
+
+def next_positions(cursor, playlist_id, count):
+    """count positions after the current last track of the playlist."""
+    cursor.execute("SELECT COALESCE(MAX(position), 0) FROM playlisttracks WHERE playlistid=%s", [playlist_id])
+    last = cursor.fetchone()[0]
+    return [last + POSITION_GAP * (i + 1) for i in range(count)]
+
+
+def rebalance_playlist(playlist_id):
+    """Respace every track of a playlist POSITION_GAP apart, keeping the current order."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM playlisttracks WHERE playlistid=%s ORDER BY position, id", [playlist_id]
+        )
+        rows = [((i + 1) * POSITION_GAP, row[0]) for i, row in enumerate(cursor.fetchall())]
+        cursor.executemany("UPDATE playlisttracks SET position=%s WHERE id=%s", rows)
+    return len(rows)
+
+
+def playlists_to_rebalance():
+    """Ids of the playlists with two neighbouring tracks less than REBALANCE_GAP apart (one scan of the index)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT playlistid FROM ("
+            "SELECT playlistid, position - LAG(position) OVER (PARTITION BY playlistid ORDER BY position) AS gap "
+            "FROM playlisttracks) gaps WHERE gap < %s ORDER BY playlistid",
+            [REBALANCE_GAP]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def move_track(playlist_id, track_id, after_track_id=None):
+    """
+    Move track_id right after after_track_id (to the top when None) with a single-row UPDATE.
+    Returns False when one of the tracks is not in the playlist.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, position FROM playlisttracks WHERE playlistid=%s AND tracks=%s", [playlist_id, track_id]
+        )
+        moving = cursor.fetchone()
+        if not moving:
+            return False
+
+        if after_track_id is None:
+            # Top of the playlist: before the current first track
+            cursor.execute(
+                "SELECT MIN(position) FROM playlisttracks WHERE playlistid=%s AND id<>%s", [playlist_id, moving[0]]
+            )
+            first = cursor.fetchone()[0]
+            lower, upper = None, first
+        else:
+            cursor.execute(
+                "SELECT position FROM playlisttracks WHERE playlistid=%s AND tracks=%s", [playlist_id, after_track_id]
+            )
+            row = cursor.fetchone()
+            if not row:
+                return False
+            lower = row[0]
+            # Next neighbour on the (playlistid, position) index
+            cursor.execute(
+                "SELECT MIN(position) FROM playlisttracks WHERE playlistid=%s AND position>%s AND id<>%s",
+                [playlist_id, lower, moving[0]]
+            )
+            upper = cursor.fetchone()[0]
+
+        if lower is None and upper is None:
+            return True # Only track in the playlist
+        if lower is None:
+            position = upper - POSITION_GAP
+        elif upper is None:
+            position = lower + POSITION_GAP
+        else:
+            position = (lower + upper) / 2
+            if not lower < position < upper:
+                # Out of precision between the two neighbours: respace the playlist and retry
+                rebalance_playlist(playlist_id)
+                return move_track(playlist_id, track_id, after_track_id)
+
+        cursor.execute("UPDATE playlisttracks SET position=%s WHERE id=%s", [position, moving[0]])
+    return True
@@ -0,0 +1,181 @@
+from django.db import connection, transaction
+
+from .models import Playlist
+from .playlist_positions import POSITION_GAP, next_positions
+
+# Most playlists one batch request may ask for
+PLAYLIST_BATCH_MAX = 50
+# Most add/remove operations one bulk update may carry
+PLAYLIST_BULK_MAX_OPERATIONS = 500
+
+
+def parse_playlist_ids(value):
+    """'3,1,3,7' -> [3, 1, 7]; raises ValueError on anything that is not a non-empty id list."""
+    playlist_ids = []
+    for part in (value or '').split(','):
+        try:
+            playlist_id = int(part)
+        except ValueError:
+            raise ValueError("Invalid playlist ids")
+        if playlist_id not in playlist_ids:
+            playlist_ids.append(playlist_id)
+    if len(playlist_ids) > PLAYLIST_BATCH_MAX:
+        raise ValueError(f"At most {PLAYLIST_BATCH_MAX} playlists per request")
+    return playlist_ids
+
+
+def fetch_playlists(playlist_ids):
+    """
+    Playlist, owner and tracks of every playlist in playlist_ids with one joined query.
+    Returns {playlist_id: payload}; unknown ids are missing from the result.
+    """
+    if not playlist_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(playlist_ids))
+    with connection.cursor() as cursor:
+        # LEFT JOINs so empty playlists still come back (with NULL track columns)
+        cursor.execute(f"""
+            SELECT p.playlist_id, p.name, p.cover_image_url, p.owner_user_id, u.username,
+                   t.track_id, t.title, t.file_url, t.track_img_url, t.artist_name, t.album_id, a.title
+            FROM playlists p
+            LEFT JOIN auth_user u ON u.id = p.owner_user_id
+            LEFT JOIN playlisttracks pt ON pt.playlistid = p.playlist_id
+            LEFT JOIN tracks t ON t.track_id = pt.tracks
+            LEFT JOIN albums a ON a.album_id = t.album_id
+            WHERE p.playlist_id IN ({placeholders})
+            ORDER BY p.playlist_id, pt.position, pt.id
+        """, list(playlist_ids))
+        playlists = {}
+        for row in cursor.fetchall():
+            playlist = playlists.get(row[0])
+            if playlist is None:
+                playlist = playlists[row[0]] = {
+                    'playlist_id': row[0],
+                    'name': row[1],
+                    'cover_image_url': row[2],
+                    'owner_user_id': row[3],
+                    'owner_username': row[4] or 'Unknown',
+                    'tracks': [],
+                }
+            if row[5] is not None:
+                playlist['tracks'].append({
+                    'id': row[5], # Match the key expected by frontend ('track.id')
+                    'title': row[6],
+                    'file_url': row[7],
+                    'image_url': row[8],
+                    'artist_name': row[9],
+                    'album_id': row[10],
+                    'album_title': row[11],
+                })
+    return playlists
+
+
+def plan_playlist_operations(current_track_ids, operations):
+    """
+    Net effect of an ordered list of {'op': 'add'|'remove', 'track_id': id} on a playlist holding
+    current_track_ids. Returns (track ids to insert in order, track ids to delete).
+    Adding a track already in the playlist or removing one that is not there is a no-op.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations must be a non-empty list")
+    if len(operations) > PLAYLIST_BULK_MAX_OPERATIONS:
+        raise ValueError(f"At most {PLAYLIST_BULK_MAX_OPERATIONS} operations per request")
+
+    members = dict.fromkeys(current_track_ids) # Ordered set
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in ('add', 'remove'):
+            raise ValueError("Each operation needs op 'add' or 'remove'")
+        try:
+            track_id = int(operation.get('track_id'))
+        except (TypeError, ValueError):
+            raise ValueError("Each operation needs a numeric track_id")
+        if operation['op'] == 'add':
+            members.setdefault(track_id)
+        else:
+            members.pop(track_id, None)
+
+    current = set(current_track_ids)
+    to_insert = [track_id for track_id in members if track_id not in current]
+    to_delete = [track_id for track_id in current_track_ids if track_id not in members]
+    return to_insert, to_delete
+
+
+def apply_playlist_operations(playlist_id, operations):
+    """
+    Apply add/remove operations to a playlist in one transaction: one read of the current
+    tracks, one multi-row INSERT (appending in order) and one DELETE. The caller checks ownership.
+    Returns (added, removed) counts; raises ValueError for invalid operations or unknown tracks.
+    """
+    with transaction.atomic():
+        # Serialize concurrent bulk updates of the same playlist (no-op on backends without row locks)
+        Playlist.objects.select_for_update().filter(pk=playlist_id).exists()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tracks FROM playlisttracks WHERE playlistid=%s ORDER BY position, id", [playlist_id])
+            current_track_ids = [row[0] for row in cursor.fetchall()]
+            to_insert, to_delete = plan_playlist_operations(current_track_ids, operations)
+
+            if to_insert:
+                placeholders = ', '.join(['%s'] * len(to_insert))
+                cursor.execute(f"SELECT track_id FROM tracks WHERE track_id IN ({placeholders})", to_insert)
+                unknown = set(to_insert) - {row[0] for row in cursor.fetchall()}
+                if unknown:
+                    raise ValueError(f"Unknown track ids: {sorted(unknown)}")
+                # Appended after the current last track; executemany becomes a single multi-row INSERT on MySQL
+                positions = next_positions(cursor, playlist_id, len(to_insert))
+                cursor.executemany(
+                    "INSERT INTO playlisttracks (playlistid, tracks, position) VALUES (%s, %s, %s)",
+                    [(playlist_id, track_id, position) for track_id, position in zip(to_insert, positions)]
+                )
+            if to_delete:
+                placeholders = ', '.join(['%s'] * len(to_delete))
+                cursor.execute(
+                    f"DELETE FROM playlisttracks WHERE playlistid=%s AND tracks IN ({placeholders})",
+                    [playlist_id] + to_delete
+                )
+    return len(to_insert), len(to_delete)
+
+
+def create_playlist_from_album(album, owner_user_id):
+    """
+    New playlist holding every track of the album in album order, owned by owner_user_id.
+    The track links are copied with one INSERT ... SELECT. Returns (playlist, track count).
+    """
+    with transaction.atomic():
+        playlist = Playlist.objects.create(
+            owner_user_id=owner_user_id,
+            name=f"{album.title} (Clone)",
+            cover_image_url=album.cover_image_url,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO playlisttracks (playlistid, tracks, position) "
+                "SELECT %s, track_id, track_id * %s FROM tracks WHERE album_id=%s",
+                [playlist.pk, POSITION_GAP, album.pk]
+            )
+            track_count = cursor.rowcount
+    return playlist, track_count
+
+
+def duplicate_playlist(playlist_id, owner_user_id, name=None):
+    """
+    Copy a playlist (name, cover, tracks and their order) into a new playlist owned by owner_user_id.
+    The track links are copied with one INSERT ... SELECT. Returns (playlist, track count), or (None, 0)
+    when there is no such playlist.
+    """
+    source = Playlist.objects.filter(pk=playlist_id).only('name', 'cover_image_url').first()
+    if source is None:
+        return None, 0
+    with transaction.atomic():
+        playlist = Playlist.objects.create(
+            owner_user_id=owner_user_id,
+            name=name or f"{source.name or 'Playlist'} (Copy)",
+            cover_image_url=source.cover_image_url,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO playlisttracks (playlistid, tracks, position) "
+                "SELECT %s, tracks, position FROM playlisttracks WHERE playlistid=%s",
+                [playlist.pk, source.pk]
+            )
+            track_count = cursor.rowcount
+    return playlist, track_count
@@ -0,0 +1,186 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .events import publish_listening
+
+logger = logging.getLogger(__name__)
+
+# "Listening to" lives in a presence store and is written to auth_user.listeningto in batches,
+# so a track change costs a dict/Redis write instead of an UPDATE on the user table.
+# Users missing from the store (new process, nothing played yet) fall back to the column.
+PRESENCE_FLUSH_INTERVAL = getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 30)
+# Most rows per UPDATE statement
+PRESENCE_FLUSH_BATCH = 500
+
+
+class MemoryPresenceBackend:
+    """Per-process store: fastest, but each worker only sees the changes it received itself."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._dirty = set()
+
+    def set(self, user_id, value):
+        with self._lock:
+            self._values[user_id] = value
+            self._dirty.add(user_id)
+
+    def get_many(self, user_ids):
+        with self._lock:
+            return {user_id: self._values[user_id] for user_id in user_ids if user_id in self._values}
+
+    def take_dirty(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def mark_dirty(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_ids)
+
+
+class RedisPresenceBackend:
+    """
+    Store shared by every process, in a Redis hash plus a set of users not flushed yet.
+    client is any object with the redis-py API (e.g. fakeredis in tests); by default one
+    is built from url, which needs the redis package.
+    """
+
+    VALUES_KEY = 'presence:listeningto'
+    DIRTY_KEY = 'presence:dirty'
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            import redis # Optional dependency, only needed for this backend
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+
+    def set(self, user_id, value):
+        pipe = self.client.pipeline()
+        pipe.hset(self.VALUES_KEY, user_id, value)
+        pipe.sadd(self.DIRTY_KEY, user_id)
+        pipe.execute()
+
+    def get_many(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        values = self.client.hmget(self.VALUES_KEY, user_ids)
+        return {user_id: value for user_id, value in zip(user_ids, values) if value is not None}
+
+    def take_dirty(self):
+        # MULTI/EXEC so two processes flushing at once never both take the same users
+        pipe = self.client.pipeline()
+        pipe.smembers(self.DIRTY_KEY)
+        pipe.delete(self.DIRTY_KEY)
+        dirty, _ = pipe.execute()
+        return {int(user_id) for user_id in dirty}
+
+    def mark_dirty(self, user_ids):
+        if user_ids:
+            self.client.sadd(self.DIRTY_KEY, *user_ids)
+
+
+def make_presence_backend():
+    backend = getattr(settings, 'PRESENCE_BACKEND', 'memory')
+    if backend == 'memory':
+        return MemoryPresenceBackend()
+    if backend == 'redis':
+        return RedisPresenceBackend(settings.PRESENCE_REDIS_URL)
+    raise ValueError(f"Unknown PRESENCE_BACKEND {backend!r}")
+
+
+class PresenceStore:
+    """
+    Listening state of every user, flushed to auth_user.listeningto every flush_interval
+    seconds by a background thread (and at process exit).
+    """
+
+    def __init__(self, backend=None, flush_interval=PRESENCE_FLUSH_INTERVAL):
+        self._backend = backend
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    @property
+    def backend(self):
+        # Built on first use so settings are read after Django is configured
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = make_presence_backend()
+        return self._backend
+
+    def set_listening(self, user_id, listeningto):
+        self.backend.set(int(user_id), listeningto or '')
+        publish_listening(user_id, listeningto or '')
+        self._start_flusher()
+
+    def get_listening(self, user_ids):
+        """{user_id: listeningto} for the users the store knows about."""
+        return self.backend.get_many([int(user_id) for user_id in user_ids])
+
+    def _start_flusher(self):
+        # One timer thread per process, started by the first change (a forked worker starts its own)
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='presence-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Presence flush failed")
+            finally:
+                connection.close() # This thread's own connection
+
+    def flush(self):
+        """
+        Write every changed user to auth_user, one UPDATE per PRESENCE_FLUSH_BATCH users, all in
+        one transaction. Returns the number of users written.
+        """
+        dirty = self.backend.take_dirty()
+        if not dirty:
+            return 0
+        rows = sorted(self.backend.get_many(dirty).items())
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                for i in range(0, len(rows), PRESENCE_FLUSH_BATCH):
+                    batch = rows[i:i + PRESENCE_FLUSH_BATCH]
+                    cursor.execute(
+                        "UPDATE auth_user SET listeningto = CASE id "
+                        + "WHEN %s THEN %s " * len(batch)
+                        + f"END WHERE id IN ({', '.join(['%s'] * len(batch))})",
+                        [param for row in batch for param in row] + [user_id for user_id, _ in batch]
+                    )
+        except Exception:
+            # Keep them for the next flush
+            self.backend.mark_dirty(dirty)
+            raise
+        return len(rows)
+
+
+presence_store = PresenceStore()
+
+
+@atexit.register
+def _flush_at_exit():
+    # Only matters for the memory backend, where unflushed changes die with the process
+    if isinstance(presence_store._backend, MemoryPresenceBackend):
+        try:
+            presence_store.flush()
+        except Exception:
+            logger.exception("Presence flush at exit failed")
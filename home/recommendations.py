@@ -0,0 +1,70 @@
+import random
+import threading
+import time
+from array import array
+
+from .models import Track
+
+# How often each process reloads the list of eligible track ids
+SAMPLING_INDEX_REFRESH = 10 * 60
+
+
+class SamplingIndex:
+    """
+    Compact array of every track id that can be recommended, plus a seeded sampler.
+
+    Replaces ORDER BY RAND(): the ids are loaded with one index-only scan every few
+    minutes, and drawing k tracks is O(k) in memory followed by a primary-key fetch.
+    """
+
+    def __init__(self, refresh_interval=SAMPLING_INDEX_REFRESH):
+        self.refresh_interval = refresh_interval
+        self._track_ids = array('l')
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        track_ids = array('l')
+        eligible = Track.objects.exclude(file_url__isnull=True).exclude(file_url='')
+        for track_id in eligible.values_list('track_id', flat=True).iterator(chunk_size=5000):
+            track_ids.append(track_id)
+        return track_ids
+
+    def track_ids(self):
+        """Return the id array, reloading it when it is older than refresh_interval."""
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > self.refresh_interval:
+            with self._lock:
+                # Another thread may have refreshed while we waited for the lock
+                if self._built_at is None or time.monotonic() - self._built_at > self.refresh_interval:
+                    self._track_ids = self._load()
+                    self._built_at = time.monotonic()
+        return self._track_ids
+
+    def invalidate(self):
+        self._built_at = None
+
+    def sample(self, k, seed=None):
+        """Draw up to k distinct track ids. The same seed gives the same draw for the same index."""
+        track_ids = self.track_ids()
+        rng = random.Random(seed)
+        # random.sample over a range only touches the k positions it picks
+        positions = rng.sample(range(len(track_ids)), min(k, len(track_ids)))
+        return [track_ids[i] for i in positions]
+
+
+sampling_index = SamplingIndex()
+
+
+def sample_track_ids(k, seed=None):
+    return sampling_index.sample(k, seed)
+
+
+def fetch_tracks_in_order(track_ids):
+    """Fetch tracks by primary key and return them in the order of track_ids (missing ids are skipped)."""
+    tracks = Track.objects.select_related('album').in_bulk(track_ids)
+    return [tracks[track_id] for track_id in track_ids if track_id in tracks]
+
+
+def invalidate_recommendations():
+    sampling_index.invalidate()
@@ -0,0 +1,15 @@
+from django.db import connection
+
+
+def create_model_cascading(model):
+    """
+    Create the table of an unmanaged model with ON DELETE CASCADE on its foreign keys. Django writes
+    foreign keys without an ON DELETE action, so a raw DELETE of a referenced row would fail instead.
+    """
+    with connection.schema_editor() as schema_editor:
+        # Backends use either the ALTER TABLE form (MySQL) or the inline REFERENCES one (SQLite)
+        for template in ('sql_create_fk', 'sql_create_inline_fk'):
+            sql = getattr(schema_editor, template)
+            if sql:
+                setattr(schema_editor, template, sql.replace('(%(to_column)s)', '(%(to_column)s) ON DELETE CASCADE'))
+        schema_editor.create_model(model)
@@ -0,0 +1,293 @@
+import heapq
+import logging
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db import connection
+
+from .models import Album, Artist, Track
+from .versions import catalog_version
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Field weights: a hit in a track title counts more than a hit in a featured artist
+TITLE_WEIGHT = 4
+PRIMARY_ARTIST_WEIGHT = 3
+OTHER_ARTIST_WEIGHT = 2
+NAME_WEIGHT = 4
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'Beyoncé' and 'beyonce' index the same."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+class _DocIndex:
+    """Inverted index for one document type: token -> {doc_id: weight}."""
+
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = [] # Sorted tokens, for prefix lookups with bisect
+        self.doc_tokens = {}
+        # False while a full build appends tokens unsorted; sort_vocabulary() ends it
+        self.vocabulary_sorted = False
+
+    def add(self, doc_id, fields):
+        self.remove(doc_id)
+        tokens = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                tokens[token] = max(tokens.get(token, 0), weight)
+        self.doc_tokens[doc_id] = tokens
+        for token, weight in tokens.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if self.vocabulary_sorted:
+                    insort(self.vocabulary, token)
+                else:
+                    self.vocabulary.append(token)
+            posting[doc_id] = weight
+
+    def sort_vocabulary(self):
+        """End of a full build: one sort instead of an insort per new token."""
+        self.vocabulary.sort()
+        self.vocabulary_sorted = True
+
+    def remove(self, doc_id):
+        for token in self.doc_tokens.pop(doc_id, ()):
+            posting = self.postings[token]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[token]
+                if self.vocabulary_sorted:
+                    del self.vocabulary[bisect_left(self.vocabulary, token)]
+                else:
+                    self.vocabulary.remove(token)
+
+    def _matches(self, token):
+        """doc_id -> score for documents with a token starting with `token` (whole-token hits score double)."""
+        matches = {}
+        vocabulary = self.vocabulary
+        i = bisect_left(vocabulary, token)
+        while i < len(vocabulary) and vocabulary[i].startswith(token):
+            exact = vocabulary[i] == token
+            for doc_id, weight in self.postings[vocabulary[i]].items():
+                score = weight * 2 if exact else weight
+                if score > matches.get(doc_id, 0):
+                    matches[doc_id] = score
+            i += 1
+        return matches
+
+    def search(self, query_tokens, limit):
+        """Ids of the `limit` best documents matching every query token, best first."""
+        if not query_tokens:
+            return []
+        # Intersect from the most selective token so the candidate set stays small
+        matches = sorted((self._matches(token) for token in query_tokens), key=len)
+        scores = matches[0]
+        for other in matches[1:]:
+            scores = {doc_id: score + other[doc_id] for doc_id, score in scores.items() if doc_id in other}
+            if not scores:
+                return []
+        return heapq.nlargest(limit, scores, key=lambda doc_id: (scores[doc_id], -doc_id))
+
+
+def track_data(track):
+    return {
+        'id': track.track_id,
+        'title': track.title,
+        'artist_name': track.artist_name,
+        'artist_name2': track.artist_name2,
+        'artist_name3': track.artist_name3,
+        'file_url': track.file_url,
+        'track_img_url': track.track_image_url,
+        'album_id': track.album_id,
+    }
+
+
+def album_data(album):
+    return {'album_id': album.album_id, 'title': album.title, 'cover_image_url': album.cover_image_url}
+
+
+def artist_data(artist):
+    return {'artist_id': artist.artist_id, 'name': artist.name, 'artist_image_url': artist.artist_image_url}
+
+
+class _Snapshot:
+    """Everything the search index holds for one catalog version."""
+
+    def __init__(self, version):
+        self.version = version
+        self.tracks = _DocIndex()
+        self.albums = _DocIndex()
+        self.artists = _DocIndex()
+        self.track_data = {}
+        self.album_data = {}
+        self.artist_data = {}
+        self.album_tracks = defaultdict(set)
+
+    def put_track(self, data):
+        self.drop_track(data['id'])
+        self.track_data[data['id']] = data
+        self.tracks.add(data['id'], [
+            (data['title'], TITLE_WEIGHT),
+            (data['artist_name'], PRIMARY_ARTIST_WEIGHT),
+            (data['artist_name2'], OTHER_ARTIST_WEIGHT),
+            (data['artist_name3'], OTHER_ARTIST_WEIGHT),
+        ])
+        if data['album_id']:
+            self.album_tracks[data['album_id']].add(data['id'])
+
+    def drop_track(self, track_id):
+        old = self.track_data.pop(track_id, None)
+        if old and old['album_id']:
+            self.album_tracks[old['album_id']].discard(track_id)
+        self.tracks.remove(track_id)
+
+    def put_album(self, data):
+        self.album_data[data['album_id']] = data
+        self.albums.add(data['album_id'], [(data['title'], NAME_WEIGHT)])
+
+    def drop_album(self, album_id):
+        self.album_data.pop(album_id, None)
+        self.albums.remove(album_id)
+        # The album FK is SET_NULL, mirror that on the tracks we hold
+        for track_id in self.album_tracks.pop(album_id, ()):
+            if track_id in self.track_data:
+                self.track_data[track_id] = dict(self.track_data[track_id], album_id=None)
+
+    def put_artist(self, data):
+        self.artist_data[data['artist_id']] = data
+        self.artists.add(data['artist_id'], [(data['name'], NAME_WEIGHT)])
+
+    def drop_artist(self, artist_id):
+        self.artist_data.pop(artist_id, None)
+        self.artists.remove(artist_id)
+
+    def finish_build(self):
+        for index in (self.tracks, self.albums, self.artists):
+            index.sort_vocabulary()
+
+
+class SearchIndex:
+    """
+    In-process search over tracks, albums and artists.
+
+    Built from three queries the first time it is used, then kept current: dashboard
+    writes update it incrementally through apply_changes(), and a catalog version stamp
+    it did not see (a write handled by another process) triggers a rebuild in a background
+    thread while the previous snapshot keeps answering. Only the first build, with nothing
+    to answer from yet, makes a request wait.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.RLock()
+        self._rebuilding = False
+
+    def _build(self, version):
+        snapshot = _Snapshot(version)
+        for album in Album.objects.only('album_id', 'title', 'cover_image_url').iterator(chunk_size=2000):
+            snapshot.put_album(album_data(album))
+        for artist in Artist.objects.only('artist_id', 'name', 'artist_image_url').iterator(chunk_size=2000):
+            snapshot.put_artist(artist_data(artist))
+        for track in Track.objects.iterator(chunk_size=2000):
+            snapshot.put_track(track_data(track))
+        snapshot.finish_build()
+        return snapshot
+
+    def _rebuild(self, version):
+        try:
+            snapshot = self._build(version) # Without the lock: searches go on meanwhile
+            with self._lock:
+                self._snapshot = snapshot
+        except Exception:
+            logger.exception("Search index rebuild failed")
+        finally:
+            self._rebuilding = False
+            connection.close() # This thread's own connection
+
+    def build(self):
+        """Build a snapshot in this thread and wait for it (first use, tests)."""
+        snapshot = self._build(catalog_version())
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _current(self):
+        version = catalog_version()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._build(version)
+                return self._snapshot
+        if snapshot.version != version:
+            with self._lock:
+                if not self._rebuilding:
+                    self._rebuilding = True
+                    threading.Thread(target=self._rebuild, args=(version,), daemon=True).start()
+        return snapshot
+
+    def search_tracks(self, query, limit=10):
+        snapshot = self._current()
+        with self._lock:
+            ids = snapshot.tracks.search(tokenize(query), limit)
+            return [snapshot.track_data[track_id] for track_id in ids]
+
+    def search_albums(self, query, limit=10):
+        snapshot = self._current()
+        with self._lock:
+            ids = snapshot.albums.search(tokenize(query), limit)
+            return [snapshot.album_data[album_id] for album_id in ids]
+
+    def search_artists(self, query, limit=10):
+        snapshot = self._current()
+        with self._lock:
+            ids = snapshot.artists.search(tokenize(query), limit)
+            return [snapshot.artist_data[artist_id] for artist_id in ids]
+
+    def first_track(self, album_id):
+        """Lowest-id track of an album, or None."""
+        snapshot = self._current()
+        with self._lock:
+            track_ids = snapshot.album_tracks.get(album_id)
+            return snapshot.track_data[min(track_ids)] if track_ids else None
+
+    def apply_changes(self, previous_version, version, tracks=(), albums=(), artists=(),
+                      deleted_tracks=(), deleted_albums=(), deleted_artists=()):
+        """
+        Apply one dashboard write. Only possible when the index was at previous_version,
+        otherwise it missed another write and is left to rebuild on next use.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != previous_version:
+                return
+            for track_id in deleted_tracks:
+                snapshot.drop_track(track_id)
+            for album_id in deleted_albums:
+                snapshot.drop_album(album_id)
+            for artist_id in deleted_artists:
+                snapshot.drop_artist(artist_id)
+            for album in albums:
+                snapshot.put_album(album_data(album))
+            for artist in artists:
+                snapshot.put_artist(artist_data(artist))
+            for track in tracks:
+                snapshot.put_track(track_data(track))
+            snapshot.version = version
+
+
+search_index = SearchIndex()
@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.db import connection
+
+# Friend, pending-request and block sets of a user, cached so the friendship endpoints answer
+# "friends / pending / blocked?" with set lookups. Every write to friendships, friend_requests
+# or blocked_users calls invalidate_social_graph() for both users, the next read reloads them.
+# The cache is per process and may be stale, so it only answers reads (friend lists, search
+# results); the writes themselves are unconditional or checked against the tables.
+SOCIAL_GRAPH_CACHE_KEY = 'social_graph:{}'
+# Safety net in case the tables are changed outside these views
+SOCIAL_GRAPH_TIMEOUT = 60 * 60
+# Public userid -> auth_user.id (userids never change once generated)
+USER_ID_CACHE_KEY = 'user_id:{}'
+
+
+class SocialGraph:
+    def __init__(self, friends=(), outgoing=(), incoming=(), blocking=(), blocked_by=()):
+        self.friends = set(friends)
+        self.outgoing = set(outgoing) # Friend requests this user sent
+        self.incoming = set(incoming) # Friend requests this user received
+        self.blocking = set(blocking) # Users this user blocked
+        self.blocked_by = set(blocked_by) # Users who blocked this user
+
+    def is_friend(self, user_id):
+        return user_id in self.friends
+
+    def has_pending(self, user_id):
+        """A friend request in either direction."""
+        return user_id in self.outgoing or user_id in self.incoming
+
+    def is_blocked(self, user_id):
+        """A block in either direction."""
+        return user_id in self.blocking or user_id in self.blocked_by
+
+
+def load_social_graph(user_id):
+    """Every relation of user_id with one query."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT 'friends', friend_id FROM friend_edges WHERE user_id = %s AND status = 'accepted'
+            UNION ALL
+            SELECT 'outgoing', recipient_id FROM friend_requests WHERE sender_id = %s
+            UNION ALL
+            SELECT 'incoming', sender_id FROM friend_requests WHERE recipient_id = %s
+            UNION ALL
+            SELECT 'blocking', blocked_id FROM blocked_users WHERE blocker_id = %s
+            UNION ALL
+            SELECT 'blocked_by', blocker_id FROM blocked_users WHERE blocked_id = %s
+        """, [user_id] * 5)
+        relations = {'friends': [], 'outgoing': [], 'incoming': [], 'blocking': [], 'blocked_by': []}
+        for relation, other_id in cursor.fetchall():
+            relations[relation].append(other_id)
+    return SocialGraph(**relations)
+
+
+def get_social_graph(user_id):
+    key = SOCIAL_GRAPH_CACHE_KEY.format(int(user_id))
+    graph = cache.get(key)
+    if graph is None:
+        graph = load_social_graph(int(user_id))
+        cache.set(key, graph, SOCIAL_GRAPH_TIMEOUT)
+    return graph
+
+
+def invalidate_social_graph(*user_ids):
+    cache.delete_many([SOCIAL_GRAPH_CACHE_KEY.format(int(user_id)) for user_id in user_ids])
+
+
+def resolve_userid(userid):
+    """auth_user.id of a public userid, or None when there is no such user (misses are not cached)."""
+    key = USER_ID_CACHE_KEY.format(userid)
+    user_id = cache.get(key)
+    if user_id is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM auth_user WHERE userid=%s", [userid])
+            row = cursor.fetchone()
+        if not row:
+            return None
+        user_id = row[0]
+        cache.set(key, user_id, None)
+    return user_id
+
+
+def forget_user(user_id, userid):
+    """Drop every cached relation to a deleted user, and its userid mapping."""
+    graph = get_social_graph(user_id)
+    related = graph.friends | graph.outgoing | graph.incoming | graph.blocking | graph.blocked_by
+    invalidate_social_graph(user_id, *related)
+    cache.delete(USER_ID_CACHE_KEY.format(userid))
@@ -351,9 +351,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
             });
 
-            // Check for notifications periodically
-            setInterval(checkPendingRequests, 30000); // Check every 30 seconds
-            checkPendingRequests(); // Initial check
+            checkPendingRequests(); // Initial check; updates are pushed by connectFriendEvents()
         }
     });
 
@@ -646,6 +644,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 data.friends.forEach(friend => {
                     const friendDiv = document.createElement('div');
                     friendDiv.className = 'friend-activity';
+                    friendDiv.dataset.friendId = friend.friend_id;
                     // Add .me class to your own status for easier update
                     const isMe = window.currentUserId && (friend.userid === window.currentUserId || friend.username === window.currentUsername);
                     friendDiv.innerHTML = `
@@ -683,8 +682,89 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
     
-    // Ensure updateFriendActivitySidebar is called periodically
-    setInterval(updateFriendActivitySidebar, 60000); // Update every minute
+    // Update one friend's status in place from a pushed 'listening' event (no request)
+    function updateFriendStatus(data) {
+        const status = document.querySelector(`.friend-activity[data-friend-id="${data.user_id}"] .friend-status`);
+        if (!status) return;
+        if (data.listeningto && data.listeningto.trim()) {
+            // The title comes from another user: text only, never markup
+            const icon = document.createElement('i');
+            icon.className = 'bi bi-music-note-beamed';
+            status.replaceChildren(icon, document.createTextNode(` ${data.listeningto}`));
+        } else {
+            status.textContent = 'Nothing';
+        }
+    }
+
+    // Only asks for requests newer than the cursor: up to date costs the server one indexed MAX()
+    let notificationCursor = 0;
+    let firstPollDone = false; // The cursor stays 0 while there are no requests yet
+    async function pollNotifications() {
+        try {
+            const resp = await fetch(`/api/get_notifications/?since=${notificationCursor}`);
+            const data = await resp.json();
+            if (!data.success) return;
+            const hadCursor = firstPollDone;
+            firstPollDone = true;
+            notificationCursor = data.cursor;
+            if (hadCursor && data.notifications.length > 0) {
+                checkPendingRequests();
+                loadPendingRequests();
+            }
+        } catch {}
+    }
+
+    // While the stream is open: catches up on events published by other server processes,
+    // which this stream never sees
+    let reconcileTimer = null;
+    function reconcileFriends() {
+        pollNotifications();
+        loadFriendsList();
+        updateFriendActivitySidebar();
+    }
+
+    // Fallback when the event stream is unavailable (old browser or server without ASGI)
+    let friendPollingStarted = false;
+    function startFriendPolling() {
+        if (friendPollingStarted) return;
+        friendPollingStarted = true;
+        clearInterval(reconcileTimer);
+        pollNotifications();
+        setInterval(pollNotifications, 30000); // Check every 30 seconds
+        setInterval(updateFriendActivitySidebar, 60000); // Update every minute
+    }
+
+    // Friend requests, friendship changes and friends' listening status pushed over Server-Sent Events
+    function connectFriendEvents() {
+        if (!window.EventSource) {
+            startFriendPolling();
+            return;
+        }
+        const source = new EventSource('/api/events/');
+        let connectedOnce = false;
+        source.addEventListener('ready', () => {
+            // Events sent while reconnecting were missed: resync once
+            if (connectedOnce) window.refreshFriendsUI();
+            connectedOnce = true;
+            if (!reconcileTimer && !friendPollingStarted) {
+                pollNotifications(); // Sets the cursor the reconciliation polls compare against
+                reconcileTimer = setInterval(reconcileFriends, 120000); // Every 2 minutes
+            }
+        });
+        source.addEventListener('friend_request', () => {
+            checkPendingRequests();
+            loadPendingRequests();
+        });
+        source.addEventListener('friendship', () => {
+            loadFriendsList();
+            updateFriendActivitySidebar();
+        });
+        source.addEventListener('listening', e => updateFriendStatus(JSON.parse(e.data)));
+        source.onerror = () => {
+            // CONNECTING means the browser retries by itself; CLOSED means the server refused the stream
+            if (source.readyState === EventSource.CLOSED) startFriendPolling();
+        };
+    }
 
     // Expose for manual refresh if needed
     window.refreshFriendsUI = function () {
@@ -700,6 +780,7 @@ document.addEventListener('DOMContentLoaded', function () {
     loadFriendsList();
     updateFriendActivitySidebar();
     loadBlockedList();
+    connectFriendEvents();
 });
 
 // Helper to get CSRF token from cookie
@@ -175,7 +175,7 @@ function showSearchModal(playlistId) {
         }
 
         try {
-            const response = await fetch(`/api/search_tracks/?query=${encodeURIComponent(query)}`);
+            const response = await fetch(`/api/typeahead/?q=${encodeURIComponent(query)}`);
             if (!response.ok) {
                 searchResults.innerHTML = '<p style="color:#888;">An error occurred while searching.</p>';
                 return;
@@ -418,6 +418,7 @@ function renderPlaylistView(playlistData) {
             <div class="album-actions">
                 <i class="fa-solid fa-circle-play action-play-button"></i>
                 <i class="fa-regular fa-square-plus action-icon"></i>
+                <i class="fa-regular fa-copy action-duplicate" title="Duplicate playlist" style="cursor:pointer;"></i>
                 <i class="bi bi-x-octagon"></i>
                 <div class="spacer"></div>
             </div>
@@ -437,6 +438,19 @@ function renderPlaylistView(playlistData) {
     `;
 }
 
+// Apply several {op: 'add'|'remove', track_id} operations to a playlist in one request and one transaction
+async function bulkUpdatePlaylistTracks(playlistId, operations) {
+    const response = await fetch('/api/playlist_tracks/bulk/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCsrfToken()
+        },
+        body: JSON.stringify({ playlist_id: playlistId, operations })
+    });
+    return response.json();
+}
+
 // UI for Add Track Modal (improved design)
 function showAddTrackModal(playlistId) {
     // Remove any existing search modal before showing add-track-modal
@@ -454,10 +468,47 @@ function showAddTrackModal(playlistId) {
             <h2 style="margin-bottom:18px;">Add Track to Playlist</h2>
             <input id="add-track-search-input" type="text" placeholder="Search for a track..." style="width:100%;padding:10px 12px;border-radius:7px;border:none;background:#232323;color:#fff;font-size:1.05rem;margin-bottom:18px;">
             <div id="add-track-search-results" style="max-height:260px;overflow-y:auto;"></div>
+            <button id="add-track-submit" style="display:none;margin-top:16px;width:100%;background:#1ed760;color:#222;border:none;border-radius:7px;padding:10px 0;font-weight:600;cursor:pointer;"></button>
         </div>
     `;
     document.body.appendChild(modal);
 
+    // Tracks picked in this modal, possibly across several searches
+    const selectedTrackIds = new Set();
+    const submitBtn = modal.querySelector('#add-track-submit');
+    const markSelected = (btn, selected) => {
+        btn.textContent = selected ? 'Selected' : 'Add';
+        btn.style.background = selected ? '#444' : '#1ed760';
+        btn.style.color = selected ? '#fff' : '#222';
+    };
+    const updateSubmitButton = () => {
+        const count = selectedTrackIds.size;
+        submitBtn.style.display = count > 0 ? 'block' : 'none';
+        submitBtn.textContent = `Add ${count} track${count === 1 ? '' : 's'}`;
+    };
+    submitBtn.onclick = async () => {
+        submitBtn.disabled = true;
+        submitBtn.textContent = 'Adding...';
+        try {
+            const result = await bulkUpdatePlaylistTracks(
+                playlistId,
+                Array.from(selectedTrackIds, trackId => ({ op: 'add', track_id: trackId }))
+            );
+            if (result.success) {
+                modal.remove();
+                if (typeof addTrackModalOpen !== 'undefined') addTrackModalOpen = false;
+                loadPlaylist(playlistId, false);
+            } else {
+                alert(result.error || 'Failed to add tracks.');
+            }
+        } catch {
+            alert('An error occurred while adding the tracks.');
+        } finally {
+            submitBtn.disabled = false;
+            updateSubmitButton();
+        }
+    };
+
     // Close modal logic
     modal.querySelector('#add-track-modal-close').onclick = () => {
         modal.remove();
@@ -482,7 +533,7 @@ function showAddTrackModal(playlistId) {
         }
         resultsDiv.innerHTML = '<div style="color:#888;padding:16px 0;">Searching...</div>';
         try {
-            const resp = await fetch(`/api/search_tracks/?query=${encodeURIComponent(query)}`);
+            const resp = await fetch(`/api/typeahead/?q=${encodeURIComponent(query)}`);
             if (!resp.ok) {
                 resultsDiv.innerHTML = '<div style="color:#888;padding:16px 0;">An error occurred.</div>';
                 return;
@@ -503,36 +554,20 @@ function showAddTrackModal(playlistId) {
                     <button class="add-track-btn" data-track-id="${track.id}" style="background:#1ed760;color:#222;border:none;border-radius:6px;padding:6px 18px;font-weight:600;cursor:pointer;">Add</button>
                 </div>
             `).join('');
-            // Add click listeners for add buttons
+            // Add buttons toggle a selection; the selection is saved with one bulk request
             resultsDiv.querySelectorAll('.add-track-btn').forEach(btn => {
-                btn.onclick = async (e) => {
+                const trackId = btn.dataset.trackId;
+                if (selectedTrackIds.has(trackId)) markSelected(btn, true);
+                btn.onclick = (e) => {
                     e.stopPropagation();
-                    const trackId = btn.dataset.trackId;
-                    btn.disabled = true;
-                    btn.textContent = 'Adding...';
-                    try {
-                        const addResp = await fetch('/api/add_track_to_playlist/', {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json',
-                                'X-CSRFToken': getCsrfToken()
-                            },
-                            body: JSON.stringify({ playlist_id: playlistId, track_id: trackId })
-                        });
-                        const addResult = await addResp.json();
-                        if (addResult.success) {
-                            modal.remove();
-                            loadPlaylist(playlistId, false);
-                        } else {
-                            btn.textContent = 'Add';
-                            btn.disabled = false;
-                            alert(addResult.error || 'Failed to add track.');
-                        }
-                    } catch {
-                        btn.textContent = 'Add';
-                        btn.disabled = false;
-                        alert('An error occurred while adding the track.');
+                    if (selectedTrackIds.has(trackId)) {
+                        selectedTrackIds.delete(trackId);
+                        markSelected(btn, false);
+                    } else {
+                        selectedTrackIds.add(trackId);
+                        markSelected(btn, true);
                     }
+                    updateSubmitButton();
                 };
             });
         } catch {
@@ -541,6 +576,37 @@ function showAddTrackModal(playlistId) {
     });
 }
 
+// Copy a playlist into the user's library (one request, the server copies every track link at once)
+async function duplicatePlaylist(playlistId) {
+    try {
+        const response = await fetch('/api/duplicate_playlist/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCsrfToken()
+            },
+            body: JSON.stringify({ playlist_id: playlistId })
+        });
+        const result = await response.json();
+        if (result.success) {
+            // Full load so the sidebar lists the new playlist
+            window.location.href = `/playlist/${result.playlist_id}/`;
+        } else {
+            alert(result.error || 'Failed to duplicate playlist.');
+        }
+    } catch (error) {
+        console.error('Error duplicating playlist:', error);
+        alert('Failed to duplicate playlist. Please try again.');
+    }
+}
+
+document.addEventListener('click', (event) => {
+    const duplicateIcon = event.target.closest('.action-duplicate');
+    if (!duplicateIcon) return;
+    const playlistId = duplicateIcon.closest('.playlist-view')?.dataset.playlistId;
+    if (playlistId) duplicatePlaylist(playlistId);
+});
+
 // Attach event listener to the "add track" icon in playlist actions
 document.addEventListener('DOMContentLoaded', () => {
     // Only attach one global handler for add track modal
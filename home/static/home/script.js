@@ -546,16 +546,51 @@ async function loadAlbum(albumId, pushState = true) {
 }
 
 
+// Playlist payloads fetched ahead of time by hydratePlaylists(), keyed by playlist id
+const playlistPrefetch = new Map();
+const PLAYLIST_PREFETCH_TTL_MS = 60 * 1000; // Older entries are refetched instead
+
+// Fetch several playlists in one request (/api/playlists/?ids=...) so opening them from the sidebar is instant
+async function hydratePlaylists(playlistIds) {
+    if (!playlistIds || playlistIds.length === 0) return;
+    try {
+        const response = await fetch(`/api/playlists/?ids=${playlistIds.slice(0, 50).join(',')}`);
+        if (!response.ok) return;
+        const data = await response.json();
+        const fetchedAt = Date.now();
+        (data.playlists || []).forEach(playlist => {
+            playlistPrefetch.set(String(playlist.playlist_id), { data: playlist, fetchedAt });
+        });
+    } catch (error) {
+        console.error('Error prefetching playlists:', error);
+    }
+}
+
+// Take a fresh prefetched payload (once), or null
+function takePrefetchedPlaylist(playlistId) {
+    const entry = playlistPrefetch.get(String(playlistId));
+    playlistPrefetch.delete(String(playlistId));
+    if (entry && Date.now() - entry.fetchedAt < PLAYLIST_PREFETCH_TTL_MS) {
+        return entry.data;
+    }
+    return null;
+}
+
 // Function to load and display a specific playlist
 async function loadPlaylist(playlistId, pushState = true) {
     if (!mainContentArea) return;
     console.log(`Loading playlist ${playlistId}`); // Debug log
     try {
-        const response = await fetch(`/api/playlist/${playlistId}/`);
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+        // Reloads after an edit (pushState false) always go to the server, and drop the prefetched copy
+        let playlistData = takePrefetchedPlaylist(playlistId);
+        if (!pushState) playlistData = null;
+        if (!playlistData) {
+            const response = await fetch(`/api/playlist/${playlistId}/`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            playlistData = await response.json();
         }
-        const playlistData = await response.json();
 
         // Render the playlist view
         mainContentArea.innerHTML = renderPlaylistView(playlistData);
@@ -648,6 +683,7 @@ function loadHome(pushState = true) {
     // Re-attach listeners for album links and play icons on the home page
     attachAlbumLinkListeners(mainContentArea);
     attachPlayIconListeners(mainContentArea);
+    initAlbumShelf(mainContentArea);
 }
 
 // Function to attach listeners to play icons (used after content updates)
@@ -714,6 +750,66 @@ function attachAlbumLinkListeners(parentElement) {
     });
 }
 
+// --- Lazy album shelf ---
+// The server renders the first page of albums; the next pages come from /api/albums/?after=<cursor>
+// as the sentinel at the end of the shelf scrolls into view.
+let albumShelfObserver = null;
+
+function renderShelfAlbum(album) {
+    const box = document.createElement('div');
+    box.className = 'box1 album-link';
+    box.dataset.albumId = album.album_id;
+    // Built element by element: title and cover URL come from the catalog and are never parsed as HTML
+    const img = document.createElement('img');
+    img.src = album.cover_image_url;
+    img.alt = album.title;
+    img.loading = 'lazy';
+    const title = document.createElement('p');
+    title.textContent = album.title;
+    const play = document.createElement('i');
+    play.className = 'fa-sharp fa-solid fa-circle-play';
+    play.style.color = '#1ed760';
+    box.append(img, title, play);
+    box.addEventListener('click', (event) => {
+        event.preventDefault();
+        loadAlbum(album.album_id);
+    });
+    return box;
+}
+
+function initAlbumShelf(parentElement) {
+    const shelf = parentElement.querySelector('#album-shelf');
+    const sentinel = parentElement.querySelector('#album-shelf-sentinel');
+    if (albumShelfObserver) {
+        albumShelfObserver.disconnect();
+        albumShelfObserver = null;
+    }
+    if (!shelf || !sentinel || !shelf.dataset.nextCursor || !('IntersectionObserver' in window)) return;
+
+    let loading = false;
+    albumShelfObserver = new IntersectionObserver(async (entries) => {
+        if (!entries.some(entry => entry.isIntersecting) || loading || !shelf.dataset.nextCursor) return;
+        loading = true;
+        try {
+            const response = await fetch(`/api/albums/?after=${encodeURIComponent(shelf.dataset.nextCursor)}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const page = await response.json();
+            page.albums.forEach(album => shelf.insertBefore(renderShelfAlbum(album), sentinel));
+            shelf.dataset.nextCursor = page.next_cursor ?? '';
+            if (!page.next_cursor) {
+                albumShelfObserver.disconnect();
+            }
+        } catch (error) {
+            console.error('Error loading albums:', error);
+        } finally {
+            loading = false;
+        }
+    }, { root: shelf, rootMargin: '0px 0px 120px 0px' });
+    albumShelfObserver.observe(sentinel);
+}
+
 // Handle browser back/forward navigation
 window.addEventListener('popstate', (event) => {
     if (event.state) {
@@ -766,6 +862,13 @@ document.addEventListener('DOMContentLoaded', () => {
              // Attach initial listeners for home page elements
              attachAlbumLinkListeners(mainContentArea);
              attachPlayIconListeners(mainContentArea); // Attach to initial play icons too
+             initAlbumShelf(mainContentArea); // Load more albums as the shelf is scrolled
+        }
+
+        // Hydrate the sidebar playlists in one request once the page is idle
+        if (Array.isArray(window.userPlaylists) && window.userPlaylists.length > 0) {
+            const idle = window.requestIdleCallback || (callback => setTimeout(callback, 200));
+            idle(() => hydratePlaylists(window.userPlaylists.map(p => p[0])));
         }
 
     } else {
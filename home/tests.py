@@ -1,3 +1,1108 @@
-from django.test import TestCase
+import copy
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections, models
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .artist_pages import build_artist_page
+from .catalog import catalog_changed, catalog_imported
+from .catalog_ingest import CatalogIngest, read_json_array
+from .checks import check_shared_cache
+from .db_connections import ConnectionStats, connection_stats
+from .db_router import PRIMARY_COOKIE, read_alias
+from .events import format_event, publish_listening, publish_to_users
+from .friend_edges import add_friend_edges
+from .instrumentation import query_budget
+from .management.commands.loadtest import SCENARIOS, Fixture, benchmark_client, endpoint_name
+from .metrics import LATENCY_BUCKETS, dump_process_metrics, merged_metrics, registry
+from .middleware import USER_CONTEXT_SESSION_KEY, load_user_context
+from .models import Album, Artist, BlockedUser, CatalogImport, CustomUser, FriendEdge, Friendship, Playlist, PlaylistTrack, Track
+from .playlist_positions import POSITION_GAP, move_track, playlists_to_rebalance, rebalance_playlist
+from .playlists import PLAYLIST_BATCH_MAX
+from .presence import MemoryPresenceBackend, PresenceStore, RedisPresenceBackend
+from .recommendations import SAMPLING_INDEX_REFRESH, SamplingIndex, fetch_tracks_in_order
+from .search_index import search_index
+from .social_graph import get_social_graph
+from .track_artists import set_track_artists
+from .typeahead import TypeaheadIndex, typeahead_index
+from .versions import CATALOG_VERSION_KEY, bump_catalog_version, bump_playlist_version
+
+
+class FriendRequest(models.Model):
+    """friend_requests for the test database; the app itself only reaches it with raw SQL."""
+    sender_id = models.IntegerField()
+    recipient_id = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+
+    class Meta:
+        app_label = 'home'
+        db_table = 'friend_requests'
+        managed = False
+
+
+# A second local database standing in for the read replica, so tests can tell which alias a read
+# used. Added before the test runner creates its databases; only tests listing it get one.
+LOCAL_REPLICA = 'local_replica'
+if LOCAL_REPLICA not in settings.DATABASES:
+    settings.DATABASES[LOCAL_REPLICA] = copy.deepcopy(connections[DEFAULT_DB_ALIAS].settings_dict)
+    if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite': # SQLite test databases are in memory, one per alias
+        settings.DATABASES[LOCAL_REPLICA]['TEST']['NAME'] = f"test_{settings.DATABASES[LOCAL_REPLICA]['NAME']}_replica"
+
+
+def create_unmanaged_tables(using=DEFAULT_DB_ALIAS, models=None):
+    """
+    The app's tables are unmanaged (created outside Django), so the test runner leaves them out:
+    create them from the models. Call it from setUpModule(), outside the test transactions.
+    """
+    existing = set(connections[using].introspection.table_names())
+    with connections[using].schema_editor() as schema_editor:
+        for model in models or apps.get_app_config('home').get_models():
+            if not model._meta.managed and model._meta.db_table not in existing:
+                schema_editor.create_model(model)
+                existing.add(model._meta.db_table)
+
+
+def setUpModule():
+    create_unmanaged_tables()
+
+
+def create_user(username):
+    return CustomUser.objects.create_user(username, f'{username}@example.com', userid=f'{username}12abc')
+
+
+class FriendshipConsistencyTests(TestCase):
+    """friendships and friend_edges stay in step through accept, unfriend and block."""
+
+    def setUp(self):
+        cache.clear() # The cached social graph
+        self.alice = create_user('alice')
+        self.bob = create_user('bob')
+        self.client.force_login(self.alice)
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def edges(self):
+        return set(FriendEdge.objects.values_list('user_id', 'friend_id'))
+
+    def accept_request_from_bob(self):
+        request = FriendRequest.objects.create(sender_id=self.bob.pk, recipient_id=self.alice.pk)
+        response = self.post('/api/friends/respond/', {'request_id': request.pk, 'action': 'accept'})
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_accept_writes_one_friendship_and_both_edges(self):
+        self.accept_request_from_bob()
+        self.assertEqual(list(Friendship.objects.values_list('status', flat=True)), ['accepted'])
+        self.assertEqual(self.edges(), {(self.alice.pk, self.bob.pk), (self.bob.pk, self.alice.pk)})
+        self.assertFalse(FriendRequest.objects.exists())
+
+    def test_accept_promotes_a_pending_friendship_and_repairs_edges(self):
+        Friendship.objects.create(user1=self.bob, user2=self.alice, status='pending')
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO friend_edges (user_id, friend_id, status) VALUES (%s, %s, 'accepted')", [self.bob.pk, self.alice.pk])
+        self.accept_request_from_bob()
+        self.assertEqual(list(Friendship.objects.values_list('status', flat=True)), ['accepted'])
+        self.assertEqual(self.edges(), {(self.alice.pk, self.bob.pk), (self.bob.pk, self.alice.pk)})
+
+    def test_add_friend_edges_is_duplicate_safe(self):
+        with connection.cursor() as cursor:
+            add_friend_edges(cursor, self.alice.pk, self.bob.pk)
+            add_friend_edges(cursor, str(self.bob.pk), self.alice.pk) # Session ids are strings
+        self.assertEqual(FriendEdge.objects.count(), 2)
+
+    def test_unfriend_removes_friendship_and_edges(self):
+        self.accept_request_from_bob()
+        response = self.post('/api/unfriend/', {'userid': self.bob.userid})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(self.edges(), set())
+
+    def test_unfriend_ignores_a_stale_cached_graph(self):
+        get_social_graph(self.alice.pk) # Cached without the friendship
+        Friendship.objects.create(user1=self.alice, user2=self.bob, status='accepted')
+        with connection.cursor() as cursor:
+            add_friend_edges(cursor, self.alice.pk, self.bob.pk)
+        self.post('/api/unfriend/', {'userid': self.bob.userid})
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(self.edges(), set())
+
+    def test_block_removes_friendship_edges_and_requests(self):
+        self.accept_request_from_bob()
+        FriendRequest.objects.create(sender_id=self.bob.pk, recipient_id=self.alice.pk)
+        response = self.post('/api/block/', {'target_userid': self.bob.userid})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(self.edges(), set())
+        self.assertFalse(FriendRequest.objects.exists())
+        self.assertEqual(self.post('/api/block/', {'target_userid': self.bob.userid}).status_code, 400)
+
+
+
+    def test_request_is_checked_against_the_tables_not_the_cached_graph(self):
+        get_social_graph(self.alice.pk) # Cached with no relation to bob
+        BlockedUser.objects.create(blocker=self.bob, blocked=self.alice)
+        response = self.post('/api/friends/send_request/', {'userid': self.bob.userid})
+        self.assertEqual(response.json()['error'], 'Cannot send friend request to this user.')
+        BlockedUser.objects.all().delete()
+        FriendRequest.objects.create(sender_id=self.bob.pk, recipient_id=self.alice.pk)
+        response = self.post('/api/friends/send_request/', {'userid': self.bob.userid})
+        self.assertEqual(response.json()['error'], 'Friend request already pending.')
+        self.assertEqual(FriendRequest.objects.count(), 1)
+
+    def test_stale_pending_request_does_not_refuse_a_new_one(self):
+        FriendRequest.objects.create(sender_id=self.alice.pk, recipient_id=self.bob.pk)
+        get_social_graph(self.alice.pk) # Cached with the pending request
+        FriendRequest.objects.all().delete() # Declined by another worker
+        response = self.post('/api/friends/send_request/', {'userid': self.bob.userid})
+        self.assertTrue(response.json()['success'], response.content)
+        self.assertEqual(list(FriendRequest.objects.values_list('sender_id', 'recipient_id')), [(self.alice.pk, self.bob.pk)])
+
+
+class UserContextTests(TestCase):
+    """The session-cached user context, its invalidation and the playlist ownership check."""
+
+    def setUp(self):
+        cache.clear() # Context version stamps
+        self.alice = create_user('alice')
+        self.bob = create_user('bob')
+        self.track = Track.objects.create(title='One Dance', file_url='/media/1.mp3')
+        self.client.force_login(self.alice)
+
+    def add_track(self, playlist_id):
+        return self.client.post(
+            '/api/add_track_to_playlist/', json.dumps({'playlist_id': playlist_id, 'track_id': self.track.pk}),
+            content_type='application/json'
+        )
+
+    def test_context_is_cached_in_the_session_until_invalidated(self):
+        with mock.patch('home.middleware.load_user_context', wraps=load_user_context) as load:
+            self.assertEqual(self.add_track(1).status_code, 403)
+            self.add_track(1)
+            self.assertEqual(load.call_count, 1)
+            self.client.post('/api/create_playlist/', json.dumps({'name': 'Mix'}), content_type='application/json')
+            playlist = Playlist.objects.get(name='Mix')
+            self.assertEqual(self.add_track(playlist.pk).status_code, 200)
+            self.assertEqual(load.call_count, 2) # Reloaded once after create_playlist bumped the version
+        self.assertEqual(self.client.session[USER_CONTEXT_SESSION_KEY]['data']['playlists'], [[playlist.pk, 'Mix', None]])
+
+    def test_playlist_missing_from_the_cached_summary_is_checked_in_the_database(self):
+        self.add_track(1) # Caches a summary without playlists
+        mine = Playlist.objects.create(owner_user=self.alice, name='Made elsewhere') # No invalidation
+        theirs = Playlist.objects.create(owner_user=self.bob, name='Not mine')
+        self.assertEqual(self.add_track(mine.pk).status_code, 200)
+        self.assertEqual(self.add_track(theirs.pk).status_code, 403)
+        self.assertEqual(self.add_track('x').status_code, 403)
+        self.assertEqual(list(PlaylistTrack.objects.values_list('playlist_id', flat=True)), [mine.pk])
+
+
+class NotificationTests(TestCase):
+    """get_notifications: the since cursor and the ASGI long-poll."""
+
+    def setUp(self):
+        self.alice = create_user('alice')
+        self.bob = create_user('bob')
+        self.carol = create_user('carol')
+        self.first = FriendRequest.objects.create(sender_id=self.bob.pk, recipient_id=self.alice.pk)
+
+    def notification_ids(self, data):
+        return [notification['request_id'] for notification in data['notifications']]
+
+    def test_since_returns_only_newer_requests(self):
+        self.client.force_login(self.alice)
+        data = self.client.get('/api/get_notifications/').json()
+        self.assertEqual((self.notification_ids(data), data['cursor']), ([self.first.pk], self.first.pk))
+        second = FriendRequest.objects.create(sender_id=self.carol.pk, recipient_id=self.alice.pk)
+        FriendRequest.objects.create(sender_id=self.alice.pk, recipient_id=self.carol.pk) # Sent, not received
+        data = self.client.get(f'/api/get_notifications/?since={self.first.pk}').json()
+        self.assertEqual((self.notification_ids(data), data['cursor']), ([second.pk], second.pk))
+        data = self.client.get(f'/api/get_notifications/?since={second.pk}').json()
+        self.assertEqual((data['notifications'], data['cursor']), ([], second.pk))
+
+    def test_wait_is_ignored_under_wsgi(self):
+        self.client.force_login(self.alice)
+        with mock.patch('home.views.asyncio.sleep') as sleep:
+            data = self.client.get(f'/api/get_notifications/?since={self.first.pk}&wait=25').json()
+        sleep.assert_not_called()
+        self.assertEqual((data['notifications'], data['cursor']), ([], self.first.pk))
+
+    def test_invalid_wait_is_refused(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/api/get_notifications/?since=1&wait=nan').status_code, 400)
+
+    async def test_long_poll_returns_once_a_request_arrives(self):
+        await self.async_client.aforce_login(self.alice)
+        arrived = []
+
+        async def request_arrives(seconds):
+            # Inserted in the database only, as another worker would
+            arrived.append(await FriendRequest.objects.acreate(sender_id=self.carol.pk, recipient_id=self.alice.pk))
+
+        with mock.patch('home.views.asyncio.sleep', side_effect=request_arrives) as sleep:
+            response = await self.async_client.get(f'/api/get_notifications/?since={self.first.pk}&wait=25')
+        data = response.json()
+        self.assertEqual(sleep.await_count, 1)
+        self.assertEqual((self.notification_ids(data), data['cursor']), ([arrived[0].pk], arrived[0].pk))
+
+    async def test_long_poll_times_out_with_the_same_cursor(self):
+        await self.async_client.aforce_login(self.alice)
+        response = await self.async_client.get(f'/api/get_notifications/?since={self.first.pk}&wait=0.05')
+        data = response.json()
+        self.assertEqual((data['notifications'], data['cursor']), ([], self.first.pk))
+
+
+
+class FriendEventsTests(TestCase):
+    """The /api/events/ stream: 204 under WSGI, the friend's events only under ASGI."""
+
+    def setUp(self):
+        self.alice = create_user('alice')
+        self.bob = create_user('bob')
+        self.carol = create_user('carol')
+        FriendEdge.objects.bulk_create([FriendEdge(user=self.alice, friend=self.bob), FriendEdge(user=self.bob, friend=self.alice)])
+
+    def test_wsgi_gets_no_content(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/api/events/').status_code, 204)
+
+    async def test_anonymous_stream_is_refused(self):
+        response = await self.async_client.get('/api/events/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_sends_own_and_friends_events(self):
+        await self.async_client.aforce_login(self.alice)
+        response = await self.async_client.get('/api/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertIn(b'event: ready', await anext(stream))
+
+        publish_listening(self.carol.pk, 'Views') # Not a friend: never queued
+        publish_listening(self.bob.pk, 'One Dance')
+        self.assertEqual(await anext(stream), format_event('listening', {'user_id': self.bob.pk, 'listeningto': 'One Dance'}).encode())
+        publish_to_users([self.alice.pk], 'friend_request')
+        self.assertEqual(await anext(stream), format_event('friend_request', {}).encode())
+        with mock.patch('home.views.EVENT_STREAM_HEARTBEAT', 0.01):
+            self.assertEqual(await anext(stream), b': keep-alive\n\n')
+        await stream.aclose()
+
+
+class FakeRedis:
+    """In-memory stand-in for the slice of the redis-py API RedisPresenceBackend uses."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.sets = {}
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[str(field)] = value
+
+    def hmget(self, key, fields):
+        values = self.hashes.get(key, {})
+        return [values.get(str(field)) for field in fields]
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(str(member) for member in members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+        self.sets.pop(key, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.commands]
+
+
+class PresenceStoreTests(TestCase):
+    """Both presence backends: reads, the batched CASE UPDATE flush and retries after a failed flush."""
+
+    def setUp(self):
+        self.users = [create_user(name) for name in ('alice', 'bob', 'carol')]
+
+    def stores(self):
+        for backend in (MemoryPresenceBackend(), RedisPresenceBackend(client=FakeRedis())):
+            store = PresenceStore(backend)
+            store._start_flusher = mock.Mock() # No timer thread in tests
+            with self.subTest(backend=type(backend).__name__):
+                yield store
+            CustomUser.objects.update(listeningto=None)
+
+    def listening_column(self):
+        return dict(CustomUser.objects.values_list('id', 'listeningto'))
+
+    def test_changes_are_read_from_the_store_before_the_flush(self):
+        alice, bob, carol = self.users
+        for store in self.stores():
+            store.set_listening(alice.pk, 'One Dance')
+            store.set_listening(str(bob.pk), None) # Session ids are strings
+            self.assertEqual(store.get_listening([alice.pk, bob.pk, carol.pk]), {alice.pk: 'One Dance', bob.pk: ''})
+            self.assertEqual(set(self.listening_column().values()), {None})
+
+    def test_flush_writes_every_changed_user_in_batches(self):
+        alice, bob, carol = self.users
+        for store in self.stores():
+            store.set_listening(alice.pk, 'One Dance')
+            store.set_listening(bob.pk, 'Hotline Bling')
+            store.set_listening(alice.pk, 'Controlla') # Last value wins
+            store.set_listening(carol.pk, '')
+            with mock.patch('home.presence.PRESENCE_FLUSH_BATCH', 2), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(store.flush(), 3)
+            updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE auth_user')]
+            self.assertEqual(len(updates), 2)
+            self.assertIn('CASE id', updates[0])
+            self.assertEqual(self.listening_column(), {alice.pk: 'Controlla', bob.pk: 'Hotline Bling', carol.pk: ''})
+            self.assertEqual(store.flush(), 0) # Nothing changed since
+
+    def test_failed_flush_keeps_the_users_for_the_next_one(self):
+        alice, bob, _ = self.users
+        for store in self.stores():
+            store.set_listening(alice.pk, 'One Dance')
+            store.set_listening(bob.pk, 'Views')
+            with mock.patch('home.presence.transaction.atomic', side_effect=DatabaseError("gone away")):
+                with self.assertRaises(DatabaseError):
+                    store.flush()
+            self.assertEqual(store.flush(), 2)
+            self.assertEqual(self.listening_column()[bob.pk], 'Views')
+
+
+class CatalogFixtureMixin:
+    def setUp(self):
+        cache.clear() # Version stamps, feed and pages
+        search_index._snapshot = None
+        self.drake = Artist.objects.create(name='Drake')
+        self.views = Album.objects.create(title='Views', primary_artist=self.drake)
+        self.one_dance = Track.objects.create(title='One Dance', file_url='/media/1.mp3', album=self.views, artist_name='Drake')
+        self.hotline = Track.objects.create(title='Hotline Bling', file_url='/media/2.mp3', album=self.views, artist_name='Drake')
+
+
+class EtagVersionedTests(CatalogFixtureMixin, TestCase):
+    def test_not_modified_until_the_catalog_changes(self):
+        url = f'/api/album/{self.views.pk}/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.hotline.title = 'Hotline Bling (Remix)'
+        self.hotline.save()
+        catalog_changed(tracks=[self.hotline])
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertIn('Hotline Bling (Remix)', [track['title'] for track in changed.json()['tracks']])
+
+    def test_stamps_do_not_expire(self):
+        url = f'/api/album/{self.views.pk}/'
+        etag = self.client.get(url)['ETag']
+        with mock.patch('time.time', return_value=time.time() + 24 * 3600): # A day later, no writes
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['home.E001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'home.cache_backends.StatsRedisCache', 'LOCATION': 'redis://localhost:6379/1'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_missing_album_is_not_tagged(self):
+        response = self.client.get('/api/album/999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(REPLICA_LAG=5)
+class ReplicaRoutingTests(TestCase):
+    """replica_reads() views read the replica, except right after a catalog write or a write from the same browser."""
+    databases = {DEFAULT_DB_ALIAS, LOCAL_REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        create_unmanaged_tables(LOCAL_REPLICA, [Artist, Album, Track])
+        super().setUpClass()
+
+    def setUp(self):
+        alias = mock.patch('home.db_router.REPLICA_DB_ALIAS', LOCAL_REPLICA)
+        alias.start()
+        self.addCleanup(alias.stop)
+        cache.clear()
+        cache.set(CATALOG_VERSION_KEY, time.time_ns() - 60 * 1_000_000_000, None) # Last catalog write a minute ago
+        # Same rows with different titles on each alias, so the response tells which one was read
+        for using, suffix in [(DEFAULT_DB_ALIAS, 'primary'), (LOCAL_REPLICA, 'replica')]:
+            Track.objects.using(using).create(track_id=1, title=f'One Dance on the {suffix}', file_url='/media/1.mp3')
+            Album.objects.using(using).create(album_id=1, title=f'Views on the {suffix}')
+
+    def read(self):
+        return self.client.get('/api/tracks/?limit=10').json()['tracks'][0]['title'].rsplit(' ', 1)[1]
+
+    def test_raw_sql_and_orm_reads_use_the_replica(self):
+        self.assertEqual(self.read(), 'replica')
+        self.assertEqual(self.client.get('/api/albums/').json()['albums'][0]['title'], 'Views on the replica')
+
+    def test_artist_page_is_built_from_the_replica(self):
+        with mock.patch('home.views.get_artist_page', side_effect=lambda artist_id: {'alias': read_alias()}):
+            self.assertEqual(self.client.get('/api/artist/1/').json()['alias'], LOCAL_REPLICA)
+
+    def test_recent_catalog_write_reads_the_primary(self):
+        bump_catalog_version()
+        self.assertEqual(self.read(), 'primary')
+
+    def test_write_pins_the_browser_to_the_primary(self):
+        response = self.client.post('/api/tracks/?limit=10')
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], 5)
+        self.assertEqual(self.read(), 'primary')
+        self.client.cookies.pop(PRIMARY_COOKIE) # Expired
+        self.assertEqual(self.read(), 'replica')
+
+    def test_no_replica_configured(self):
+        with mock.patch('home.db_router.REPLICA_DB_ALIAS', 'missing'):
+            self.assertEqual(self.read(), 'primary')
+            self.assertNotIn(PRIMARY_COOKIE, self.client.post('/api/tracks/?limit=10').cookies)
+
+
+class ArtistPageTests(CatalogFixtureMixin, TestCase):
+    """Artist payloads are built once and dropped only for the artists a catalog write touches."""
+
+    @classmethod
+    def setUpClass(cls):
+        # A column of the real artists table the model does not declare; the page reads it with raw SQL
+        with connection.cursor() as cursor:
+            if 'artist_image_url2' not in [column.name for column in connection.introspection.get_table_description(cursor, 'artists')]:
+                cursor.execute("ALTER TABLE artists ADD COLUMN artist_image_url2 varchar(512) NULL")
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        self.rihanna = Artist.objects.create(name='Rihanna')
+        set_track_artists(self.one_dance, [self.drake])
+        set_track_artists(self.hotline, [self.drake])
+
+    def page(self, artist):
+        return self.client.get(f'/api/artist/{artist.pk}/').json()
+
+    def track_titles(self, artist):
+        return [track['title'] for track in self.page(artist)['tracks']]
+
+    def test_page_is_cached_until_the_artist_changes(self):
+        with mock.patch('home.artist_pages.build_artist_page', wraps=build_artist_page) as build:
+            self.assertEqual(self.page(self.drake)['track_count'], 2)
+            Artist.objects.filter(pk=self.drake.pk).update(name='Champagne Papi') # Outside the dashboard
+            self.assertEqual(self.page(self.drake)['artist']['name'], 'Drake')
+            self.assertEqual(build.call_count, 1)
+            self.drake.refresh_from_db()
+            catalog_changed(artists=[self.drake])
+            self.assertEqual(self.page(self.drake)['artist']['name'], 'Champagne Papi')
+
+    def test_moved_credit_refreshes_both_artists_only(self):
+        self.assertEqual(self.track_titles(self.drake), ['One Dance', 'Hotline Bling'])
+        self.assertEqual(self.track_titles(self.rihanna), [])
+        set_track_artists(self.one_dance, [self.rihanna])
+        catalog_changed(tracks=[self.one_dance], artist_ids=[self.drake.pk, self.rihanna.pk])
+        self.assertEqual(self.track_titles(self.drake), ['Hotline Bling'])
+        self.assertEqual(self.track_titles(self.rihanna), ['One Dance'])
+
+    def test_unrelated_write_keeps_the_page(self):
+        self.page(self.drake)
+        with mock.patch('home.artist_pages.build_artist_page', wraps=build_artist_page) as build:
+            catalog_changed(artists=[self.rihanna])
+            self.page(self.drake)
+        build.assert_not_called()
+
+    def test_album_moved_to_another_artist(self):
+        self.assertEqual([album['title'] for album in self.page(self.drake)['albums']], ['Views'])
+        Album.objects.filter(pk=self.views.pk).update(primary_artist=self.rihanna)
+        self.views.refresh_from_db()
+        catalog_changed(albums=[self.views], artist_ids=[self.drake.pk, self.rihanna.pk])
+        self.assertEqual(self.page(self.drake)['albums'], [])
+        self.assertEqual([album['title'] for album in self.page(self.rihanna)['albums']], ['Views'])
+
+    def test_unknown_artist(self):
+        self.assertEqual(self.client.get('/api/artist/999999/').status_code, 404)
+
+
+class SearchIndexTests(CatalogFixtureMixin, TestCase):
+    def titles(self, query):
+        return [track['title'] for track in search_index.search_tracks(query)]
+
+    def test_apply_changes_updates_the_built_index_in_place(self):
+        self.assertEqual(self.titles('hotl'), ['Hotline Bling'])
+        snapshot = search_index._snapshot
+        self.assertEqual(snapshot.tracks.vocabulary, sorted(snapshot.tracks.vocabulary))
+
+        self.hotline.title = 'Started From The Bottom'
+        self.hotline.save()
+        catalog_changed(tracks=[self.hotline])
+        self.assertIs(search_index._snapshot, snapshot) # Updated, not rebuilt
+        self.assertEqual(self.titles('hotl'), [])
+        self.assertEqual(self.titles('bott'), ['Started From The Bottom'])
+        self.assertEqual(snapshot.tracks.vocabulary, sorted(snapshot.tracks.vocabulary))
+
+    def test_deleted_track_leaves_the_index(self):
+        self.titles('dance')
+        track_id = self.one_dance.pk
+        self.one_dance.delete()
+        catalog_changed(deleted_tracks=[track_id])
+        self.assertEqual(self.titles('dance'), [])
+        self.assertNotIn('dance', search_index._snapshot.tracks.vocabulary)
+
+    def test_missed_write_rebuilds_in_the_background(self):
+        self.titles('hotl')
+        snapshot = search_index._snapshot
+        Track.objects.create(title='Hotline Remix', file_url='/media/3.mp3', artist_name='Drake')
+        catalog_imported() # New version, not applied to the index
+        with mock.patch('home.search_index.threading.Thread') as thread:
+            self.assertEqual(self.titles('hotl'), ['Hotline Bling']) # Previous snapshot answers
+            self.titles('hotl')
+        thread.assert_called_once() # One rebuild, not one per search
+        with mock.patch('home.search_index.connection'): # Keep the test's connection open
+            search_index._rebuild(thread.call_args.kwargs['args'][0])
+        self.assertFalse(search_index._rebuilding)
+        self.assertIsNot(search_index._snapshot, snapshot)
+        self.assertEqual(sorted(self.titles('hotl')), ['Hotline Bling', 'Hotline Remix'])
+
+
+class TypeaheadTests(CatalogFixtureMixin, TestCase):
+    def test_suggests_nothing_until_built_then_follows_the_catalog(self):
+        index = TypeaheadIndex()
+        with mock.patch('home.typeahead.threading.Thread'): # Background build not run
+            self.assertEqual(index.suggest('hot'), [])
+        index.build()
+        self.assertEqual(index.suggest('hot'), [self.hotline.pk])
+        self.assertEqual(index.suggest('drake bl'), []) # Keys start at a word of one field
+
+        self.hotline.title = 'Started From The Bottom'
+        self.hotline.save()
+        catalog_changed(tracks=[self.hotline])
+        index.build()
+        self.assertEqual(index.suggest('hot'), [])
+        self.assertEqual(index.suggest('bottom'), [self.hotline.pk])
+
+
+
+class GetTracksTests(CatalogFixtureMixin, TestCase):
+    """/api/tracks/ keyset pages and the NDJSON stream."""
+
+    def setUp(self):
+        super().setUp()
+        self.controlla = Track.objects.create(title='Controlla', file_url='/media/3.mp3', album=self.views, artist_name='Drake')
+        self.ids = [self.one_dance.pk, self.hotline.pk, self.controlla.pk]
+
+    def stream(self, query=''):
+        response = self.client.get(f'/api/tracks/?format=ndjson{query}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_pages_follow_next_after_id(self):
+        data = self.client.get('/api/tracks/?limit=2').json()
+        self.assertEqual([track['id'] for track in data['tracks']], self.ids[:2])
+        self.assertEqual(data['next_after_id'], self.hotline.pk)
+        data = self.client.get(f'/api/tracks/?after_id={self.hotline.pk}&limit=2').json()
+        self.assertEqual([track['id'] for track in data['tracks']], self.ids[2:])
+        self.assertIsNone(data['next_after_id'])
+
+    def test_invalid_page_is_refused(self):
+        self.assertEqual(self.client.get('/api/tracks/?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/tracks/?after_id=x').status_code, 400)
+
+    def test_stream_reads_every_track_a_page_at_a_time(self):
+        with mock.patch('home.views.TRACKS_PAGE_SIZE', 2):
+            self.assertEqual([track['id'] for track in self.stream()], self.ids)
+            self.assertEqual([track['id'] for track in self.stream(f'&after_id={self.one_dance.pk}')], self.ids[1:])
+
+    def test_stream_failure_ends_with_a_generic_error_line(self):
+        rows = [(self.one_dance.pk, 'One Dance', 'Drake', None, '/media/1.mp3', None)]
+        with mock.patch('home.views.fetch_tracks_page', side_effect=[rows, RuntimeError("lost connection to 10.0.0.5")]):
+            with self.assertLogs('home.views', 'ERROR'):
+                lines = self.stream()
+        self.assertEqual(lines[0]['id'], self.one_dance.pk)
+        self.assertEqual(lines[1], {'success': False, 'error': 'Stream interrupted, resume with after_id'})
+
+
+class DuplicatePlaylistTests(TestCase):
+    def setUp(self):
+        self.alice = create_user('alice')
+        self.bob = create_user('bob')
+        self.source = Playlist.objects.create(owner_user=self.bob, name='Mix', cover_image_url='/media/mix.jpg')
+        self.tracks = [Track.objects.create(title=f'Track {i}', file_url=f'/media/{i}.mp3') for i in range(3)]
+        for position, track in zip([300, 100, 200], self.tracks):
+            PlaylistTrack.objects.create(playlist=self.source, track=track, position=position)
+        self.client.force_login(self.alice)
+
+    def duplicate(self, data):
+        return self.client.post('/api/duplicate_playlist/', json.dumps(data), content_type='application/json')
+
+    def test_copy_keeps_tracks_and_order(self):
+        data = self.duplicate({'playlist_id': self.source.pk}).json()
+        self.assertEqual((data['name'], data['track_count']), ('Mix (Copy)', 3))
+        copy = Playlist.objects.get(pk=data['playlist_id'])
+        self.assertEqual((copy.owner_user_id, copy.cover_image_url), (self.alice.pk, '/media/mix.jpg'))
+        self.assertEqual(
+            list(PlaylistTrack.objects.filter(playlist=copy).order_by('position').values_list('track_id', 'position')),
+            list(PlaylistTrack.objects.filter(playlist=self.source).order_by('position').values_list('track_id', 'position')),
+        )
+
+    def test_copy_can_be_renamed(self):
+        self.assertEqual(self.duplicate({'playlist_id': self.source.pk, 'name': ' Road trip '}).json()['name'], 'Road trip')
+
+    def test_unknown_playlist(self):
+        self.assertEqual(self.duplicate({'playlist_id': self.source.pk + 100}).status_code, 404)
+        self.assertEqual(Playlist.objects.count(), 1)
+
+
+@override_settings(QUERY_INSTRUMENTATION=True, QUERY_BUDGET_DEFAULT=20, QUERY_BUDGETS={'get_tracks': 0})
+class QueryBudgetTests(CatalogFixtureMixin, TestCase):
+    """QueryInstrumentationMiddleware: per-endpoint budgets, their warning and metric, Server-Timing."""
+
+    def exceeded(self, view_name):
+        counters, _ = registry.collect()
+        return counters.get(('freeflow_query_budget_exceeded_total', (('view', view_name),)), 0)
+
+    def test_view_over_its_budget_is_logged_and_counted(self):
+        before = self.exceeded('get_tracks')
+        with self.assertLogs('home.instrumentation', 'WARNING') as logs:
+            response = self.client.get('/api/tracks/?limit=10') # One statement: the page
+        self.assertRegex(logs.output[0], r'get_tracks ran 1 queries \(budget 0\)')
+        self.assertIn('SELECT', logs.output[0]) # The slowest statement
+        self.assertEqual(self.exceeded('get_tracks'), before + 1)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+
+    def test_view_within_its_budget_is_not_logged(self):
+        before = self.exceeded('album_shelf_json')
+        with self.assertNoLogs('home.instrumentation', 'WARNING'):
+            self.client.get('/api/albums/') # Default budget
+        self.assertEqual(self.exceeded('album_shelf_json'), before)
+
+    def test_budget_is_looked_up_by_url_name(self):
+        self.assertEqual(query_budget('get_tracks'), 0)
+        self.assertEqual(query_budget('album_shelf_json'), 20)
+
+    @override_settings(QUERY_INSTRUMENTATION=False)
+    def test_disabled(self):
+        with self.assertNoLogs('home.instrumentation', 'WARNING'):
+            response = self.client.get('/api/tracks/?limit=10')
+        self.assertNotIn('Server-Timing', response)
+
+
+class BulkPlaylistTests(TestCase):
+    """/api/playlist_tracks/bulk/: net effect of the operations in one transaction, then a new version."""
+
+    def setUp(self):
+        cache.clear() # Playlist version stamps
+        self.alice = create_user('alice')
+        self.playlist = Playlist.objects.create(owner_user=self.alice, name='Mix')
+        self.tracks = [Track.objects.create(title=f'Track {i}', file_url=f'/media/{i}.mp3') for i in range(4)]
+        for i, track in enumerate(self.tracks[:2], 1):
+            PlaylistTrack.objects.create(playlist=self.playlist, track=track, position=i * POSITION_GAP)
+        self.client.force_login(self.alice)
+
+    def bulk(self, operations, playlist_id=None):
+        return self.client.post('/api/playlist_tracks/bulk/', json.dumps({
+            'playlist_id': playlist_id or self.playlist.pk, 'operations': operations,
+        }), content_type='application/json')
+
+    def track_ids(self):
+        return [track['id'] for track in self.client.get(f'/api/playlist/{self.playlist.pk}/').json()['tracks']]
+
+    def test_net_effect_is_applied_and_appended_in_order(self):
+        t0, t1, t2, t3 = [track.pk for track in self.tracks]
+        data = self.bulk([
+            {'op': 'add', 'track_id': t3}, {'op': 'remove', 'track_id': t0}, {'op': 'add', 'track_id': t2},
+            {'op': 'remove', 'track_id': t1}, {'op': 'add', 'track_id': t1}, # Removed then re-added: kept in place
+            {'op': 'add', 'track_id': t3}, # Already added: no-op
+        ]).json()
+        self.assertEqual((data['added'], data['removed']), (2, 1))
+        self.assertEqual(self.track_ids(), [t1, t3, t2])
+
+    def test_write_changes_the_playlist_etag(self):
+        etag = self.client.get(f'/api/playlist/{self.playlist.pk}/')['ETag']
+        version = self.bulk([{'op': 'add', 'track_id': self.tracks[2].pk}]).json()['version']
+        self.assertIn(str(version), self.client.get(f'/api/playlist/{self.playlist.pk}/')['ETag'])
+        self.assertEqual(self.client.get(f'/api/playlist/{self.playlist.pk}/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_invalid_batch_changes_nothing(self):
+        before = self.track_ids()
+        etag = self.client.get(f'/api/playlist/{self.playlist.pk}/')['ETag']
+        unknown = {'op': 'add', 'track_id': self.tracks[-1].pk + 100}
+        response = self.bulk([{'op': 'remove', 'track_id': self.tracks[0].pk}, unknown])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown track ids', response.json()['error'])
+        self.assertEqual(self.bulk([{'op': 'move', 'track_id': self.tracks[0].pk}]).status_code, 400)
+        self.assertEqual(self.bulk([]).status_code, 400)
+        self.assertEqual(self.track_ids(), before)
+        self.assertEqual(self.client.get(f'/api/playlist/{self.playlist.pk}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_other_users_playlist_is_refused(self):
+        theirs = Playlist.objects.create(owner_user=create_user('bob'), name='Not mine')
+        self.assertEqual(self.bulk([{'op': 'add', 'track_id': self.tracks[0].pk}], theirs.pk).status_code, 403)
+        self.assertFalse(PlaylistTrack.objects.filter(playlist=theirs).exists())
+
+
+class SamplingIndexTests(TestCase):
+    def setUp(self):
+        self.tracks = [Track.objects.create(title=f'Track {i}', file_url=f'/media/{i}.mp3') for i in range(20)]
+        self.no_file = Track.objects.create(title='No file', file_url='')
+        self.index = SamplingIndex()
+
+    def test_same_seed_gives_the_same_draw(self):
+        draw = self.index.sample(5, seed='session:2026-10-18')
+        self.assertEqual(len(set(draw)), 5)
+        self.assertEqual(self.index.sample(5, seed='session:2026-10-18'), draw)
+        self.assertNotEqual(self.index.sample(5, seed='session:2026-10-19'), draw)
+
+    def test_only_tracks_with_a_file_are_drawn(self):
+        self.assertEqual(sorted(self.index.sample(100)), [track.pk for track in self.tracks])
+
+    def test_ids_are_reloaded_after_invalidation_or_the_refresh_interval(self):
+        self.index.sample(1)
+        new = Track.objects.create(title='New', file_url='/media/new.mp3')
+        self.assertNotIn(new.pk, self.index.track_ids())
+        self.index.invalidate()
+        self.assertIn(new.pk, self.index.track_ids())
+        newer = Track.objects.create(title='Newer', file_url='/media/newer.mp3')
+        with mock.patch('home.recommendations.time.monotonic', return_value=time.monotonic() + SAMPLING_INDEX_REFRESH + 1):
+            self.assertIn(newer.pk, self.index.track_ids())
+
+    def test_tracks_are_fetched_in_the_drawn_order(self):
+        track_ids = [self.tracks[3].pk, self.tracks[0].pk, 999_999, self.tracks[7].pk]
+        self.assertEqual([track.pk for track in fetch_tracks_in_order(track_ids)], [self.tracks[3].pk, self.tracks[0].pk, self.tracks[7].pk])
+
+
+class AlbumShelfTests(TestCase):
+    """/api/albums/ keyset pages: covers and titles, walked with next_cursor."""
+
+    def setUp(self):
+        drake = Artist.objects.create(name='Drake')
+        self.albums = [Album.objects.create(title=f'Album {i}', primary_artist=drake) for i in range(7)]
+
+    def test_cursor_walks_every_album_once(self):
+        seen, after = [], ''
+        for _ in range(4):
+            data = self.client.get(f'/api/albums/?limit=3&after={after}').json()
+            seen += [album['album_id'] for album in data['albums']]
+            after = data['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(seen, [album.pk for album in self.albums])
+        self.assertEqual(len(data['albums']), 1) # 3 + 3 + 1, and no empty page at the end
+
+    def test_exact_last_page_has_no_cursor(self):
+        data = self.client.get('/api/albums/?limit=7').json()
+        self.assertEqual((len(data['albums']), data['next_cursor']), (7, None))
+
+    def test_page_carries_covers_and_titles_only(self):
+        album = self.client.get('/api/albums/?limit=1').json()['albums'][0]
+        self.assertEqual(set(album), {'album_id', 'title', 'cover_image_url'})
+        self.assertEqual(album['cover_image_url'], self.albums[0].image_url_or_default)
+
+    def test_limit_is_capped_and_validated(self):
+        with mock.patch('home.views.ALBUM_SHELF_MAX_PAGE_SIZE', 2):
+            self.assertEqual(len(self.client.get('/api/albums/?limit=100').json()['albums']), 2)
+        for query in ('limit=0', 'limit=x', 'after=x'):
+            self.assertEqual(self.client.get(f'/api/albums/?{query}').status_code, 400)
+
+
+class PlaylistBatchTests(TestCase):
+    """/api/playlists/?ids=: several playlists with one query, tagged with every playlist's version."""
+
+    def setUp(self):
+        cache.clear()
+        owner = create_user('owner')
+        self.tracks = [Track.objects.create(title=f'Track {i}', file_url=f'/media/{i}.mp3') for i in range(3)]
+        self.mix = Playlist.objects.create(owner_user=owner, name='Mix')
+        for position, track in zip([200, 100, 300], self.tracks):
+            PlaylistTrack.objects.create(playlist=self.mix, track=track, position=position)
+        self.empty = Playlist.objects.create(owner_user=owner, name='Empty')
+
+    def test_requested_order_missing_ids_and_one_query(self):
+        missing = self.empty.pk + 100
+        with self.assertNumQueries(1):
+            data = self.client.get(f'/api/playlists/?ids={self.empty.pk},{missing},{self.mix.pk},{self.empty.pk}').json()
+        self.assertEqual([playlist['name'] for playlist in data['playlists']], ['Empty', 'Mix'])
+        self.assertEqual(data['missing'], [missing])
+        self.assertEqual(data['playlists'][0]['tracks'], [])
+        self.assertEqual(
+            [track['id'] for track in data['playlists'][1]['tracks']], [self.tracks[1].pk, self.tracks[0].pk, self.tracks[2].pk]
+        )
+        self.assertEqual(data['playlists'][1]['owner_username'], 'owner')
+
+    def test_same_payload_as_the_detail_endpoint(self):
+        batch = self.client.get(f'/api/playlists/?ids={self.mix.pk}').json()['playlists'][0]
+        self.assertEqual(batch, self.client.get(f'/api/playlist/{self.mix.pk}/').json())
+
+    def test_etag_changes_with_any_listed_playlist(self):
+        url = f'/api/playlists/?ids={self.mix.pk},{self.empty.pk}'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        bump_playlist_version(self.empty.pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get('/api/playlists/?ids=1,x').status_code, 400)
+        self.assertEqual(self.client.get('/api/playlists/').status_code, 400)
+        too_many = ','.join(str(i) for i in range(1, PLAYLIST_BATCH_MAX + 2))
+        self.assertEqual(self.client.get(f'/api/playlists/?ids={too_many}').status_code, 400)
+
+
+class ConnectionStatsTests(TestCase):
+    class Wrapper:
+        """Stands in for a DatabaseWrapper: only its connection attribute is read."""
+        connection = object()
+
+    def test_reuse_ratio_and_open_connections(self):
+        stats = ConnectionStats()
+        wrapper = self.Wrapper()
+        stats.connection_opened(sender=None, connection=wrapper)
+        for _ in range(3):
+            stats.request_started(sender=None)
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['connections_opened'], snapshot['requests'], snapshot['connections_per_request']), (1, 3, 0.333))
+        self.assertEqual(snapshot['open_connections'], 1)
+        wrapper.connection = None # Closed (CONN_MAX_AGE reached or a failed health check)
+        self.assertEqual(stats.snapshot()['open_connections'], 0)
+
+    def test_reset_keeps_the_total(self):
+        stats = ConnectionStats()
+        stats.connection_opened(sender=None, connection=self.Wrapper())
+        stats.reset()
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['connections_opened'], snapshot['connections_opened_total']), (0, 1))
+        self.assertIsNone(snapshot['connections_per_request'])
+
+    def test_requests_are_counted_by_the_signal(self):
+        before = connection_stats.snapshot()['requests']
+        self.client.get('/api/albums/')
+        self.client.get('/api/albums/')
+        self.assertEqual(connection_stats.snapshot()['requests'], before + 2)
+
+    def test_endpoint_is_for_admins_only(self):
+        self.client.force_login(create_user('alice'))
+        self.assertEqual(self.client.get('/api/db_pool_stats/').status_code, 403)
+        self.client.force_login(CustomUser.objects.create_superuser('admin', 'admin@example.com', userid='admin12abc'))
+        data = self.client.get('/api/db_pool_stats/').json()
+        self.assertEqual(data['conn_max_age'], connection.settings_dict['CONN_MAX_AGE'])
+        self.assertIn('connections_per_request', data)
+
+
+class MetricsMergeTests(TestCase):
+    """The /metrics endpoint adds up the dumps of every worker process."""
+
+    def setUp(self):
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        self.dir = metrics_dir.name
+        settings_override = override_settings(METRICS_DIR=self.dir, METRICS_TOKEN='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # This process, read live
+        live = mock.patch('home.metrics.process_metrics', return_value=self.snapshot(os.getpid(), 1))
+        live.start()
+        self.addCleanup(live.stop)
+
+    def snapshot(self, pid, requests):
+        view = [['view', 'get_tracks']]
+        histogram = [requests] + [0] * len(LATENCY_BUCKETS) + [0.004 * requests]
+        return {
+            'pid': pid,
+            'counters': [['freeflow_http_requests_total', view, requests]],
+            'histograms': [['freeflow_http_request_duration_seconds', view, histogram]],
+            'gauges': [['freeflow_db_connections_open', [['pid', str(pid)]], 2]],
+        }
+
+    def write(self, name, content):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(content if isinstance(content, str) else json.dumps(content))
+
+    def test_counters_and_histograms_of_every_process_add_up(self):
+        self.write('1001.json', self.snapshot(1001, 10))
+        self.write('1002.json', self.snapshot(1002, 100)) # Exited: totals kept, gauge dropped
+        self.write(f'{os.getpid()}.json', self.snapshot(os.getpid(), 5000)) # Stale dump of this process
+        self.write('1003.json', '{"pid": 10') # Half-written by a crashed worker
+        self.write('tmpabc.tmp', self.snapshot(1004, 1000))
+        with mock.patch('home.metrics.process_alive', side_effect=lambda pid: pid == 1001):
+            counters, histograms, gauges = merged_metrics()
+        view = (('view', 'get_tracks'),)
+        self.assertEqual(counters[('freeflow_http_requests_total', view)], 111)
+        self.assertEqual(histograms[('freeflow_http_request_duration_seconds', view)][0], 111)
+        self.assertAlmostEqual(histograms[('freeflow_http_request_duration_seconds', view)][-1], 0.444)
+        self.assertEqual(
+            sorted(labels[0][1] for _, labels in gauges), sorted([str(os.getpid()), '1001'])
+        )
+
+    def test_dump_is_read_back(self):
+        with mock.patch('home.metrics.os.getpid', return_value=1001):
+            dump_process_metrics()
+        self.assertEqual(os.listdir(self.dir), ['1001.json'])
+        with mock.patch('home.metrics.process_alive', return_value=True):
+            counters, _, _ = merged_metrics()
+        self.assertEqual(counters[('freeflow_http_requests_total', (('view', 'get_tracks'),))], 2)
+
+    def test_prometheus_exposition(self):
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE freeflow_http_request_duration_seconds histogram', text)
+        self.assertIn('freeflow_http_request_duration_seconds_bucket{view="get_tracks",le="0.005"} 1', text)
+        self.assertIn('freeflow_http_request_duration_seconds_bucket{view="get_tracks",le="+Inf"} 1', text)
+        self.assertIn('freeflow_http_request_duration_seconds_count{view="get_tracks"} 1', text)
+        self.assertIn('freeflow_http_requests_total{view="get_tracks"} 1', text)
+
+    def test_scrape_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class LoadtestScenarioTests(CatalogFixtureMixin, TestCase):
+    """Every path a loadtest scenario replays is routed and answered against a small catalog."""
+
+    def test_scenario_paths_resolve_and_succeed(self):
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', userid='admin12abc')
+        Playlist.objects.create(name='Mix', owner_user_id=admin.pk)
+        typeahead_index.build() # Built here, not by a background thread racing the test database
+        rng = random.Random(0)
+        fixture = Fixture(rng)
+        client = benchmark_client(fixture.superuser)
+        for scenario, visit in SCENARIOS.items():
+            for path in visit(fixture, rng):
+                with self.subTest(scenario=scenario, path=path):
+                    endpoint_name(path) # Resolver404 if a scenario drifted from urls.py
+                    self.assertEqual(client.get(path).status_code, 200)
+
+
+class MoveTrackTests(TestCase):
+    def setUp(self):
+        owner = create_user('owner')
+        self.playlist = Playlist.objects.create(owner_user=owner, name='Mix')
+        self.tracks = [Track.objects.create(title=f'Track {i}', file_url=f'/media/{i}.mp3') for i in range(4)]
+        for i, track in enumerate(self.tracks, 1):
+            PlaylistTrack.objects.create(playlist=self.playlist, track=track, position=i * POSITION_GAP)
+
+    def order(self):
+        return list(PlaylistTrack.objects.filter(playlist=self.playlist).order_by('position').values_list('track_id', flat=True))
+
+    def position(self, track):
+        return PlaylistTrack.objects.get(playlist=self.playlist, track=track).position
+
+    def test_move_writes_the_midpoint_of_the_new_neighbours(self):
+        first, second, third, fourth = self.tracks
+        self.assertTrue(move_track(self.playlist.pk, fourth.pk, first.pk))
+        self.assertEqual(self.position(fourth), 1.5 * POSITION_GAP)
+        self.assertEqual(self.order(), [first.pk, fourth.pk, second.pk, third.pk])
+
+    def test_move_to_the_top_and_to_the_end(self):
+        first, second, third, fourth = self.tracks
+        move_track(self.playlist.pk, third.pk, None)
+        self.assertEqual(self.position(third), 0)
+        move_track(self.playlist.pk, first.pk, fourth.pk)
+        self.assertEqual(self.order(), [third.pk, second.pk, fourth.pk, first.pk])
+
+    def test_unknown_track_is_refused(self):
+        self.assertFalse(move_track(self.playlist.pk, 999, None))
+        self.assertFalse(move_track(self.playlist.pk, self.tracks[0].pk, 999))
+
+    def test_narrow_gaps_are_found_and_rebalanced(self):
+        first, second, third, fourth = self.tracks
+        self.assertEqual(playlists_to_rebalance(), [])
+        for i in range(30): # Halves the gap after the first track every time
+            move_track(self.playlist.pk, (fourth, third)[i % 2].pk, first.pk)
+        order = self.order()
+        self.assertEqual(playlists_to_rebalance(), [self.playlist.pk])
+
+        self.assertEqual(rebalance_playlist(self.playlist.pk), 4)
+        self.assertEqual(self.order(), order)
+        positions = sorted(PlaylistTrack.objects.filter(playlist=self.playlist).values_list('position', flat=True))
+        self.assertEqual(positions, [i * POSITION_GAP for i in range(1, 5)])
+        self.assertEqual(playlists_to_rebalance(), [])
+
+
+class ReadJsonArrayTests(TestCase):
+    def read(self, text, chunk_size=7):
+        with mock.patch('home.catalog_ingest.JSON_CHUNK_SIZE', chunk_size):
+            return list(read_json_array(io.StringIO(text)))
+
+    def test_objects_split_across_chunks(self):
+        records = [{'title': f'Track {i}', 'artist': 'Ünïcode, "quoted"'} for i in range(20)]
+        text = ' \n' + json.dumps(records, indent=2)
+        for chunk_size in (1, 2, 7, 64, 1 << 16):
+            self.assertEqual(self.read(text, chunk_size), records)
+
+    def test_empty_array(self):
+        self.assertEqual(self.read('[ ]'), [])
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            self.read('{"title": "x"}')
+
+    def test_truncated_file(self):
+        with self.assertRaises(ValueError):
+            self.read('[{"title": "a"}, {"title": "b"')
+
+
+class CatalogIngestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.records = [
+            {'title': f'Track {i}', 'file_url': f'/media/{i}.mp3', 'artist': 'Drake', 'album': 'Views'}
+            for i in range(5)
+        ] + [{'title': 'No file url', 'artist': 'Drake'}]
+
+    def failing_after(self, count):
+        """The records, then an error after `count` of them (a truncated file)."""
+        def records():
+            yield from self.records[:count]
+            raise ValueError("The JSON catalog is truncated or invalid")
+        return records()
+
+    def test_resume_after_a_failed_batch(self):
+        with self.assertRaises(ValueError):
+            CatalogIngest('catalog', batch_size=2).run(self.failing_after(3))
+        job = CatalogImport.objects.get(name='catalog')
+        # The first batch committed with its checkpoint, the interrupted one left nothing behind
+        self.assertEqual((job.records_done, job.tracks_created), (2, 2))
+        self.assertIsNotNone(job.error)
+        self.assertEqual(Track.objects.count(), 2)
+
+        job = CatalogIngest('catalog', batch_size=2).run(iter(self.records))
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(job.error)
+        self.assertEqual((job.records_done, job.tracks_created, job.skipped), (6, 5, 1))
+        self.assertEqual(sorted(Track.objects.values_list('title', flat=True)), [f'Track {i}' for i in range(5)])
+        self.assertEqual(Artist.objects.count(), 1)
+        self.assertEqual(Album.objects.count(), 1)
+        self.assertEqual(Track.objects.filter(album__title='Views').count(), 5)
+
+    def test_failed_write_rolls_back_its_batch_and_checkpoint(self):
+        ingest = CatalogIngest('catalog', batch_size=2)
+        with mock.patch('home.catalog_ingest.first_new_id', side_effect=[1, 1, 3, RuntimeError("lost connection")]):
+            with self.assertRaises(RuntimeError):
+                ingest.run(iter(self.records))
+        job = CatalogImport.objects.get(name='catalog')
+        self.assertEqual(job.records_done, 2)
+        self.assertEqual(Track.objects.count(), 2)
+
+        job = CatalogIngest('catalog', batch_size=2).run(iter(self.records))
+        self.assertEqual(job.tracks_created, 5)
+        self.assertEqual(Track.objects.count(), 5)
+
+    def test_finished_import_is_not_run_again(self):
+        CatalogIngest('catalog').run(iter(self.records))
+        job = CatalogIngest('catalog').run(iter(self.records))
+        self.assertEqual(job.tracks_created, 5)
+        self.assertEqual(Track.objects.count(), 5)
@@ -0,0 +1,59 @@
+from django.db import connection, transaction
+
+from .models import TrackArtist
+from .schema import create_model_cascading
+
+
+def track_artists_table_exists():
+    return TrackArtist._meta.db_table in connection.introspection.table_names()
+
+
+def create_track_artists_table():
+    """
+    Create track_artists with its indexes and foreign keys (the model is unmanaged, so no migration does it).
+    Deleting a track or an artist in SQL drops its credits too, as the ORM's on_delete does.
+    """
+    create_model_cascading(TrackArtist)
+
+
+def credited_artist_ids(track):
+    return list(TrackArtist.objects.filter(track=track).values_list('artist_id', flat=True))
+
+
+def set_track_artists(track, artists):
+    """Replace the credits of a track; artists in order, primary first. Duplicates are ignored."""
+    seen = set()
+    rows = []
+    for artist in artists:
+        if artist.pk in seen:
+            continue
+        seen.add(artist.pk)
+        rows.append(TrackArtist(track=track, artist=artist, position=len(rows) + 1))
+    with transaction.atomic():
+        TrackArtist.objects.filter(track=track).delete()
+        TrackArtist.objects.bulk_create(rows)
+
+
+def backfill_track_artists():
+    """
+    Rebuild track_artists from the artist_name columns of every track, matching names
+    against artists (the lowest artist_id wins when a name is used twice).
+    Returns the number of rows written.
+    """
+    written = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM track_artists")
+        for position, column in enumerate(('artist_name', 'artist_name2', 'artist_name3'), 1):
+            cursor.execute(f"""
+                INSERT INTO track_artists (track_id, artist_id, position)
+                SELECT t.track_id, MIN(a.artist_id), %s
+                FROM tracks t
+                JOIN artists a ON a.name = t.{column}
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM track_artists ta
+                    WHERE ta.track_id = t.track_id AND ta.artist_id = a.artist_id
+                )
+                GROUP BY t.track_id
+            """, [position])
+            written += cursor.rowcount
+    return written
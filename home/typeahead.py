@@ -0,0 +1,206 @@
+import heapq
+import logging
+import threading
+import time
+from array import array
+
+from django.db import connection
+
+from .models import Track
+from .search_index import tokenize
+from .versions import catalog_version
+
+logger = logging.getLogger(__name__)
+
+TYPEAHEAD_TOP_K = 10
+# Keys and queries are cut to this many characters; past it a prefix is selective enough
+MAX_KEY_LENGTH = 32
+# Prefixes matching more keys than this get their top K precomputed at build time,
+# so a lookup never scans more than this many entries
+HEAVY_PREFIX_THRESHOLD = 1024
+# Rebuild at least this often so popularity (playlist counts) stays reasonably fresh
+TYPEAHEAD_REFRESH = 10 * 60
+
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def typeahead_key(text):
+    """Normalized form used for keys and queries: accent-free, casefolded words joined by one space."""
+    return ' '.join(tokenize(text))[:MAX_KEY_LENGTH]
+
+
+def track_keys(*texts):
+    """Every word-start suffix of each text, so 'bling' and 'hotline bl' both find 'Hotline Bling'."""
+    keys = set()
+    for text in texts:
+        tokens = tokenize(text)
+        for i in range(len(tokens)):
+            keys.add(' '.join(tokens[i:])[:MAX_KEY_LENGTH])
+    return keys
+
+
+class TypeaheadSnapshot:
+    """
+    Sorted-array prefix index over track titles and artist names.
+
+    All keys are stored sorted in one string (`_blob`, sliced through `_offsets`), each
+    pointing at a dense track position in `_entries`. A prefix is a contiguous range
+    found with two binary searches. Ranges larger than HEAVY_PREFIX_THRESHOLD have
+    their top K by popularity precomputed; smaller ones are scanned.
+    """
+
+    def __init__(self, rows, popularity, version=None, top_k=TYPEAHEAD_TOP_K,
+                 heavy_threshold=HEAVY_PREFIX_THRESHOLD):
+        """rows: iterable of (track_id, title, artist_name, artist_name2, artist_name3); popularity: {track_id: count}."""
+        self.version = version
+        self.built_at = time.monotonic()
+        self.top_k = top_k
+        self.heavy_threshold = heavy_threshold
+        self._track_ids = array('l')
+        self._popularity = array('l')
+
+        keys = []
+        entries = array('l')
+        for track_id, title, *artist_names in rows:
+            position = len(self._track_ids)
+            self._track_ids.append(track_id)
+            self._popularity.append(popularity.get(track_id, 0))
+            for key in track_keys(title, *artist_names):
+                keys.append(key)
+                entries.append(position)
+
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._blob = ''.join(keys[i] for i in order)
+        self._offsets = array('l', [0])
+        total = 0
+        for i in order:
+            total += len(keys[i])
+            self._offsets.append(total)
+        self._entries = array('l', (entries[i] for i in order))
+        del keys, order, entries
+
+        self._heavy = {}
+        if self._entries:
+            self._collect(0, len(self._entries), 0)
+
+    def __len__(self):
+        return len(self._track_ids)
+
+    def _key(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def _lower_bound(self, value, lo, hi):
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _rank(self, position):
+        # Most playlisted first, then oldest track
+        return (self._popularity[position], -position)
+
+    def _top(self, positions):
+        return heapq.nlargest(self.top_k, set(positions), key=self._rank)
+
+    def _collect(self, lo, hi, depth):
+        """
+        Top K positions for the range [lo, hi), whose keys share their first `depth` characters.
+        Splits heavy ranges by the next character and merges the children's top K bottom-up.
+        """
+        if hi - lo <= self.heavy_threshold:
+            return self._top(self._entries[lo:hi])
+
+        prefix = self._key(lo)[:depth]
+        candidates = []
+        i = lo
+        # Keys equal to the prefix itself sort first
+        end = self._lower_bound(prefix + '\x00', i, hi)
+        if end > i:
+            candidates.extend(self._top(self._entries[i:end]))
+            i = end
+        while i < hi:
+            child = self._key(i)[:depth + 1]
+            end = self._lower_bound(child + _MAX_CHAR, i, hi)
+            candidates.extend(self._collect(i, end, depth + 1))
+            i = end
+
+        top = self._top(candidates)
+        self._heavy[prefix] = top
+        return top
+
+    def suggest(self, query, limit=TYPEAHEAD_TOP_K):
+        """Ids of the most popular tracks with a title or artist word sequence starting with query."""
+        prefix = typeahead_key(query)
+        if not prefix:
+            return []
+        limit = min(limit, self.top_k)
+        top = self._heavy.get(prefix)
+        if top is None:
+            lo = self._lower_bound(prefix, 0, len(self._entries))
+            hi = self._lower_bound(prefix + _MAX_CHAR, lo, len(self._entries))
+            top = self._top(self._entries[lo:hi])
+        return [self._track_ids[position] for position in top[:limit]]
+
+
+def load_typeahead_snapshot(version):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT tracks, COUNT(*) FROM playlisttracks GROUP BY tracks")
+        popularity = dict(cursor.fetchall())
+    rows = (
+        Track.objects.order_by()
+        .values_list('track_id', 'title', 'artist_name', 'artist_name2', 'artist_name3')
+        .iterator(chunk_size=5000)
+    )
+    return TypeaheadSnapshot(rows, popularity, version=version)
+
+
+class TypeaheadIndex:
+    """
+    Per-process holder of the current TypeaheadSnapshot.
+
+    Snapshots are built in a background thread: the first one on the first lookup (which,
+    like every lookup until it is ready, suggests nothing rather than wait or scan the
+    tracks table), later ones on a new catalog version or an old snapshot, while the
+    previous snapshot keeps answering.
+    """
+
+    def __init__(self, refresh_interval=TYPEAHEAD_REFRESH):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def _rebuild(self, version):
+        try:
+            self._snapshot = load_typeahead_snapshot(version)
+        except Exception:
+            logger.exception("Typeahead index rebuild failed")
+        finally:
+            self._rebuilding = False
+            connection.close() # This thread's own connection
+
+    def build(self):
+        """Build a snapshot in this thread and wait for it (warm-up, benchmarks)."""
+        self._snapshot = load_typeahead_snapshot(catalog_version())
+        return self._snapshot
+
+    def snapshot(self):
+        """The current snapshot, or None while the first one is being built."""
+        version = catalog_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version or time.monotonic() - snapshot.built_at > self.refresh_interval:
+            with self._lock:
+                if not self._rebuilding:
+                    self._rebuilding = True
+                    threading.Thread(target=self._rebuild, args=(version,), daemon=True).start()
+        return snapshot
+
+    def suggest(self, query, limit=TYPEAHEAD_TOP_K):
+        snapshot = self.snapshot()
+        return snapshot.suggest(query, limit) if snapshot is not None else []
+
+
+typeahead_index = TypeaheadIndex()
@@ -12,6 +12,8 @@ urlpatterns = [
     path('playlist/<int:playlist_id>/', home_views.music_home, name='playlist_page'),
     # URL for fetching album data as JSON (for AJAX)
     path('api/album/<int:album_id>/', home_views.album_detail_json, name='album_detail_json'),
+    # Keyset-paginated album shelf (covers and titles only)
+    path('api/albums/', home_views.album_shelf_json, name='album_shelf_json'),
     path('api/check_email/', views.check_email, name='check_email'),
     path('api/signup/', views.signup_user, name='signup_user'),
     path('api/login/', views.login_user, name='login_user'),
@@ -20,10 +22,15 @@ urlpatterns = [
     path('api/create_playlist/', views.create_playlist, name='create_playlist'),
     path('api/update_playlist/', views.update_playlist, name='update_playlist'),
     path('api/playlist/<int:playlist_id>/', views.playlist_detail_json, name='playlist_detail_json'), # Added playlist detail API URL
+    path('api/playlists/', views.playlists_batch_json, name='playlists_batch_json'), # Several playlists in one request
     path('api/search_tracks/', views.search_tracks_json, name='search_tracks_json'),
     path('api/add_track_to_playlist/', views.add_track_to_playlist, name='add_track_to_playlist'),
     path('api/search/tracks/', views.search_tracks, name='search_tracks'),
+    path('api/typeahead/', views.typeahead_json, name='typeahead_json'), # Prefix suggestions for the track pickers
     path('api/remove_track_from_playlist/', views.remove_track_from_playlist, name='remove_track_from_playlist'),
+    path('api/duplicate_playlist/', views.duplicate_playlist_view, name='duplicate_playlist'), # Copy a playlist into your library
+    path('api/playlist_tracks/move/', views.move_playlist_track, name='move_playlist_track'), # Reorder by writing one row
+    path('api/playlist_tracks/bulk/', views.bulk_update_playlist_tracks, name='bulk_update_playlist_tracks'), # Many adds/removes in one transaction
     path('api/delete_playlist/', views.delete_playlist, name='delete_playlist'),
     path('logout/', views.custom_logout, name='logout'),
 
@@ -33,6 +40,9 @@ urlpatterns = [
     path('api/friends/pending/', views.get_pending_requests, name='get_pending_requests'),
     path('api/friends/list/', views.get_friends_list, name='get_friends_list'),
     path('api/friends/active/', views.get_active_friends, name='get_active_friends'),
+    path('api/events/', views.friend_events, name='friend_events'),
+    path('api/db_pool_stats/', views.db_pool_stats, name='db_pool_stats'),
+    path('metrics', views.metrics, name='metrics'), # Prometheus scrape target
 
     # Blocking URLs
     path('api/block/', views.block_user, name='block_user'),
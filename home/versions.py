@@ -0,0 +1,94 @@
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .playlists import parse_playlist_ids
+
+# Version stamps live in the shared cache and are bumped on every write to what they cover.
+# Views use them as ETags, so a conditional GET is answered with 304 Not Modified
+# without running the view's queries or serializing anything.
+# Stamps never expire, so an ETag stays valid until a write. The cache must be shared by
+# every process for a bump to reach them all: `manage.py check --deploy` fails on a
+# per-process cache (home/checks.py).
+CATALOG_VERSION_KEY = 'catalog_version'
+PLAYLIST_VERSION_KEY = 'playlist_version:{}'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Unknown after a cache restart: start from a new value so old ETags never match
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """get_version() for several keys with one cache round trip when they are all known."""
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else get_version(key) for key in keys]
+
+
+def bump_version(key):
+    version = time.time_ns()
+    cache.set(key, version, None)
+    return version
+
+
+def catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def playlist_version(playlist_id):
+    return get_version(PLAYLIST_VERSION_KEY.format(playlist_id))
+
+
+def bump_playlist_version(playlist_id):
+    return bump_version(PLAYLIST_VERSION_KEY.format(playlist_id))
+
+
+def catalog_etag(request, *args, **kwargs):
+    return f"catalog-{catalog_version()}"
+
+
+def playlist_etag(request, playlist_id, *args, **kwargs):
+    # Playlist payloads embed track and album data too, so the catalog stamp is part of the tag
+    return f"playlist-{playlist_id}-{playlist_version(playlist_id)}-{catalog_version()}"
+
+
+def playlists_etag(request, *args, **kwargs):
+    try:
+        playlist_ids = parse_playlist_ids(request.GET.get('ids'))
+    except ValueError:
+        return None # Let the view answer 400
+    versions = get_versions([PLAYLIST_VERSION_KEY.format(playlist_id) for playlist_id in playlist_ids])
+    pairs = '.'.join(f"{playlist_id}:{version}" for playlist_id, version in zip(playlist_ids, versions))
+    return f"playlists-{pairs}-{catalog_version()}"
+
+
+def etag_versioned(etag_func):
+    """
+    Answer conditional GETs from a version stamp: 304 when If-None-Match matches,
+    otherwise run the view and tag its response. Responses are marked no-cache so
+    browsers always revalidate instead of serving a stale copy.
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304) and response.has_header('ETag'):
+                # Never let a client revalidate against an error page
+                del response['ETag']
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
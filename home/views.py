@@ -1,17 +1,41 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
+import asyncio
 import json
+import logging
+import math
+import time
 from django.contrib.auth import get_user_model
 from .models import Track, Album, Artist  # Import your models
 from .models import Track, Album, Artist, Playlist # Import Playlist model
+from .feed import ALBUM_SHELF_MAX_PAGE_SIZE, ALBUM_SHELF_PAGE_SIZE, album_shelf_page, get_home_feed
+from .recommendations import fetch_tracks_in_order, sample_track_ids
+from .middleware import invalidate_user_context, user_owns_playlist
+from .playlist_positions import append_position_sql, move_track
+from .events import event_bus, format_event, load_friend_ids, publish_to_users, stream_topics
+from .notifications import NOTIFICATION_MAX_WAIT, NOTIFICATION_POLL_INTERVAL, fetch_notifications, latest_notification_id
+from .db_connections import connection_stats
+from .db_router import read_alias, read_connection, replica_reads
+from .metrics import merged_metrics, render_prometheus
+from .friend_edges import add_friend_edges, remove_friend_edges
+from .presence import presence_store
+from .social_graph import get_social_graph, invalidate_social_graph, resolve_userid
+from .playlists import apply_playlist_operations, duplicate_playlist, fetch_playlists, parse_playlist_ids
+from .versions import bump_playlist_version, catalog_etag, catalog_version, etag_versioned, playlist_etag, playlists_etag
+from .artist_pages import get_artist_page
+from .search_index import search_index
+from .typeahead import TYPEAHEAD_TOP_K, typeahead_index
 from datetime import datetime, timedelta, timezone  # Add datetime imports
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone  # Ensure this import is present
-from django.db import connection
+from django.db import connection, connections, transaction
 from django.contrib.auth import authenticate, login
 import random
 import string
+from functools import wraps
 from django.contrib.auth import logout
 from django.http import HttpResponseRedirect
 from django.urls import reverse
@@ -19,24 +43,20 @@ from django.views.decorators.http import require_POST
 from django.conf import settings
 from django.contrib.auth.decorators import login_required # Import login_required
 
+logger = logging.getLogger(__name__)
+
+def current_listening_to(request, user_context):
+    """The user's own "listening to": the presence store is ahead of the cached context."""
+    user_id = request.session.get('_auth_user_id')
+    if not user_id:
+        return user_context['listeningto']
+    return presence_store.get_listening([user_id]).get(int(user_id), user_context['listeningto'])
+
 # Accept optional album_id from the URL dispatcher
 def music_home(request, album_id=None, playlist_id=None): # Add playlist_id parameter
-    # --- Fetch Data Examples (Only needed for the actual home page view) ---
-    made_for_you_tracks = []
+    # --- Catalog part of the page (same for every visitor, served from the shared feed cache) ---
+    feed = get_home_feed()
     recommended_tracks = [] # Changed from recommended_albums
-    recent_tracks = []
-    latest_track_for_player = None
-
-    # Fetch albums for display in main-content-header
-    albums = Album.objects.prefetch_related('tracks').all()
-
-    # Only fetch home page data if we are not loading a specific album page initially
-    # (We could fetch it anyway, but it's slightly more efficient not to if just rendering the shell for an album)
-    # However, let's keep fetching it for simplicity, the JS will replace the content anyway.
-    # Fetch tracks for "Made For You" (e.g., first 7)
-    # Use select_related to optimize fetching album/artist info if needed in template
-    made_for_you_tracks = Track.objects.all().only('title', 'artist_name', 'file_url', 'track_image_url')[:7]
-    print(f"DEBUG: Found {made_for_you_tracks.count()} tracks for 'Made For You'") # Add print statement
 
     # --- Fetch Recommended Tracks with 24h Cache ---
     now = timezone.now()
@@ -63,70 +83,34 @@ def music_home(request, album_id=None, playlist_id=None): # Add playlist_id para
             cache_valid = True
 
     if cache_valid:
-        # Fetch tracks from cached IDs, preserving order might be tricky with filter(id__in=...)
-        # Fetching individually or using a Case/When might be needed for strict order preservation
-        # For simplicity, let's fetch and rely on Python sorting if order matters deeply,
-        # or accept database default order for filter(id__in=...).
-        recommended_tracks = list(Track.objects.filter(track_id__in=recommended_track_ids).only('track_id', 'title', 'artist_name', 'file_url', 'track_image_url'))
-        # Optional: Reorder based on stored ID list if needed
-        # ordered_tracks = {track.track_id: track for track in fetched_tracks}
-        # recommended_tracks = [ordered_tracks[tid] for tid in recommended_track_ids if tid in ordered_tracks]
-        print("DEBUG: Using cached recommended tracks.")
+        # Primary-key fetch that keeps the order of the stored id list
+        recommended_tracks = fetch_tracks_in_order(recommended_track_ids)
     else:
-        # Fetch 7 new random tracks
-        recommended_tracks = list(Track.objects.order_by('?').only('track_id', 'title', 'artist_name', 'file_url', 'track_image_url')[:7])
+        # Draw 7 new tracks from the sampling index, seeded per session and day
+        seed = f"{request.session.session_key}:{now.date()}" if request.session.session_key else None
+        recommended_tracks = fetch_tracks_in_order(sample_track_ids(7, seed))
         # Update session cache
         request.session['recommended_track_ids'] = [track.track_id for track in recommended_tracks]
         request.session['recommended_timestamp'] = now.isoformat() # Store as ISO format string
-        print("DEBUG: Fetched new recommended tracks and updated cache.")
     # --- End Recommended Tracks ---
 
-    # Fetch tracks for "Recent Listening" (e.g., latest 5 by ID)
-    recent_tracks = Track.objects.all().only('title', 'artist_name', 'file_url', 'track_image_url').order_by('-track_id')[:5]
-
-    # Fetch the first track overall to potentially preload the player
-    # Fetch the latest track overall to potentially preload the player
-    latest_track_for_player = Track.objects.order_by('-track_id').first()
-
-    # Use session cookies to determine authentication state
-    user_id = request.session.get('_auth_user_id')
-    is_authenticated = bool(user_id)
-    is_superuser = False
-    username = None
-    listeningto = None
-    userid = None
-    user_icon_url = None
-    user_playlists = []
-    has_playlists = False
-    if is_authenticated:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT is_superuser, username, listeningto, userid, icon_url FROM auth_user WHERE id=%s", [user_id])
-            row = cursor.fetchone()
-            if row:
-                is_superuser, username, listeningto, userid, user_icon_url = bool(row[0]), row[1], row[2], row[3], row[4]
-        # Fetch playlists for this user
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT playlist_id, name, cover_image_url FROM playlists WHERE owner_user_id=%s", [user_id])
-            user_playlists = cursor.fetchall()
-            has_playlists = len(user_playlists) > 0
+    # Per-user part (profile and playlists), cached in the session by UserContextMiddleware
+    user_context = request.user_context
 
     # --- Prepare Context ---
     context = {
-        'made_for_you_items': made_for_you_tracks,
+        **feed, # made_for_you_items, recent_items, initial_player_track and albums
         'recommended_items': recommended_tracks, # Pass tracks here now
-        'recent_items': recent_tracks,
-        'initial_player_track': latest_track_for_player, # Pass the latest track for the player
         'initial_album_id': album_id, # Pass the album_id if provided by URL
         'initial_playlist_id': playlist_id, # Pass the playlist_id if provided by URL
-        'albums': albums, # Add albums to context
-        'user': username,  # Ensure the current username is passed
-        'user_id': userid,
-        'listeningto': listeningto,
-        'is_authenticated': is_authenticated,
-        'is_superuser': is_superuser,
-        'user_icon_url': user_icon_url,
-        'has_playlists': has_playlists,
-        'user_playlists': user_playlists,
+        'user': user_context['username'],  # Ensure the current username is passed
+        'user_id': user_context['userid'],
+        'listeningto': current_listening_to(request, user_context),
+        'is_authenticated': user_context['is_authenticated'],
+        'is_superuser': user_context['is_superuser'],
+        'user_icon_url': user_context['icon_url'],
+        'has_playlists': bool(user_context['playlists']),
+        'user_playlists': user_context['playlists'],
     }
 
     # --- Render Template ---
@@ -134,6 +118,8 @@ def music_home(request, album_id=None, playlist_id=None): # Add playlist_id para
     return render(request, 'index.html', context)
 
 # Renamed view to return JSON data specifically
+@replica_reads(catalog_version)
+@etag_versioned(catalog_etag)
 def album_detail_json(request, album_id):
     album = get_object_or_404(
         Album.objects.select_related('primary_artist').prefetch_related('tracks'), # Keep optimizations
@@ -157,6 +143,33 @@ def album_detail_json(request, album_id):
     }
     return JsonResponse(album_data)
 
+@replica_reads(catalog_version)
+def album_shelf_json(request):
+    """
+    Keyset-paginated album listing for the home shelf: /api/albums/?after=<album_id>&limit=<n>
+    Only covers and titles; tracks are loaded through album_detail_json when an album is opened.
+    """
+    try:
+        after = request.GET.get('after')
+        after = int(after) if after else None
+        limit = min(int(request.GET.get('limit', ALBUM_SHELF_PAGE_SIZE)), ALBUM_SHELF_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+    albums, next_cursor = album_shelf_page(after, limit)
+    return JsonResponse({
+        'albums': [
+            {
+                'album_id': album.album_id,
+                'title': album.title,
+                'cover_image_url': album.image_url_or_default,
+            } for album in albums
+        ],
+        'next_cursor': next_cursor,
+    })
+
 @csrf_exempt
 def check_email(request):
     if request.method == "POST":
@@ -305,6 +318,7 @@ def update_icon(request):
             return JsonResponse({'success': False, 'error': 'Image link too long (max 999 characters).'}, status=400)
         with connection.cursor() as cursor:
             cursor.execute("UPDATE auth_user SET icon_url=%s WHERE id=%s", [icon_url, user_id])
+        invalidate_user_context(user_id)
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
@@ -335,6 +349,10 @@ def update_username(request):
         # Update the username in the database
         with connection.cursor() as cursor:
             cursor.execute("UPDATE auth_user SET username=%s WHERE id=%s", [new_username, user_id])
+        # Playlist payloads show the owner's username
+        for playlist in request.user_context['playlists']:
+            bump_playlist_version(playlist[0])
+        invalidate_user_context(user_id)
 
         # Update the username cookie
         response = JsonResponse({'success': True, 'new_username': new_username})
@@ -361,6 +379,7 @@ def create_playlist(request):
                 "INSERT INTO playlists (name, owner_user_id) VALUES (%s, %s)",
                 [name, user_id]
             )
+        invalidate_user_context(user_id)
         return JsonResponse({'success': True})
     except Exception as e:
         # If you get a foreign key error, your playlists.owner_user_id is referencing users.user_id, not auth_user.id
@@ -395,99 +414,36 @@ def update_playlist(request):
             if cursor.rowcount == 0:
                 return JsonResponse({'success': False, 'error': 'Playlist not found or access denied'}, status=403)
 
+        invalidate_user_context(user_id)
+        bump_playlist_version(playlist_id)
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
+@etag_versioned(playlist_etag)
 def playlist_detail_json(request, playlist_id):
+    """Playlist, owner username and tracks in one joined query."""
+    playlist = fetch_playlists([playlist_id]).get(playlist_id)
+    if playlist is None:
+        return JsonResponse({'error': 'Playlist not found'}, status=404)
+    return JsonResponse(playlist)
+
+@etag_versioned(playlists_etag)
+def playlists_batch_json(request):
     """
-    API endpoint to return details of a specific playlist, including its tracks.
+    Several playlists in one round trip: /api/playlists/?ids=1,2,3
+    Same payload per playlist as playlist_detail_json, in the requested order; unknown ids are listed in 'missing'.
     """
     try:
-        # Fetch the playlist using the Django ORM
-        # Assuming 'tracks' is the related_name or default for the M2M field on Playlist model
-        playlist = get_object_or_404(Playlist.objects.prefetch_related('tracks'), pk=playlist_id)
+        playlist_ids = parse_playlist_ids(request.GET.get('ids'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
-        # Optional: Check ownership if playlists are private
-        # user_id = request.session.get('_auth_user_id')
-        # if playlist.owner_user_id != user_id:
-        #     return JsonResponse({'error': 'Forbidden'}, status=403)
-
-        # Prepare playlist data
-        playlist_data = {
-            'playlist_id': playlist.playlist_id,
-            'name': playlist.name,
-            'cover_image_url': playlist.image_url_or_default, # Use property for fallback
-            'owner_username': playlist.owner_user.username if playlist.owner_user else 'Unknown', # Get owner username
-            'tracks': []
-        }
-
-        # Prepare track data using the ORM relationship
-        for track in playlist.tracks.all():
-            playlist_data['tracks'].append({
-                'id': track.track_id,
-                'title': track.title,
-                'file_url': track.file_url,
-                'image_url': track.image_url_or_default, # Use property for fallback
-                'artist_name': track.all_artists, # Use property for combined artists
-                'album_title': track.album.title if track.album else 'Unknown Album',
-                # Add duration if available in your Track model/db
-                # 'duration': format_duration(track.duration_seconds)
-            })
-
-        return JsonResponse(playlist_data)
-
-    except Playlist.DoesNotExist:
-         return JsonResponse({'error': 'Playlist not found'}, status=404)
-    except Exception as e:
-        # Log the error e
-        print(f"Error fetching playlist {playlist_id}: {e}") # Basic logging
-        return JsonResponse({'error': 'An error occurred'}, status=500)
-
-def playlist_detail_json(request, playlist_id):
-    # Fetch playlist info
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT playlist_id, name, cover_image_url, owner_user_id FROM playlists WHERE playlist_id=%s",
-            [playlist_id]
-        )
-        row = cursor.fetchone()
-        if not row:
-            return JsonResponse({'error': 'Playlist not found'}, status=404)
-        playlist = {
-            'playlist_id': row[0],
-            'name': row[1],
-            'cover_image_url': row[2],
-            'owner_user_id': row[3],
-        }
-    # Fetch owner username
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT username FROM auth_user WHERE id=%s", [playlist['owner_user_id']])
-        owner_row = cursor.fetchone()
-        playlist['owner_username'] = owner_row[0] if owner_row else 'Unknown'
-
-    # Fetch tracks in playlist
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT t.track_id, t.title, t.file_url, t.track_img_url, t.artist_name, t.album_id, a.title as album_title
-            FROM playlisttracks pt
-            JOIN tracks t ON pt.tracks = t.track_id
-            LEFT JOIN albums a ON t.album_id = a.album_id
-            WHERE pt.playlistid = %s
-        """, [playlist_id])
-        tracks = []
-        for t in cursor.fetchall():
-            tracks.append({
-                'id': t[0], # Match the key expected by frontend ('track.id')
-                'title': t[1],
-                'file_url': t[2],
-                'image_url': t[3],
-                'artist_name': t[4],
-                'album_id': t[5],
-                'album_title': t[6],
-            })
-    playlist['tracks'] = tracks
-    return JsonResponse(playlist)
+    playlists = fetch_playlists(playlist_ids)
+    return JsonResponse({
+        'playlists': [playlists[playlist_id] for playlist_id in playlist_ids if playlist_id in playlists],
+        'missing': [playlist_id for playlist_id in playlist_ids if playlist_id not in playlists],
+    })
 
 @csrf_exempt
 @require_POST
@@ -537,24 +493,17 @@ def search_tracks_json(request):
             if len(query) < 2:
                 return JsonResponse({'tracks': []})
 
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT track_id, title, artist_name, file_url, track_img_url 
-                    FROM tracks 
-                    WHERE title LIKE %s OR artist_name LIKE %s
-                    LIMIT 8
-                """, [f'%{query}%', f'%{query}%'])
-                
-                tracks = []
-                for row in cursor.fetchall():
-                    tracks.append({
-                        'id': row[0],
-                        'title': row[1],
-                        'artist': row[2],
-                        'file_url': row[3],
-                        'image_url': row[4]
-                    })
-                return JsonResponse({'tracks': tracks})
+            # Ranked lookup in the in-memory search index (no LIKE scan on tracks)
+            tracks = []
+            for track in search_index.search_tracks(query, limit=8):
+                tracks.append({
+                    'id': track['id'],
+                    'title': track['title'],
+                    'artist': track['artist_name'],
+                    'file_url': track['file_url'],
+                    'image_url': track['track_img_url']
+                })
+            return JsonResponse({'tracks': tracks})
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Invalid request'}, status=400)
@@ -564,26 +513,45 @@ def search_tracks(request):
     if len(query) < 2:
         return JsonResponse({'tracks': []})
         
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT track_id, title, artist_name, file_url, track_img_url
-            FROM tracks 
-            WHERE LOWER(title) LIKE LOWER(%s) OR LOWER(artist_name) LIKE LOWER(%s)
-            LIMIT 10
-        """, [f'%{query}%', f'%{query}%'])
-        
-        tracks = []
-        for row in cursor.fetchall():
-            tracks.append({
-                'id': row[0],
-                'title': row[1],
-                'artist_name': row[2],
-                'file_url': row[3],
-                'image_url': row[4] or '/static/default-track.png'
-            })
-    
+    tracks = []
+    for track in search_index.search_tracks(query, limit=10):
+        tracks.append({
+            'id': track['id'],
+            'title': track['title'],
+            'artist_name': track['artist_name'],
+            'file_url': track['file_url'],
+            'image_url': track['track_img_url'] or '/static/default-track.png'
+        })
+
     return JsonResponse({'tracks': tracks})
 
+def typeahead_json(request):
+    """
+    Search-as-you-type suggestions for the track pickers: /api/typeahead/?q=<prefix>&limit=<n>
+    Tracks whose title or artist words start with the prefix, most playlisted first.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET.get('limit', TYPEAHEAD_TOP_K)), TYPEAHEAD_TOP_K)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    if not query or limit < 1:
+        return JsonResponse({'tracks': []})
+
+    # Prefix lookup in memory, then one primary-key fetch for the handful of suggestions
+    track_ids = typeahead_index.suggest(query, limit)
+    return JsonResponse({
+        'tracks': [
+            {
+                'id': track.track_id,
+                'title': track.title,
+                'artist': track.artist_name,
+                'file_url': track.file_url,
+                'image_url': track.image_url_or_default,
+            } for track in fetch_tracks_in_order(track_ids)
+        ]
+    })
+
 @require_POST
 def add_track_to_playlist(request):
     try:
@@ -593,14 +561,16 @@ def add_track_to_playlist(request):
         
         if not playlist_id or not track_id:
             return JsonResponse({'success': False, 'error': 'Missing data'}, status=400)
+
+        # Ownership check against the session-cached playlist summary (no query on a warm session)
+        if not user_owns_playlist(request, playlist_id):
+            return JsonResponse({'success': False, 'error': 'Playlist not found or access denied'}, status=403)
             
         with connection.cursor() as cursor:
-            # Insert into playlisttracks
-            cursor.execute("""
-                INSERT INTO playlisttracks (playlistid, tracks) 
-                VALUES (%s, %s)
-            """, [playlist_id, track_id])
-            
+            # Append to the end of the playlist
+            cursor.execute(append_position_sql(), [playlist_id, track_id, playlist_id])
+
+        bump_playlist_version(playlist_id)
         return JsonResponse({'success': True})
         
     except Exception as e:
@@ -685,7 +655,7 @@ def respond_friend_request(request):
         action = data.get('action')  # 'accept' or 'reject'
         if not user_id or not request_id or action not in ['accept', 'reject']:
             return JsonResponse({'success': False, 'error': 'Invalid data'}, status=400)
-        with connection.cursor() as cursor:
+        with transaction.atomic(), connection.cursor() as cursor:
             # Check the friend request exists and is for this user
             cursor.execute(
                 "SELECT sender_id FROM friend_requests WHERE id=%s AND recipient_id=%s",
@@ -696,18 +666,25 @@ def respond_friend_request(request):
                 return JsonResponse({'success': False, 'error': 'Request not found'}, status=404)
             sender_id = row[0]
             if action == 'accept':
-                # Add to friendships table (if not already friends)
+                # Checked against the table, not the cached graph: a stale graph would insert a second row.
+                # An existing row (e.g. a pending one) becomes the accepted friendship.
                 cursor.execute("""
-                    SELECT COUNT(*) FROM friendships
+                    UPDATE friendships SET status = 'accepted'
                     WHERE (user1_id=%s AND user2_id=%s) OR (user1_id=%s AND user2_id=%s)
                 """, [user_id, sender_id, sender_id, user_id])
-                if cursor.fetchone()[0] == 0:
+                if cursor.rowcount == 0:
                     cursor.execute(
                         "INSERT INTO friendships (user1_id, user2_id, status) VALUES (%s, %s, 'accepted')",
                         [user_id, sender_id]
                     )
+                # Both friend_edges rows, whichever branch ran (duplicate-safe)
+                add_friend_edges(cursor, user_id, sender_id)
             # Remove the friend request
             cursor.execute("DELETE FROM friend_requests WHERE id=%s", [request_id])
+        invalidate_social_graph(user_id, sender_id)
+        publish_to_users([user_id], 'friend_request')
+        if action == 'accept':
+            publish_to_users([user_id, sender_id], 'friendship')
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -744,33 +721,30 @@ def get_friends_list(request):
 
         friends = []
         with connection.cursor() as cursor:
+            # One range scan on friend_edges (user_id, status)
             cursor.execute("""
                 SELECT 
-                    CASE
-                        WHEN f.user1_id = %s THEN f.user2_id
-                        ELSE f.user1_id
-                    END AS friend_id,
+                    e.friend_id,
                     u.username,
                     u.userid,
                     u.icon_url,
                     u.listeningto,
                     u.last_login as last_seen
-                FROM friendships f
-                JOIN auth_user u ON u.id = CASE 
-                    WHEN f.user1_id = %s THEN f.user2_id 
-                    ELSE f.user1_id 
-                END
-                WHERE (f.user1_id = %s OR f.user2_id = %s) 
-                AND f.status = 'accepted'
-            """, [user_id, user_id, user_id, user_id])
+                FROM friend_edges e
+                JOIN auth_user u ON u.id = e.friend_id
+                WHERE e.user_id = %s AND e.status = 'accepted'
+            """, [user_id])
             
-            for row in cursor.fetchall():
+            rows = cursor.fetchall()
+            # Presence store first, the (batch-flushed) column for users it doesn't know
+            listening = presence_store.get_listening([row[0] for row in rows])
+            for row in rows:
                 friends.append({
                     'friend_id': row[0],
                     'username': row[1],
                     'userid': row[2],
                     'icon_url': row[3] or '/static/home/assets/logo.png',
-                    'listeningto': row[4] or None,
+                    'listeningto': listening.get(row[0], row[4]) or None,
                     'last_seen': row[5].isoformat() if row[5] else None
                 })
         return JsonResponse({'friends': friends})
@@ -793,18 +767,15 @@ def block_user(request):
         if not target_userid:
             return JsonResponse({'success': False, 'error': 'Target UserID required'}, status=400)
 
-        with connection.cursor() as cursor:
-            # Get target user's ID
-            cursor.execute("SELECT id FROM auth_user WHERE userid=%s", [target_userid])
-            target_user_row = cursor.fetchone()
-            if not target_user_row:
-                return JsonResponse({'success': False, 'error': 'Target user not found'}, status=404)
-            target_user_id = target_user_row[0]
+        target_user_id = resolve_userid(target_userid)
+        if not target_user_id:
+            return JsonResponse({'success': False, 'error': 'Target user not found'}, status=404)
 
-            if str(user_id) == str(target_user_id):
-                 return JsonResponse({'success': False, 'error': 'Cannot block yourself'}, status=400)
+        if str(user_id) == str(target_user_id):
+             return JsonResponse({'success': False, 'error': 'Cannot block yourself'}, status=400)
 
-            # Check if already blocked
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Writes are checked against the tables, not the cached graph (it may be stale)
             cursor.execute("SELECT COUNT(*) FROM blocked_users WHERE blocker_id=%s AND blocked_id=%s", [user_id, target_user_id])
             if cursor.fetchone()[0] > 0:
                 return JsonResponse({'success': False, 'error': 'User already blocked'}, status=400)
@@ -814,6 +785,7 @@ def block_user(request):
                 DELETE FROM friendships
                 WHERE (user1_id = %s AND user2_id = %s) OR (user1_id = %s AND user2_id = %s)
             """, [user_id, target_user_id, target_user_id, user_id])
+            remove_friend_edges(cursor, user_id, target_user_id)
 
             # Remove any pending friend requests between the users (both directions)
             cursor.execute("""
@@ -828,6 +800,9 @@ def block_user(request):
                 [user_id, target_user_id, reason]
             )
 
+        invalidate_social_graph(user_id, target_user_id)
+        publish_to_users([user_id, target_user_id], 'friendship')
+        publish_to_users([user_id, target_user_id], 'friend_request')
         return JsonResponse({'success': True, 'message': 'User blocked successfully'})
 
     except Exception as e:
@@ -848,21 +823,19 @@ def unblock_user(request):
         if not target_userid:
             return JsonResponse({'success': False, 'error': 'Target UserID required'}, status=400)
 
-        with connection.cursor() as cursor:
-            # Get target user's ID
-            cursor.execute("SELECT id FROM auth_user WHERE userid=%s", [target_userid])
-            target_user_row = cursor.fetchone()
-            if not target_user_row:
-                # Still return success even if target doesn't exist, as the goal is achieved (they aren't blocked)
-                return JsonResponse({'success': True, 'message': 'User unblocked (or was not found)'})
-            target_user_id = target_user_row[0]
+        target_user_id = resolve_userid(target_userid)
+        if not target_user_id:
+            # Still return success even if target doesn't exist, as the goal is achieved (they aren't blocked)
+            return JsonResponse({'success': True, 'message': 'User unblocked (or was not found)'})
 
-            # Delete the block record
+        # Delete the block record
+        with connection.cursor() as cursor:
             cursor.execute(
                 "DELETE FROM blocked_users WHERE blocker_id=%s AND blocked_id=%s",
                 [user_id, target_user_id]
             )
             deleted_count = cursor.rowcount
+        invalidate_social_graph(user_id, target_user_id)
 
         if deleted_count > 0:
             return JsonResponse({'success': True, 'message': 'User unblocked successfully'})
@@ -913,6 +886,9 @@ def remove_track_from_playlist(request):
         if not playlist_id or not track_id:
             return JsonResponse({'success': False, 'error': 'Invalid playlist or track ID'}, status=400)
 
+        if not user_owns_playlist(request, playlist_id):
+            return JsonResponse({'success': False, 'error': 'Playlist not found or access denied'}, status=403)
+
         # Remove track from playlist
         with connection.cursor() as cursor:
             cursor.execute(
@@ -920,10 +896,94 @@ def remove_track_from_playlist(request):
                 [playlist_id, track_id]
             )
 
+        bump_playlist_version(playlist_id)
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+@require_POST
+def duplicate_playlist_view(request):
+    """
+    Copy a playlist (tracks and order included) into the current user's library:
+    {"playlist_id": 1, "name": "optional new name"}. The track links are copied with one statement.
+    """
+    try:
+        user_id = request.session.get('_auth_user_id')
+        if not user_id:
+            return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+        data = json.loads(request.body)
+        playlist_id = data.get('playlist_id')
+        if not playlist_id:
+            return JsonResponse({'success': False, 'error': 'Playlist ID required'}, status=400)
+
+        playlist, track_count = duplicate_playlist(playlist_id, user_id, (data.get('name') or '').strip() or None)
+        if playlist is None:
+            return JsonResponse({'success': False, 'error': 'Playlist not found'}, status=404)
+
+        invalidate_user_context(user_id)
+        return JsonResponse({
+            'success': True,
+            'playlist_id': playlist.playlist_id,
+            'name': playlist.name,
+            'cover_image_url': playlist.cover_image_url,
+            'track_count': track_count,
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@require_POST
+def move_playlist_track(request):
+    """
+    Move a track within a playlist: {"playlist_id": 1, "track_id": 5, "after_track_id": 3}
+    (after_track_id null moves it to the top). Updates a single row whatever the playlist size.
+    """
+    try:
+        data = json.loads(request.body)
+        playlist_id = data.get('playlist_id')
+        track_id = data.get('track_id')
+        after_track_id = data.get('after_track_id')
+
+        if not playlist_id or not track_id:
+            return JsonResponse({'success': False, 'error': 'Invalid playlist or track ID'}, status=400)
+
+        if not user_owns_playlist(request, playlist_id):
+            return JsonResponse({'success': False, 'error': 'Playlist not found or access denied'}, status=403)
+
+        if not move_track(playlist_id, track_id, after_track_id):
+            return JsonResponse({'success': False, 'error': 'Track not in playlist'}, status=404)
+
+        version = bump_playlist_version(playlist_id)
+        return JsonResponse({'success': True, 'version': version})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@require_POST
+def bulk_update_playlist_tracks(request):
+    """
+    Apply many track additions and removals to one playlist in a single transaction.
+    Body: {"playlist_id": 1, "operations": [{"op": "add", "track_id": 5}, {"op": "remove", "track_id": 3}, ...]}
+    Returns the counts and the new playlist version (the value its ETag is built from).
+    """
+    try:
+        data = json.loads(request.body)
+        playlist_id = data.get('playlist_id')
+        if not playlist_id:
+            return JsonResponse({'success': False, 'error': 'Missing playlist_id'}, status=400)
+
+        # One ownership check for the whole batch
+        if not user_owns_playlist(request, playlist_id):
+            return JsonResponse({'success': False, 'error': 'Playlist not found or access denied'}, status=403)
+
+        try:
+            added, removed = apply_playlist_operations(int(playlist_id), data.get('operations'))
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+        version = bump_playlist_version(playlist_id)
+        return JsonResponse({'success': True, 'added': added, 'removed': removed, 'version': version})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
 @csrf_exempt
 def get_user_details(request):
     userid = request.GET.get('userid', '').strip()
@@ -945,15 +1005,38 @@ def send_friend_request(request):
         recipient_userid = data.get('userid', '').strip()
         if not sender_id or not recipient_userid:
             return JsonResponse({'success': False, 'error': 'Invalid request.'})
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT id FROM auth_user WHERE userid=%s", [recipient_userid])
-            recipient_id = cursor.fetchone()
-            if not recipient_id:
-                return JsonResponse({'success': False, 'error': 'Recipient not found.'})
+        recipient_id = resolve_userid(recipient_userid)
+        if not recipient_id:
+            return JsonResponse({'success': False, 'error': 'Recipient not found.'})
+        if str(recipient_id) == str(sender_id):
+            return JsonResponse({'success': False, 'error': 'Cannot send friend request to yourself.'})
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Writes are checked against the tables, not the cached graph (it may be stale); both directions
+            pair = [sender_id, recipient_id, recipient_id, sender_id]
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM blocked_users
+                     WHERE (blocker_id = %s AND blocked_id = %s) OR (blocker_id = %s AND blocked_id = %s)),
+                    (SELECT COUNT(*) FROM friendships
+                     WHERE status = 'accepted' AND ((user1_id = %s AND user2_id = %s) OR (user1_id = %s AND user2_id = %s))),
+                    (SELECT COUNT(*) FROM friend_requests
+                     WHERE (sender_id = %s AND recipient_id = %s) OR (sender_id = %s AND recipient_id = %s))
+            """, pair * 3)
+            blocked, friends, pending = cursor.fetchone()
+            if blocked:
+                return JsonResponse({'success': False, 'error': 'Cannot send friend request to this user.'})
+            if friends:
+                return JsonResponse({'success': False, 'error': 'Already friends with this user.'})
+            if pending:
+                return JsonResponse({'success': False, 'error': 'Friend request already pending.'})
+
             cursor.execute(
                 "INSERT INTO friend_requests (sender_id, recipient_id) VALUES (%s, %s)",
-                [sender_id, recipient_id[0]]
+                [sender_id, recipient_id]
             )
+        invalidate_social_graph(sender_id, recipient_id)
+        publish_to_users([recipient_id], 'friend_request')
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
@@ -985,27 +1068,37 @@ def accept_friend_request(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 @csrf_exempt
-def get_notifications(request):
-    user_id = request.session.get('_auth_user_id')
-    if not user_id:
+async def get_notifications(request):
+    """
+    Friend-request notifications with a cursor. ?since=<cursor> returns only newer ones and, with
+    &wait=<seconds>, holds the request until one arrives (long-poll, at most NOTIFICATION_MAX_WAIT).
+    While waiting only the indexed MAX(id) is read; the joined query runs once there is something new.
+    Long-polling is ASGI-only: under WSGI wait is ignored and the answer is immediate.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
         return JsonResponse({'success': False, 'error': 'Not authenticated.'})
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT id, sender_id FROM friend_requests WHERE recipient_id=%s",
-            [user_id]
-        )
-        requests = cursor.fetchall()
-        notifications = []
-        for req in requests:
-            cursor.execute("SELECT username FROM auth_user WHERE id=%s", [req[1]])
-            sender_username = cursor.fetchone()
-            if sender_username:
-                notifications.append({
-                    'type': 'request',
-                    'request_id': req[0],
-                    'message': f"{sender_username[0]} sent you a friend request."
-                })
-    return JsonResponse({'success': True, 'notifications': notifications})
+    try:
+        since = int(request.GET.get('since', 0))
+        wait = float(request.GET.get('wait', 0))
+        if not math.isfinite(wait):
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid since or wait'}, status=400)
+    wait = min(max(wait, 0), NOTIFICATION_MAX_WAIT)
+    if not isinstance(request, ASGIRequest):
+        wait = 0 # A waiting request would hold a WSGI worker thread, as friend_events would
+
+    if since:
+        deadline = time.monotonic() + wait
+        while await sync_to_async(latest_notification_id)(user.pk) <= since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return JsonResponse({'success': True, 'notifications': [], 'cursor': since})
+            await asyncio.sleep(min(NOTIFICATION_POLL_INTERVAL, remaining))
+
+    notifications, cursor = await sync_to_async(fetch_notifications)(user.pk, since)
+    return JsonResponse({'success': True, 'notifications': notifications, 'cursor': cursor})
 
 @csrf_exempt
 def get_pending_requests(request):
@@ -1044,17 +1137,19 @@ def unfriend(request):
         target_userid = data.get('userid', '').strip()
         if not target_userid:
             return JsonResponse({'success': False, 'error': 'UserID required'}, status=400)
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT id FROM auth_user WHERE userid=%s", [target_userid])
-            row = cursor.fetchone()
-            if not row:
-                return JsonResponse({'success': False, 'error': 'User not found'}, status=404)
-            target_id = row[0]
+        target_id = resolve_userid(target_userid)
+        if not target_id:
+            return JsonResponse({'success': False, 'error': 'User not found'}, status=404)
+        # Unconditional (deleting nothing is fine): the cached graph may be stale
+        with transaction.atomic(), connection.cursor() as cursor:
             # Remove friendship in either direction
             cursor.execute("""
                 DELETE FROM friendships
                 WHERE ((user1_id = %s AND user2_id = %s) OR (user1_id = %s AND user2_id = %s))
             """, [user_id, target_id, target_id, user_id])
+            remove_friend_edges(cursor, user_id, target_id)
+        invalidate_social_graph(user_id, target_id)
+        publish_to_users([user_id, target_id], 'friendship')
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1062,68 +1157,59 @@ def unfriend(request):
 from django.http import JsonResponse
 from .models import Album, Track
 
+API_SEARCH_ALBUM_LIMIT = 12
+API_SEARCH_TRACK_LIMIT = 30
+API_SEARCH_ARTIST_LIMIT = 6
+
 def api_search(request):
     q = request.GET.get('q', '').strip()
     if not q:
-        return JsonResponse({'success': True, 'albums': [], 'tracks': []})
-
-    albums = list(Album.objects.filter(title__icontains=q).values('album_id', 'title', 'cover_image_url'))
-    tracks = list(Track.objects.filter(title__icontains=q).values(
-        'track_id', 'title', 'file_url', 'track_image_url', 'artist_name'
-     ))
-    
-    # Map "track_image_url" to "image_url_or_default" for consistency in frontend display.
-    for track in tracks:
-        track['image_url_or_default'] = track.pop('track_image_url', '')
+        return JsonResponse({'success': True, 'albums': [], 'tracks': [], 'artists': []})
+
+    # Ranked top results from the in-memory search index
+    albums = [dict(album) for album in search_index.search_albums(q, limit=API_SEARCH_ALBUM_LIMIT)]
+    tracks = [
+        {
+            'track_id': track['id'],
+            'title': track['title'],
+            'file_url': track['file_url'],
+            # "image_url_or_default" for consistency in frontend display.
+            'image_url_or_default': track['track_img_url'],
+            'artist_name': track['artist_name'],
+        } for track in search_index.search_tracks(q, limit=API_SEARCH_TRACK_LIMIT)
+    ]
+    artists = search_index.search_artists(q, limit=API_SEARCH_ARTIST_LIMIT)
 
     for album in albums:
-        first_track = Track.objects.filter(album_id=album['album_id']).first()
+        first_track = search_index.first_track(album['album_id'])
         album['first_track'] = {
-            'file_url': first_track.file_url if first_track else '',
-            'title': first_track.title if first_track else '',
-            'artist_name': first_track.artist_name if first_track else '',
+            'file_url': first_track['file_url'],
+            'title': first_track['title'],
+            'artist_name': first_track['artist_name'],
         } if first_track else None
 
-    return JsonResponse({'success': True, 'albums': albums, 'tracks': tracks})
+    return JsonResponse({'success': True, 'albums': albums, 'tracks': tracks, 'artists': artists})
 # View for rendering the artists page template
 def artists_page(request):
     # Similar context setup as music_home might be needed if the template
     # relies on shared context variables (like user auth state, playlists etc.)
     # For simplicity, starting with minimal context. Add more as needed.
-    user_id = request.session.get('_auth_user_id')
-    is_authenticated = bool(user_id)
-    is_superuser = False
-    username = None
-    listeningto = None
-    userid = None
-    user_icon_url = None
-    user_playlists = []
-    has_playlists = False
-    if is_authenticated:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT is_superuser, username, listeningto, userid, icon_url FROM auth_user WHERE id=%s", [user_id])
-            row = cursor.fetchone()
-            if row:
-                is_superuser, username, listeningto, userid, user_icon_url = bool(row[0]), row[1], row[2], row[3], row[4]
-        # Fetch playlists for this user (copied from music_home)
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT playlist_id, name, cover_image_url FROM playlists WHERE owner_user_id=%s", [user_id])
-            user_playlists = cursor.fetchall()
-            has_playlists = len(user_playlists) > 0
+    user_context = request.user_context # Same cached context as music_home
 
     context = {
-        'user': username,
-        'user_id': userid,
-        'listeningto': listeningto,
-        'is_authenticated': is_authenticated,
-        'is_superuser': is_superuser,
-        'user_icon_url': user_icon_url,
-        'has_playlists': has_playlists,
-        'user_playlists': user_playlists,
+        'user': user_context['username'],
+        'user_id': user_context['userid'],
+        'listeningto': current_listening_to(request, user_context),
+        'is_authenticated': user_context['is_authenticated'],
+        'is_superuser': user_context['is_superuser'],
+        'user_icon_url': user_context['icon_url'],
+        'has_playlists': bool(user_context['playlists']),
+        'user_playlists': user_context['playlists'],
     }
     return render(request, 'artists.html', context)
 
 # API view to return artist data as JSON
+@etag_versioned(catalog_etag)
 def artists_api(request):
     try:
         # Fetch all artists using the ORM
@@ -1133,6 +1219,49 @@ def artists_api(request):
         print(f"Error fetching artists API: {e}") # Basic logging
         return JsonResponse({'error': 'Could not fetch artists'}, status=500)
 
+# Seconds between keep-alive comments on an idle event stream (below common proxy timeouts)
+EVENT_STREAM_HEARTBEAT = 25
+
+async def friend_events(request):
+    """
+    Server-Sent Events stream of friend requests, friendship changes and friends' listening status.
+    Only served under ASGI; an idle stream sends keep-alives and runs no queries.
+    """
+    if not isinstance(request, ASGIRequest):
+        # WSGI would hold a worker for the whole stream: 204 makes EventSource stop and friends.js poll
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+
+    friend_ids = await sync_to_async(load_friend_ids)(user.pk)
+    subscription = event_bus.subscribe(stream_topics(user.pk, friend_ids))
+
+    async def stream():
+        nonlocal friend_ids
+        try:
+            yield "retry: 5000\n\n" + format_event('ready', {})
+            while True:
+                message = await subscription.get(EVENT_STREAM_HEARTBEAT)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event, data = message
+                if event == 'friendship':
+                    # Follow the listening status of the new friend list
+                    friend_ids = await sync_to_async(load_friend_ids)(user.pk)
+                    subscription.set_topics(stream_topics(user.pk, friend_ids))
+                elif event == 'listening' and data['user_id'] not in friend_ids:
+                    continue # Queued before an unfriend was processed
+                yield format_event(event, data)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # No proxy buffering (nginx)
+    return response
+
 @login_required
 def get_active_friends(request):
     try:
@@ -1144,20 +1273,21 @@ def get_active_friends(request):
             # Get active friends (accepted friendships) with their current status
             cursor.execute("""
                 SELECT u.id, u.username, u.icon_url, u.listeningto
-                FROM auth_user u
-                INNER JOIN friendships f ON (f.user1_id = u.id OR f.user2_id = u.id)
-                WHERE f.status = 'accepted'
-                AND (f.user1_id = %s OR f.user2_id = %s)
-                AND u.id != %s
-            """, [user_id, user_id, user_id])
+                FROM friend_edges e
+                INNER JOIN auth_user u ON u.id = e.friend_id
+                WHERE e.user_id = %s AND e.status = 'accepted'
+            """, [user_id])
             
+            rows = cursor.fetchall()
+            # Presence store first, the (batch-flushed) column for users it doesn't know
+            listening = presence_store.get_listening([row[0] for row in rows])
             friends = []
-            for row in cursor.fetchall():
+            for row in rows:
                 friends.append({
                     'id': row[0],
                     'username': row[1],
                     'icon_url': row[2] or '/static/home/assets/logo.png',
-                    'listeningto': row[3] or 'Nothing'
+                    'listeningto': listening.get(row[0], row[3]) or 'Nothing'
                 })
 
         return JsonResponse({
@@ -1168,10 +1298,24 @@ def get_active_friends(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+def metrics(request):
+    """Prometheus scrape endpoint for every worker process; needs 'Authorization: Bearer <METRICS_TOKEN>' when that is set."""
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=403)
+    return HttpResponse(render_prometheus(*merged_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def db_pool_stats(request):
+    """Connection reuse counters of this worker process, for monitoring (admins only)."""
+    if not request.user_context['is_superuser']:
+        return JsonResponse({'success': False, 'error': 'Not authorized'}, status=403)
+    return JsonResponse({'success': True, **connection_stats.snapshot()})
+
 @login_required
+@replica_reads(catalog_version)
+@etag_versioned(catalog_etag)
 def get_all_artists(request):
     try:
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute("""
                 SELECT artist_id, name, bio, artist_image_url
                 FROM artists
@@ -1208,27 +1352,21 @@ def delete_playlist(request):
         if not playlist_id:
             return JsonResponse({'success': False, 'error': 'Missing playlist ID'}, status=400)
 
-        # Delete playlist if user owns it
+        # Delete playlist if user owns it (ownership comes from the cached user context)
+        if not user_owns_playlist(request, playlist_id):
+            return JsonResponse({'success': False, 'error': 'Playlist not found or not authorized'}, status=403)
+
         with connection.cursor() as cursor:
-            # First check ownership
-            cursor.execute(
-                "SELECT owner_user_id FROM playlists WHERE playlist_id = %s",
-                [playlist_id]
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                return JsonResponse({'success': False, 'error': 'Playlist not found'}, status=404)
-            
-            if str(result[0]) != str(user_id):
-                return JsonResponse({'success': False, 'error': 'Not authorized to delete this playlist'}, status=403)
-            
-            # Delete the playlist
+            # owner_user_id stays in the WHERE clause in case the cached context is stale
             cursor.execute(
                 "DELETE FROM playlists WHERE playlist_id = %s AND owner_user_id = %s",
                 [playlist_id, user_id]
             )
+            if cursor.rowcount == 0:
+                return JsonResponse({'success': False, 'error': 'Playlist not found'}, status=404)
 
+        invalidate_user_context(user_id)
+        bump_playlist_version(playlist_id)
         return JsonResponse({'success': True})
 
     except json.JSONDecodeError:
@@ -1237,52 +1375,16 @@ def delete_playlist(request):
         print("Error deleting playlist:", str(e))
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+@replica_reads(catalog_version)
+@etag_versioned(catalog_etag)
 def artist_detail_api(request, artist_id):
     try:
-        with connection.cursor() as cursor:
-            # Get artist details
-            cursor.execute("""
-                SELECT name, bio, artist_image_url, artist_image_url2 
-                FROM artists 
-                WHERE artist_id = %s
-            """, [artist_id])
-            artist_row = cursor.fetchone()
-            
-            if not artist_row:
-                return JsonResponse({'success': False, 'error': 'Artist not found'}, status=404)
-            
-            # Get artist's tracks
-            cursor.execute("""
-                SELECT t.track_id, t.title, t.file_url, t.track_img_url, t.artist_name 
-                FROM tracks t 
-                WHERE t.artist_name = %s
-                OR t.artist_name2 = %s 
-                OR t.artist_name3 = %s
-            """, [artist_row[0], artist_row[0], artist_row[0]])
-            
-            tracks = []
-            for track in cursor.fetchall():
-                tracks.append({
-                    'id': track[0],
-                    'title': track[1],
-                    'file_url': track[2],
-                    'image_url': track[3] or '/static/home/assets/default-track.jpg',
-                    'artist_name': track[4]
-                })
-            
-            artist_data = {
-                'success': True,
-                'artist': {
-                    'name': artist_row[0],
-                    'bio': artist_row[1],
-                    'artist_image_url': artist_row[2],
-                    'artist_image_url2': artist_row[3]
-                },
-                'tracks': tracks
-            }
-            
-            return JsonResponse(artist_data)
-            
+        # Materialized per-artist payload, rebuilt only after a dashboard write touching this artist
+        artist_page = get_artist_page(artist_id)
+        if artist_page is None:
+            return JsonResponse({'success': False, 'error': 'Artist not found'}, status=404)
+        return JsonResponse({'success': True, **artist_page})
+
     except Exception as e:
         print('Error fetching artist details:', e)
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1303,11 +1405,8 @@ def update_listening_to(request):
         data = json.loads(request.body)
         listeningto = data.get('listeningto') # Changed from track_title
         
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "UPDATE auth_user SET listeningto = %s WHERE id = %s",
-                [listeningto, user_id]
-            )
+        # Written to auth_user in the next batched flush
+        presence_store.set_listening(user_id, listeningto)
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1332,49 +1431,109 @@ def update_listening_status(request):
     try:
         data = json.loads(request.body)
         track_title = data.get('track_title', '')
-        status = data.get('listeningto_status', False)
 
-        # Update both fields
-        request.user.listeningto = track_title
-        request.user.listeningto_status = status
-        request.user.save()
+        # Only the title is stored (the status switch lives in the browser); written to
+        # auth_user in the next batched flush
+        presence_store.set_listening(request.user.pk, track_title)
 
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+def allow_downloader_origin(view_func):
+    """CORS headers for the React downloader app, on every response including 304s."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        response["Access-Control-Allow-Origin"] = "http://localhost:3000"
+        response["Access-Control-Allow-Methods"] = "GET, OPTIONS"
+        response["Access-Control-Allow-Headers"] = "Content-Type"
+        return response
+    return wrapper
+
+# Keyset pages of the tracks API; the NDJSON stream reads the table in chunks of the same size
+TRACKS_PAGE_SIZE = 500
+TRACKS_MAX_PAGE_SIZE = 1000
+
+TRACKS_API_COLUMNS = "track_id, title, artist_name, artist_name2, file_url, track_img_url"
+
+def track_api_data(track):
+    return {
+        'id': track[0],
+        'title': track[1],
+        'artist_name': track[2],
+        'artist_name2': track[3],
+        'file_url': track[4],
+        'image_url': track[5] or '/static/home/assets/default-track.jpg',
+        'genre': 'music'
+    }
+
+def fetch_tracks_page(cursor, after_id, limit):
+    """Tracks with track_id > after_id in id order, at most limit rows."""
+    cursor.execute(
+        f"SELECT {TRACKS_API_COLUMNS} FROM tracks WHERE track_id > %s ORDER BY track_id LIMIT %s",
+        [after_id, limit]
+    )
+    return cursor.fetchall()
+
+def stream_tracks_ndjson(after_id, using):
+    """One JSON object per line, read a chunk at a time so memory stays flat whatever the catalog size."""
+    try:
+        # using is picked by the view: the generator runs after the view (and its routing) has returned
+        with connections[using].cursor() as cursor:
+            while True:
+                rows = fetch_tracks_page(cursor, after_id, TRACKS_PAGE_SIZE)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(track_api_data(row)) + '\n' for row in rows)
+                after_id = rows[-1][0]
+    except Exception:
+        # Headers are already sent, so report the failure as a last line (details stay in the log)
+        logger.exception("get_tracks stream failed after track %s", after_id)
+        yield json.dumps({'success': False, 'error': 'Stream interrupted, resume with after_id'}) + '\n'
+
+@allow_downloader_origin
+@replica_reads(catalog_version)
+@etag_versioned(catalog_etag)
 def get_tracks(request):
-    """API endpoint to fetch all tracks"""
+    """
+    API endpoint to fetch tracks.
+      /api/tracks/                          every track in one JSON document
+      /api/tracks/?after_id=<id>&limit=<n>  one keyset page, with next_after_id for the next one
+      /api/tracks/?format=ndjson            every track as newline-delimited JSON, streamed
+                                            (after_id resumes an interrupted stream)
+    """
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT track_id, title, artist_name, artist_name2, file_url, track_img_url 
-                FROM tracks
-            """)
-            tracks = cursor.fetchall()
-            
-            tracks_data = [{
-                'id': track[0],
-                'title': track[1],
-                'artist_name': track[2],
-                'artist_name2': track[3],
-                'file_url': track[4],
-                'image_url': track[5] or '/static/home/assets/default-track.jpg',
-                'genre': 'music'
-            } for track in tracks]
-            
-            response = JsonResponse({
+        after_id = int(request.GET.get('after_id') or 0)
+        limit = request.GET.get('limit')
+        limit = min(int(limit), TRACKS_MAX_PAGE_SIZE) if limit else None
+        if limit is not None and limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid after_id or limit'}, status=400)
+
+    if request.GET.get('format') == 'ndjson':
+        return StreamingHttpResponse(stream_tracks_ndjson(after_id, read_alias()), content_type='application/x-ndjson')
+
+    try:
+        with read_connection().cursor() as cursor:
+            if limit is None and 'after_id' not in request.GET:
+                cursor.execute(f"SELECT {TRACKS_API_COLUMNS} FROM tracks")
+                return JsonResponse({
+                    'success': True,
+                    'tracks': [track_api_data(track) for track in cursor.fetchall()]
+                })
+
+            limit = limit or TRACKS_PAGE_SIZE
+            # One extra row tells whether there is a next page without a COUNT(*)
+            tracks = fetch_tracks_page(cursor, after_id, limit + 1)
+            next_after_id = tracks[limit - 1][0] if len(tracks) > limit else None
+            return JsonResponse({
                 'success': True,
-                'tracks': tracks_data
+                'tracks': [track_api_data(track) for track in tracks[:limit]],
+                'next_after_id': next_after_id
             })
-            
-            # Add CORS headers
-            response["Access-Control-Allow-Origin"] = "http://localhost:3000"
-            response["Access-Control-Allow-Methods"] = "GET, OPTIONS"
-            response["Access-Control-Allow-Headers"] = "Content-Type"
-            
-            return response
-            
+
     except Exception as e:
         print(f"Error in get_tracks: {str(e)}")
         return JsonResponse({
@@ -1386,29 +1545,24 @@ def get_tracks(request):
 def check_friend_request_exists(request):
     try:
         user_id = request.session.get('_auth_user_id')
-        target_userid = request.GET.get('target_userid', '')
+        # friends.js sends the userid as recipient_id
+        target_userid = request.GET.get('target_userid') or request.GET.get('recipient_id', '')
         
         if not user_id or not target_userid:
             return JsonResponse({'exists': False})
             
-        with connection.cursor() as cursor:
-            # Get target user ID
-            cursor.execute("SELECT id FROM auth_user WHERE userid=%s", [target_userid])
-            target_row = cursor.fetchone()
-            if not target_row:
-                return JsonResponse({'exists': False})
-            target_id = target_row[0]
-            
-            # Check if a friend request already exists in either direction
-            cursor.execute("""
-                SELECT COUNT(*) FROM friendships
-                WHERE ((user1_id = %s AND user2_id = %s) OR (user1_id = %s AND user2_id = %s))
-                AND status = 'pending'
-            """, [user_id, target_id, target_id, user_id])
-            
-            exists = cursor.fetchone()[0] > 0
+        target_id = resolve_userid(target_userid)
+        if not target_id:
+            return JsonResponse({'exists': False})
             
-        return JsonResponse({'exists': exists})
+        graph = get_social_graph(user_id)
+        # The error codes friends.js checks before sending
+        if graph.is_blocked(target_id):
+            return JsonResponse({'exists': False, 'error': 'blocked'})
+        if graph.is_friend(target_id):
+            return JsonResponse({'exists': False, 'error': 'already_friends'})
+        # Check if a friend request already exists in either direction
+        return JsonResponse({'exists': graph.has_pending(target_id)})
     except Exception as e:
         print(f"Error checking friend request: {e}")
         return JsonResponse({'exists': False})
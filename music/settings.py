@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,11 +44,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'home.metrics.MetricsMiddleware',
+    'home.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'home.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'home.middleware.UserContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,6 +80,15 @@ WSGI_APPLICATION = 'music.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connection reuse. Every worker thread keeps its connection for DB_CONN_MAX_AGE seconds
+# ('none' = no limit, 0 = a new connection per request) and pings it before reusing it when
+# DB_CONN_HEALTH_CHECKS is on. The MySQL backend has no pool of its own, so a worker's pool is
+# one connection per thread: size it with the server's thread count (e.g. gunicorn --threads)
+# and keep workers * threads below max_connections. Stats: /api/db_pool_stats/
+DB_CONN_MAX_AGE = os.environ.get('DB_CONN_MAX_AGE', '60')
+DB_CONN_MAX_AGE = None if DB_CONN_MAX_AGE.lower() == 'none' else int(DB_CONN_MAX_AGE)
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', '1').lower() in ('1', 'true', 'yes')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
@@ -85,10 +100,85 @@ DATABASES = {
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4',
-        }
+        },
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+    }
+}
+
+# Optional read replica. Views decorated with home.db_router.replica_reads read from it; a browser
+# that just sent a write reads the primary for REPLICA_LAG seconds (set it above the replica's lag).
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+if DB_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST,
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['home.db_router.ReplicaRouter']
+REPLICA_LAG = int(os.environ.get('DB_REPLICA_LAG', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The home feed and other catalog caches live here. LocMemCache is per process, so with
+# several workers point this at a shared backend (Redis/Memcached) to make invalidation global.
+# The version stamps behind ETags and the search indexes (home/versions.py) need it too, so
+# `manage.py check --deploy` reports LocMemCache as an error; it only suits a single process.
+
+CACHES = {
+    'default': {
+        # LocMemCache counting hits and misses for /metrics (home.cache_backends.CacheStatsMixin
+        # adds the same counting to any other backend)
+        'BACKEND': 'home.cache_backends.StatsLocMemCache',
+        'LOCATION': 'freeflow',
     }
 }
+# Shared by every worker (needs the redis package), e.g. redis://localhost:6379/1
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES['default'] = {'BACKEND': 'home.cache_backends.StatsRedisCache', 'LOCATION': CACHE_REDIS_URL}
+
+# "Listening to" presence store (home/presence.py). 'memory' keeps it per process;
+# 'redis' shares it between processes and needs the redis package.
+PRESENCE_BACKEND = os.environ.get('PRESENCE_BACKEND', 'memory')
+PRESENCE_REDIS_URL = os.environ.get('PRESENCE_REDIS_URL', 'redis://localhost:6379/0')
+# Seconds between two batched writes of the store to auth_user.listeningto (by a thread in each process)
+PRESENCE_FLUSH_INTERVAL = int(os.environ.get('PRESENCE_FLUSH_INTERVAL', 30))
+
+
+# Per-request query count and timing (home/instrumentation.py); cheap enough to leave on
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', '1').lower() in ('1', 'true', 'yes')
+# Queries a view may run (session and auth lookups included) before a warning is logged,
+# by URL name; the hot endpoints get tight budgets so a regression shows up at once
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGETS = {
+    'home': 12, # Cold feed, recommendations and user context included
+    'album_detail_json': 4,
+    'album_shelf_json': 3,
+    'get_tracks': 3,
+    'typeahead_json': 4,
+    'search_tracks_json': 6, # First request of a process loads the search index
+    'api_search': 6,
+    'playlist_detail_json': 4,
+    'playlists_batch_json': 4,
+    'artist_detail_api': 5,
+    'get_friends_list': 4,
+    'get_active_friends': 4,
+    'get_pending_requests': 3,
+    'get_notifications': 4,
+}
+
+# Prometheus metrics (home/metrics.py, scraped at /metrics). Every worker process dumps its totals
+# to METRICS_DIR and the endpoint adds them up, so all workers of a server must share the directory
+# (clear it on deploy). With METRICS_TOKEN set, scrapes need 'Authorization: Bearer <token>'.
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'freeflow-metrics'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
+# Catalog files uploaded from the dashboard wait here while they are imported (home/catalog_ingest.py);
+# uploading the same file again resumes an interrupted import
+CATALOG_IMPORT_DIR = os.environ.get('CATALOG_IMPORT_DIR', os.path.join(tempfile.gettempdir(), 'freeflow-imports'))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators